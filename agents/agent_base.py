@@ -1,12 +1,14 @@
 """Содержит базовую реализацию агента с обработкой сообщений"""
+import time
 import traceback
-from typing import Dict, Callable, Any, List
+from typing import Dict, Callable, Any, List, Optional
 from abc import ABC
 import logging
 
 from thespian.actors import Actor, ActorAddress, ActorExitRequest
 
 from .messages import MessageType, Message
+from .tracing import tracer, TraceEvent
 
 
 class AgentBase(ABC, Actor):
@@ -18,9 +20,21 @@ class AgentBase(ABC, Actor):
         self.name = 'Базовый агент'
         super().__init__()
         self.handlers: Dict[MessageType, Callable[[Any, ActorAddress], None]] = {}
-        self.scene = None
-        self.dispatcher = None
+        # Сервис состояния сцены (StateService или его прокси в другом процессе)
+        self.state = None
         self.entity = None
+        # Целочисленный идентификатор сущности агента, им агент подписывает свои сообщения
+        self.entity_id = None
+        # Агент работает в отдельном процессе: при завершении он выгружает буфер трассировки процесса,
+        # иначе его события не попадут в журнал. При общей памяти буфер выгружает запускающий код
+        self.dump_trace_on_exit = False
+        # Замеры обработанных сообщений, которые передаются сервису состояния вместе с отметкой об обработке
+        self._message_samples = []
+        # Сообщения, отправленные при обработке текущего сообщения: они учитываются одним обращением
+        # к сервису состояния вместе с отметкой об обработке и уходят после нее
+        self._outbox = []
+        # Время сцены не меняется, пока агент обрабатывает сообщение, оно запрашивается один раз
+        self._time = None
         self.subscribe(MessageType.INIT_MESSAGE, self.handle_init_message)
 
     def subscribe(self, msg_type: MessageType, handler: Callable[[Any, ActorAddress], None]):
@@ -33,50 +47,125 @@ class AgentBase(ABC, Actor):
         Обработчик сообщения об удалении сущности.
         :return:
         """
-        logging.info(f'{self} получил сообщение - ActorExitRequest')
+        tracer.trace(TraceEvent.AGENT_EXIT_REQUESTED, self.name)
         self.entity.is_deleting = True
 
     def receiveMessage(self, msg, sender):
         """Обрабатывает сообщения - запускает их обработку в зависимости от типа.
+        Для каждого сообщения замеряются время обработчика и задержка от отправки до начала обработки.
         :param msg:
         :param sender:
         :return:
         """
         logging.debug('%s получил сообщение: %s', self.name, msg)
+        self._time = None
         if isinstance(msg, ActorExitRequest):
             self.handle_delete_message()
+            if self.dump_trace_on_exit:
+                tracer.dump_to_log()
+            self._finish_message()
             return
 
         if isinstance(msg, Message):
-
-            message_type = msg.msg_type
-            if message_type in self.handlers:
-                try:
-                    # logging.info(f'{self} получил сообщение {msg}')
-                    self.handlers[message_type](msg, sender)
-                except Exception as ex:
-                    traceback.print_exc()
-                    logging.error(ex)
-            else:
-                logging.warning('%s Отсутствует подписка на сообщение: %s', self.name, message_type)
+            self._handle_message(msg, sender, msg.sent_at)
+            # Сообщение считается обработанным только после завершения обработчика,
+            # иначе барьер может сработать до отправки порожденных им сообщений
+            self._finish_message()
         else:
             logging.error('%s Неверный формат сообщения: %s', self.name, msg)
             super().receiveMessage(msg, sender)
 
+    def _finish_message(self):
+        """
+        Отмечает сообщение обработанным вместе с отправленными при обработке сообщениями и замерами,
+        затем отправляет эти сообщения
+        :return:
+        """
+        outbox = self._outbox
+        samples = self._message_samples
+        self._outbox = []
+        self._message_samples = []
+        if self.state is not None:
+            self.state.message_handled(len(outbox), samples)
+        for target_address, msg in outbox:
+            if isinstance(msg, Message):
+                msg.sent_at = time.monotonic()
+            super().send(target_address, msg)
+
+    def _handle_message(self, msg: Message, sender, sent_at: Optional[float]):
+        """
+        Запускает обработчик сообщения и замеряет его
+        :param msg:
+        :param sender:
+        :param sent_at: момент отправки сообщения
+        :return:
+        """
+        message_type = msg.msg_type
+        if message_type in self.handlers:
+            start_time = time.perf_counter()
+            latency = None if sent_at is None else time.monotonic() - sent_at
+            try:
+                # logging.info(f'{self} получил сообщение {msg}')
+                self.handlers[message_type](msg, sender)
+            except Exception as ex:
+                traceback.print_exc()
+                logging.error(ex)
+            self._message_samples.append((type(self).__name__, message_type,
+                                          time.perf_counter() - start_time, latency))
+        else:
+            logging.warning('%s Отсутствует подписка на сообщение: %s', self.name, message_type)
+
     def __str__(self):
         return self.name
 
     def handle_init_message(self, message, sender):
         message_data = message.msg_body
-        self.scene = message_data.get('scene')
-        self.dispatcher = message_data.get('dispatcher')
-        self.entity = message_data.get('entity')
+        self.state = message_data.get('state').connect()
+        self.entity = self.state.get_entity(message_data.get('entity_uri'))
+        self.entity_id = message_data.get('entity_id')
+        self.dump_trace_on_exit = message_data.get('dump_trace_on_exit', False)
         self.name = self.name + ' ' + self.entity.name
-        logging.info(f'{self} проинициализирован')
+        tracer.trace(TraceEvent.AGENT_INITIALIZED, self.name)
+
+    def commit_entity(self):
+        """Фиксирует изменения сущности агента в сцене"""
+        self.state.commit_entity(self.entity)
+
+    def add_wakeup(self, time: float):
+        """
+        Просит разбудить агента сообщением TICK_MESSAGE на первом тике строго после момента time
+        :param time:
+        :return:
+        """
+        self.state.add_wakeup(time, self.entity.get_uri())
+
+    def add_immediate_wakeup(self):
+        """
+        Просит разбудить агента как можно раньше: на текущем тике, если агент его еще не получил
+        :return:
+        """
+        self.state.add_immediate_wakeup(self.entity.get_uri())
+
+    def get_time(self) -> float:
+        """
+        Возвращает время сцены, запрошенное один раз за обработку сообщения
+        :return:
+        """
+        if self._time is None:
+            self._time = self.state.get_time()
+        return self._time
 
     def send(self, targetAddr, msg):
-        self.scene.count_messages += 1
-        return super().send(targetAddr, msg)
+        """
+        Откладывает отправку сообщения до завершения обработки текущего сообщения
+        :param targetAddr:
+        :param msg:
+        :return:
+        """
+        if not isinstance(targetAddr, ActorAddress):
+            # Неудачная отправка не учитывается в статистике сообщений
+            raise ValueError(f'{targetAddr} is not a valid ActorAddress for sending messages to')
+        self._outbox.append((targetAddr, msg))
 
     @staticmethod
     def get_decreasing_kpi_value(value: float, min_value: float, max_value: float):
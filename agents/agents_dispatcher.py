@@ -1,15 +1,19 @@
 """Содержит класс диспетчера агентов"""
+import heapq
 import logging
+import time
 import typing
 import uuid
 
-from thespian.actors import ActorSystem, ActorExitRequest
+from thespian.actors import ActorExitRequest
 
 import agents.agent_base
 from agents.order_agent import OrderAgent
 from agents.courier_agent import CourierAgent
 from agents.messages import MessageType, Message
 from agents.reference_book import ReferenceBook
+from agents.runtime import AgentRuntime, create_runtime
+from agents.state_service import StateService, StateServer
 from entities.order_entity import OrderEntity
 from entities.base_entity import BaseEntity
 
@@ -19,29 +23,90 @@ TYPES_AGENTS = {
     'COURIER': CourierAgent,
 }
 
+# Период опроса системы акторов при ожидании затишья, с
+QUIESCENCE_POLL_INTERVAL = 0.01
+# Время без единого обработанного сообщения, после которого оставшиеся считаются потерянными, с
+QUIESCENCE_STALL_TIMEOUT = 1.0
+
 
 class AgentsDispatcher:
-    def __init__(self, scene):
-        self.actor_system = ActorSystem(logDefs=False)
+    def __init__(self, scene, runtime: typing.Union[str, AgentRuntime] = 'thespian', system_base: str = None):
+        """
+        :param scene:
+        :param runtime: среда исполнения агентов или ее имя ('thespian', 'local')
+        :param system_base: система акторов thespian, например 'multiprocQueueBase' или 'multiprocTCPBase'
+        """
+        if isinstance(runtime, str):
+            options = {} if system_base is None else {'system_base': system_base}
+            runtime = create_runtime(runtime, **options)
+        self.runtime = runtime
         self.reference_book = ReferenceBook()
         self.scene = scene
 
+        self.state_service = StateService(scene, self.reference_book)
+        self.state_server = None
+        if self.runtime.shares_memory:
+            self.state_handle = self.state_service
+        else:
+            # Агенты в других процессах обращаются к сцене через сервер состояния
+            self.state_server = StateServer(self.state_service)
+            self.state_handle = self.state_server.connection
+
     def add_entity(self, entity: BaseEntity):
         entity_type = entity.get_type()
         agent_type = TYPES_AGENTS.get(entity_type)
         if not agent_type:
             logging.warning(f'Для сущности типа {entity_type} не указан агент')
             return False
-        self.scene.entities[entity_type].append(entity)
+        self.scene.add_entity(entity)
+        self.scene.update_entity_position(entity)
         self.create_agent(agent_type, entity)
         return True
 
     def create_agent(self, agent_class, entity):
-        agent = self.actor_system.createActor(agent_class)
-        self.reference_book.add_agent(entity=entity, agent_address=agent)
-        init_data = {'dispatcher': self, 'scene': self.scene, 'entity': entity}
+        agent = self.runtime.create_agent(agent_class)
+        entity_id = self.reference_book.add_agent(entity=entity, agent_address=agent)
+        init_data = {'state': self.state_handle, 'entity_uri': entity.get_uri(), 'entity_id': entity_id,
+                     'dump_trace_on_exit': not self.runtime.shares_memory}
         init_message = Message(MessageType.INIT_MESSAGE, init_data)
-        self.actor_system.tell(agent, init_message)
+        self.tell(agent, init_message)
+
+    def tell(self, agent_address, message):
+        """
+        Отправляет сообщение агенту с учетом его в числе необработанных
+        :param agent_address:
+        :param message:
+        :return:
+        """
+        self.scene.message_sent()
+        if isinstance(message, Message):
+            message.sent_at = time.monotonic()
+        self.runtime.tell(agent_address, message)
+
+    def wait_quiescence(self):
+        """
+        Барьер: ждет, пока все отправленные сообщения не будут обработаны.
+        Сообщения, ушедшие удаленным агентам, никогда не будут получены - если система
+        перестала обрабатывать сообщения, они считаются потерянными.
+        :return:
+        """
+        if self.runtime.is_synchronous:
+            if self.scene.messages_in_flight:
+                logging.debug(f'Потеряно сообщений: {self.scene.messages_in_flight}')
+                self.scene.messages_in_flight = 0
+            return
+
+        last_received = self.scene.messages_received
+        last_progress_time = time.monotonic()
+        while self.scene.messages_in_flight > 0:
+            self.runtime.listen(QUIESCENCE_POLL_INTERVAL)
+            if self.scene.messages_received != last_received:
+                last_received = self.scene.messages_received
+                last_progress_time = time.monotonic()
+            elif time.monotonic() - last_progress_time > QUIESCENCE_STALL_TIMEOUT:
+                logging.warning(f'Система не обрабатывает сообщения, '
+                                f'потеряно: {self.scene.messages_in_flight}')
+                self.scene.messages_in_flight = 0
 
     def remove_entity(self, entity_type: str, entity_name: str) -> bool:
         """
@@ -50,35 +115,101 @@ class AgentsDispatcher:
         :param entity_name:
         :return:
         """
-        entities: typing.List[BaseEntity] = self.scene.get_entities_by_type(entity_type)
-        for entity in entities:
-            if entity.name == entity_name:
-                agent_address = self.reference_book.get_address(entity)
-                if not agent_address:
-                    logging.error(f'Агент сущности {entity} не найден')
-                    return False
-                self.actor_system.tell(agent_address, ActorExitRequest())
-                self.scene.entities[entity_type].remove(entity)
-                return True
-        return False
-
-    def remove_agent(self, agent_id=None) -> bool:
-        agent_address = self.reference_book.get_address(agent_id)
+        entity: BaseEntity = self.scene.get_entity_by_name(entity_type, entity_name)
+        if entity is None or entity.is_deleting:
+            return False
+        agent_address = self.reference_book.get_address(entity)
         if not agent_address:
+            logging.error(f'Агент сущности {entity} не найден')
+            return False
+        self.tell(agent_address, ActorExitRequest())
+        # Агент в другом процессе помечает удаление только в своей копии сущности
+        entity.is_deleting = True
+        self.scene.remove_entity(entity)
+        self.scene.remove_entity_position(entity)
+        self.reference_book.remove_agent(entity)
+        return True
+
+    def remove_agent(self, agent_id: int = None) -> bool:
+        """
+        Останавливает агента по идентификатору его сущности
+        :param agent_id:
+        :return:
+        """
+        entity = self.reference_book.get_entity_by_id(agent_id)
+        if entity is None:
             logging.error(f'Агент с идентификатором {agent_id} не найден')
             return False
-        self.actor_system.tell(agent_address, ActorExitRequest())
+        self.tell(self.reference_book.get_address_by_id(agent_id), ActorExitRequest())
+        self.reference_book.remove_agent(entity)
         return True
 
-    def get_agents_id(self) -> typing.List:
-        result = list(self.reference_book.agents_entities.keys())
-        return result
+    def get_agents_id(self) -> typing.List[int]:
+        return self.reference_book.get_ids()
 
     def get_agents_addresses(self) -> typing.List:
-        result = list(self.reference_book.agents_entities.values())
+        result = [agent_address for _, agent_address in self.reference_book.items()]
         return result
 
-    def tik_agents(self):
-        # TODO: возможно нужно добавить "рандомность" в последовательность
-        for agent_address in self.reference_book.agents_entities.values():
-            self.actor_system.tell(agent_address, Message(MessageType.TICK_MESSAGE, None))
+    def tik_agents(self, uris: typing.Iterable[str]):
+        """
+        Будит агентов, чьи таймеры сработали, в порядке их регистрации.
+        Агенты, попросившие тик как можно раньше, получают его в этом же обходе,
+        если обход до них еще не дошел, иначе - на следующем тике.
+        :param uris: идентификаторы сущностей агентов со сработавшими таймерами
+        :return:
+        """
+        # Очередь обхода: идентификаторы агентов, они же номера регистрации
+        queue = []
+        queued_ids = set()
+        last_id = -1
+        postponed = []
+        tick_message = Message(MessageType.TICK_MESSAGE, None)
+
+        def push(uri: str) -> bool:
+            agent_id = self._get_live_agent_id(uri)
+            if agent_id is None:
+                return True
+            if agent_id <= last_id:
+                # Обход уже прошел этого агента
+                return False
+            if agent_id in queued_ids:
+                return True
+            heapq.heappush(queue, agent_id)
+            queued_ids.add(agent_id)
+            return True
+
+        for uri in uris:
+            push(uri)
+        while True:
+            for uri in self.scene.pop_immediate_wakeups():
+                if not push(uri):
+                    postponed.append(uri)
+            if not queue:
+                break
+            last_id = heapq.heappop(queue)
+            self.tell(self.reference_book.get_address_by_id(last_id), tick_message)
+        for uri in postponed:
+            self.scene.add_immediate_wakeup(uri)
+
+    def _get_live_agent_id(self, uri: str) -> typing.Optional[int]:
+        """
+        Возвращает идентификатор агента сущности или None, если агент удален или удаляется
+        :param uri:
+        :return:
+        """
+        entity = self.scene.get_entity(uri)
+        if entity is None or entity.is_deleting:
+            # Агент уже остановлен, сообщение до него не дойдет
+            return None
+        return self.reference_book.get_id(entity)
+
+    def shutdown(self):
+        """
+        Останавливает среду исполнения агентов
+        :return:
+        """
+        self.state_service.stop()
+        self.runtime.shutdown()
+        if self.state_server is not None:
+            self.state_server.shutdown()
@@ -1,12 +1,12 @@
 """ Реализация класса агента курьера"""
-import copy
 import logging
 import typing
 from collections import defaultdict
 
 from point import Point
 from .agent_base import AgentBase
-from .messages import MessageType, Message
+from .messages import MessageType, Message, Variant, ShiftItem, PlanningResult
+from .tracing import tracer, TraceEvent
 from entities.courier_entity import CourierEntity, ScheduleItem
 from entities.order_entity import OrderEntity
 
@@ -22,22 +22,24 @@ class CourierAgent(AgentBase):
         self.subscribe(MessageType.PRICE_REQUEST, self.handle_price_request)
         self.subscribe(MessageType.PLANNING_REQUEST, self.handle_planning_request)
         self.subscribe(MessageType.TICK_MESSAGE, self.handle_tick_message)
+        # Заказы, известные курьеру, по целочисленным идентификаторам и обратно.
+        # Параметры заказа не меняются, поэтому сущность запрашивается у сцены один раз.
+        self.orders_by_id: typing.Dict[int, OrderEntity] = {}
+        self.order_ids: typing.Dict[OrderEntity, int] = {}
 
     def handle_init_message(self, message, sender):
         super().handle_init_message(message, sender)
-        all_orders = self.scene.get_entities_by_type('ORDER')
+        all_orders = self.state.get_entities_by_type('ORDER')
         matched_orders = [order for order in all_orders if order.order_type in self.entity.types]
         for order in matched_orders:
-            order_address = self.dispatcher.reference_book.get_address(order)
-            new_courier_message = Message(MessageType.NEW_COURIER, self.entity)
+            order_address = self.state.get_address(order.get_uri())
+            new_courier_message = Message(MessageType.NEW_COURIER, self.entity_id)
             self.send(order_address, new_courier_message)
 
     def handle_delete_message(self):
         super().handle_delete_message()
-        all_orders = self.scene.get_entities_by_type('ORDER')
-        for order in all_orders:
-            order_address = self.dispatcher.reference_book.get_address(order)
-            deleted_courier_message = Message(MessageType.DELETED_COURIER, self.entity)
+        for order_address in self.state.get_addresses_by_type('ORDER'):
+            deleted_courier_message = Message(MessageType.DELETED_COURIER, self.entity_id)
             self.send(order_address, deleted_courier_message)
 
     def handle_tick_message(self, message, sender):
@@ -58,12 +60,28 @@ class CourierAgent(AgentBase):
         :param sender:
         :return:
         """
-        order: OrderEntity = message.msg_body
-        params = self.__get_params(order)
+        order = self._get_order(message.msg_body)
+        params = self.__get_params(order) if order is not None else []
         price_message = Message(MessageType.PRICE_RESPONSE, params)
         self.send(sender, price_message)
 
-    def __get_params(self, order: OrderEntity) -> typing.List:
+    def _get_order(self, order_id: int) -> typing.Optional[OrderEntity]:
+        """
+        Возвращает сущность заказа по идентификатору
+        :param order_id:
+        :return:
+        """
+        order = self.orders_by_id.get(order_id)
+        if order is None:
+            order = self.state.get_entity_by_id(order_id)
+            if order is None:
+                logging.error(f'{self} - заказ {order_id} отсутствует в адресной книге')
+                return None
+            self.orders_by_id[order_id] = order
+            self.order_ids[order] = order_id
+        return order
+
+    def __get_params(self, order: OrderEntity) -> typing.List[Variant]:
         """
         Формирует возможные варианты размещения заказа
         :param order:
@@ -83,9 +101,7 @@ class CourierAgent(AgentBase):
         duration = time_to_order + time_with_order
 
         price = duration * self.entity.rate
-        logging.info(f'{self} - заказ {order} надо пронести {distance_with_order},'
-                     f' к нему идти {distance_to_order}'
-                     f'это займет {duration} и будет стоить {price}')
+        tracer.trace(TraceEvent.PRICE_CALCULATED, self.name, order.name, distance_with_order, distance_to_order, duration, price)
 
         all_variants = []
         # ======================================================================
@@ -96,7 +112,7 @@ class CourierAgent(AgentBase):
         ideal_jit_start = order.time_from - time_to_order
         
         # ПРОВЕРКА 1: Нельзя планировать в прошлом (относительно времени симуляции)
-        if ideal_jit_start >= self.scene.time:
+        if ideal_jit_start >= self.get_time():
             ideal_jit_end = ideal_jit_start + duration
             
             # Ищем конфликты именно в этом идеальном временном слоте
@@ -104,15 +120,13 @@ class CourierAgent(AgentBase):
 
             if not conflicted_records:
                 # Отлично, мы нашли чистое "окно" в расписании для JIT-вставки!
-                jit_variant = {
-                    'courier': self.entity, 'time_from': ideal_jit_start, 'time_to': ideal_jit_end,
-                    'price': price, 'order': order, 'variant_name': 'jit'
-                }
+                jit_variant = Variant(self.entity_id, self.order_ids[order], ideal_jit_start, ideal_jit_end,
+                                      price, 'jit')
                 all_variants.append(jit_variant)
             else:
                 # Конфликт существует. Теперь запускаем анализ вытеснения и сдвига
                 # для этого конкретного временного интервала.
-                logging.info(f"{self}: Обнаружен конфликт для JIT-варианта заказа {order}. Запускаю анализ...")
+                tracer.trace(TraceEvent.JIT_CONFLICT, self.name, order.name)
                 
                 # Попытка ВЫТЕСНЕНИЯ (Displacement)
                 displace_variant = self._try_create_displacement_variant(order, ideal_jit_start, ideal_jit_end, price)
@@ -124,7 +138,8 @@ class CourierAgent(AgentBase):
                 if reschedule_variant:
                     all_variants.append(reschedule_variant)
         else:
-            logging.info(f"{self}: Идеальный JIT-старт ({ideal_jit_start:.2f}) для заказа {order} находится в прошлом (тек. время {self.scene.time:.2f}).")
+            if tracer.is_enabled(TraceEvent.JIT_START_IN_PAST):
+                tracer.trace(TraceEvent.JIT_START_IN_PAST, self.name, order.name, ideal_jit_start, self.get_time())
 
 
         # ======================================================================
@@ -147,7 +162,7 @@ class CourierAgent(AgentBase):
 
         return all_variants
 
-    def _get_asap_variant(self, order: OrderEntity) -> typing.List[ScheduleItem]:
+    def _get_asap_variant(self, order: OrderEntity) -> typing.List[Variant]:
         """Возвращает вариант ASAP-выбора."""
         p1 = order.point_from
         # Надо посчитать стоимость выполнения заказа, сроки доставки
@@ -160,14 +175,11 @@ class CourierAgent(AgentBase):
         time_with_order = distance_with_order / self.entity.velocity
         duration = time_to_order + time_with_order
 
-        asap_start_time = max(self.entity.get_last_time(consider_charge=False), self.scene.time)
+        asap_start_time = max(self.entity.get_last_time(consider_charge=False), self.get_time())
         asap_end_time = asap_start_time + duration
 
         start_charge = self.entity.get_charge_at_time(asap_start_time)
 
-        last_point: Point = self.entity.get_last_point()
-        distance_to_order = last_point.get_distance_to_other(order.point_from)
-        distance_with_order = order.point_from.get_distance_to_other(order.point_to)
         distance_to_base = order.point_to.get_distance_to_other(self.entity.init_point)
 
         consumption_to_order = self.entity.get_consumption_by_distance(distance_to_order)
@@ -192,25 +204,14 @@ class CourierAgent(AgentBase):
             need_window = time_to_charge + duration_to_init + duration_to_next
             price += (duration_to_init+duration_to_next) * self.entity.rate
 
-            asap_start_time = max(self.entity.get_last_time(consider_charge=False), self.scene.time)
+            asap_start_time = max(self.entity.get_last_time(consider_charge=False), self.get_time())
             asap_end_time = asap_start_time + duration
 
             asap_start_time += need_window
             asap_end_time += need_window
 
 
-        return [{
-            'courier': self.entity, 'time_from': asap_start_time, 'time_to': asap_end_time,
-            'price': price, 'order': order, 'variant_name': 'asap', 
-            "changes": {
-                "add_to_shedule": {
-                    "order": order,
-                    "start_time": asap_start_time,
-                    "end_time": asap_end_time,
-                    "price": price
-                }
-            }
-        }]
+        return [Variant(self.entity_id, self.order_ids[order], asap_start_time, asap_end_time, price, 'asap')]
 
 
     def _try_create_displacement_variant(self, new_order, start_time, end_time, new_price):
@@ -222,7 +223,7 @@ class CourierAgent(AgentBase):
         displaceable_orders = []
         conflicted_orders = set(rec.order for rec in conflicted_records)
         for _order in conflicted_orders:
-            if self.entity.is_order_displaceable(_order, self.scene.time):
+            if self.entity.is_order_displaceable(_order, self.get_time()):
                 displaceable_orders.append(_order)
         
         # Ищем заказы, которые дешевле нового и могут быть вытеснены
@@ -232,15 +233,12 @@ class CourierAgent(AgentBase):
 
         # Выбираем самый дешевый для вытеснения
         order_to_displace = min(poss_removing_orders, key=lambda x: x.price)
-        logging.info(f"{self} нашел вариант вытеснить заказ {order_to_displace} для {new_order}")
+        tracer.trace(TraceEvent.DISPLACEMENT_FOUND, self.name, order_to_displace.name, new_order.name)
 
         # Для простоты, мы предполагаем, что размещение на месте вытесненного заказа возможно
         # и не создаст новых конфликтов. В реальной системе это потребовало бы доп. проверок.
-        return {
-            'courier': self.entity, 'time_from': start_time, 'time_to': end_time,
-            'price': new_price, 'order': new_order, 'variant_name': 'conflict',
-            'order_to_displace': order_to_displace
-        }
+        return Variant(self.entity_id, self.order_ids[new_order], start_time, end_time, new_price, 'conflict',
+                       displaced_order_id=self.order_ids[order_to_displace])
 
     def _try_create_reschedule_variant(self, new_order, start_time, end_time, new_price):
         """
@@ -248,6 +246,8 @@ class CourierAgent(AgentBase):
         Возвращает `reschedule_variant` или `None`.
         """
         shift_chain = []
+        # Заказы цепочки в порядке сдвига
+        shifted_orders = []
         is_shift_possible = True
         last_available_time = end_time  # Время, когда новый заказ будет завершен
 
@@ -260,7 +260,7 @@ class CourierAgent(AgentBase):
             for rec in temp_schedule:
                 if rec.start_time < last_available_time:
                     # Убедимся, что мы еще не обработали этот заказ в цепочке
-                    if rec.order not in [item['order'] for item in shift_chain]:
+                    if rec.order not in shifted_orders:
                         conflicting_order = rec.order
                         break
             
@@ -269,8 +269,8 @@ class CourierAgent(AgentBase):
                 break
 
             # Проверяем, можно ли вообще трогать этот заказ
-            if not self.entity.is_order_displaceable(conflicting_order, self.scene.time):
-                logging.info(f"{self}: Цепочка сдвига прервана. Заказ {conflicting_order} уже выполняется.")
+            if not self.entity.is_order_displaceable(conflicting_order, self.get_time()):
+                tracer.trace(TraceEvent.SHIFT_CHAIN_ORDER_STARTED, self.name, conflicting_order.name)
                 is_shift_possible = False
                 break
             
@@ -284,101 +284,105 @@ class CourierAgent(AgentBase):
 
             # Проверяем дедлайн
             if new_end_for_shifted > conflicting_order.time_to:
-                logging.info(f"{self}: Цепочка сдвига прервана. Заказ {conflicting_order} не уложится в дедлайн.")
+                tracer.trace(TraceEvent.SHIFT_CHAIN_DEADLINE_MISSED, self.name, conflicting_order.name)
                 is_shift_possible = False
                 break
             
             # Все проверки для этого шага пройдены. Добавляем в цепочку и обновляем время.
-            shift_chain.append({
-                'order': conflicting_order,
-                'new_start': new_start_for_shifted,
-                'new_end': new_end_for_shifted
-            })
+            shift_chain.append(ShiftItem(self.order_ids[conflicting_order], new_start_for_shifted, new_end_for_shifted))
+            shifted_orders.append(conflicting_order)
             last_available_time = new_end_for_shifted
 
         if is_shift_possible and shift_chain:
-            logging.info(f"{self} УСПЕШНО построил цепочку сдвига из {len(shift_chain)} заказов для {new_order}.")
-            return {
-                'courier': self.entity, 'time_from': start_time, 'time_to': end_time,
-                'price': new_price, 'order': new_order, 'variant_name': 'reschedule',
-                'shift_chain': shift_chain
-            }
+            tracer.trace(TraceEvent.SHIFT_CHAIN_BUILT, self.name, len(shift_chain), new_order.name)
+            return Variant(self.entity_id, self.order_ids[new_order], start_time, end_time, new_price, 'reschedule',
+                           shift_chain=tuple(shift_chain))
         
         return None
 
 
-    def add_order(self, params: dict) -> bool:
+    def add_order(self, variant: Variant) -> bool:
         """
         Добавление заказа с параметрами в расписание ресурса.
         Переписано для атомарной обработки сложных вариантов.
         """
-        variant_name = params.get('variant_name')
+        variant_name = variant.variant_name
+        order = self._get_order(variant.order_id)
+        if order is None:
+            return False
         
-        # Сохраняем копию расписания для отката в случае неудачи
-        backup_schedule = copy.deepcopy(self.entity.schedule)
+        # Изменения расписания откатываются в случае неудачи
+        self.entity.schedule.begin()
         
         try:
             if variant_name == 'conflict':
-                order_to_displace = params['order_to_displace']
-                logging.info(f"{self} пытается вытеснить {order_to_displace} для нового заказа.")
+                order_to_displace = self.orders_by_id[variant.displaced_order_id]
+                tracer.trace(TraceEvent.DISPLACEMENT_STARTED, self.name, order_to_displace.name)
                 # Удаляем все записи вытесняемого заказа
                 self.entity.remove_order_from_schedule(order_to_displace)
                 # Добавляем новый заказ
-                if not self.entity.add_order_to_schedule(params.get('order'), 
-                                                         params.get('time_from'), 
-                                                         params.get('time_to'), 
-                                                         params.get('price'), 
-                                                         params,
+                if not self.entity.add_order_to_schedule(order, 
+                                                         variant.time_from, 
+                                                         variant.time_to, 
+                                                         variant.price, 
+                                                         variant,
                                                          creator="conflict"):
                     raise ValueError("Не удалось добавить новый заказ после вытеснения.")
                 
                 # Сообщаем вытесненному заказу, что ему нужно искать нового исполнителя
-                remove_message = Message(MessageType.REMOVE_ORDER, self.entity)
-                removed_order_address = self.dispatcher.reference_book.get_address(order_to_displace)
+                remove_message = Message(MessageType.REMOVE_ORDER, self.entity_id)
+                removed_order_address = self.state.get_address_by_id(variant.displaced_order_id)
                 self.send(removed_order_address, remove_message)
+                self.entity.schedule.commit()
                 return True
 
             elif variant_name == 'reschedule':
-                shift_chain = params.get('shift_chain', [])
-                logging.info(f"{self} пытается выполнить сдвиг {len(shift_chain)} заказов.")
+                shift_chain = variant.shift_chain
+                tracer.trace(TraceEvent.SHIFT_STARTED, self.name, len(shift_chain))
                 
+                # Стоимость для сдвинутых заказов не меняется, запоминаем ее до удаления
+                shifted_orders = [self.orders_by_id[item.order_id] for item in shift_chain]
+                original_costs = [sum(r.cost for r in self.entity.get_all_order_records(shifted_order))
+                                  for shifted_order in shifted_orders]
+
                 # 1. Удаляем все заказы, которые будут сдвинуты
-                for item in shift_chain:
-                    self.entity.remove_order_from_schedule(item['order'])
+                for shifted_order in shifted_orders:
+                    self.entity.remove_order_from_schedule(shifted_order)
                 
                 # 2. Добавляем новый заказ
-                if not self.entity.add_order_to_schedule(params.get('order'), 
-                                                         params.get('time_from'), 
-                                                         params.get('time_to'), 
-                                                         params.get('price'), 
-                                                         params,
+                if not self.entity.add_order_to_schedule(order, 
+                                                         variant.time_from, 
+                                                         variant.time_to, 
+                                                         variant.price, 
+                                                         variant,
                                                          creator="reschedule"):
                     raise ValueError("Не удалось добавить новый заказ при сдвиге.")
                 
                 # 3. Добавляем сдвинутые заказы на новые места
-                for item in shift_chain:
-                    # Стоимость для сдвинутого заказа не меняется, находим ее из бэкапа
-                    original_cost = sum(r.cost for r in backup_schedule if r.order == item['order'])
-                    if not self.entity.add_order_to_schedule(item['order'], 
-                                                             item['new_start'], 
-                                                             item['new_end'], 
+                for item, shifted_order, original_cost in zip(shift_chain, shifted_orders, original_costs):
+                    if not self.entity.add_order_to_schedule(shifted_order, 
+                                                             item.new_start, 
+                                                             item.new_end, 
                                                              original_cost, 
                                                              {},
                                                             creator="reschedule"):
-                        raise ValueError(f"Не удалось добавить сдвинутый заказ {item['order']} на новое место.")
+                        raise ValueError(f"Не удалось добавить сдвинутый заказ {shifted_order} на новое место.")
+                self.entity.schedule.commit()
                 return True
 
             else: # Обычный вариант 'asap'
-                return self.entity.add_order_to_schedule(params.get('order'), 
-                                                         params.get('time_from'), 
-                                                         params.get('time_to'), 
-                                                         params.get('price'), 
-                                                         params,
-                                                         creator="asap")
+                adding_result = self.entity.add_order_to_schedule(order, 
+                                                                  variant.time_from, 
+                                                                  variant.time_to, 
+                                                                  variant.price, 
+                                                                  variant,
+                                                                  creator="asap")
+                self.entity.schedule.commit()
+                return adding_result
 
         except Exception as e:
             logging.error(f"{self} ОШИБКА при планировании варианта '{variant_name}': {e}. Восстанавливаю расписание.")
-            self.entity.schedule = backup_schedule
+            self.entity.schedule.rollback()
             return False
 
     def handle_planning_request(self, message, sender):
@@ -388,14 +392,13 @@ class CourierAgent(AgentBase):
         :param sender:
         :return:
         """
-        params = message.msg_body
+        variant: Variant = message.msg_body
         # Пытаемся добавить заказ в свое расписание
-        adding_result = self.add_order(params)
+        adding_result = self.add_order(variant)
+        self.commit_entity()
 
-        logging.info(f'{self} получил запрос на размещение {params}, '
-                     f'результат - {adding_result}')
-        params['success'] = adding_result
-        result_msg = Message(MessageType.PLANNING_RESPONSE, params)
+        tracer.trace(TraceEvent.PLANNING_REQUEST_HANDLED, self.name, variant.order_id, variant.variant_name, adding_result)
+        result_msg = Message(MessageType.PLANNING_RESPONSE, PlanningResult(variant, adding_result))
         self.send(sender, result_msg)
 
     # def add_order(self, params: dict) -> bool:
@@ -443,4 +446,4 @@ class CourierAgent(AgentBase):
     #     return adding_result
 
     def handle_deleted(self, msg, sender):
-        logging.info(f'{self} получил сообщение об удалении. ЧТО ДЕЛАТЬ???')
+        tracer.trace(TraceEvent.AGENT_DELETED, self.name)
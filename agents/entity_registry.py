@@ -0,0 +1,101 @@
+"""Содержит реестр сущностей одного типа"""
+import logging
+import typing
+
+
+class EntityRegistry:
+    """
+    Реестр сущностей одного типа на сцене с поиском по идентификатору и по имени.
+    Список не удаляемых сущностей строится при первом запросе после изменения реестра
+    и до следующего изменения возвращается один и тот же, поэтому вызывающие не должны его изменять.
+    Счетчик версий увеличивается при каждом изменении состава реестра (добавление, удаление,
+    пометка удаления, замена копией) - по нему вызывающие могут кешировать производные данные.
+    """
+    def __init__(self):
+        # Идентификатор -> сущность, в порядке добавления
+        self.entities_by_uri: typing.Dict[str, typing.Any] = {}
+        self.entities_by_name: typing.Dict[str, typing.Any] = {}
+        self.version = 0
+        self._live_entities = None
+
+    def __len__(self):
+        return len(self.entities_by_uri)
+
+    def __iter__(self):
+        return iter(self.entities_by_uri.values())
+
+    def __contains__(self, entity):
+        return self.entities_by_uri.get(entity.get_uri()) is entity
+
+    def _changed(self):
+        self.version += 1
+        self._live_entities = None
+
+    def add(self, entity):
+        """
+        Добавляет сущность в реестр
+        :param entity:
+        :return:
+        """
+        uri = entity.get_uri()
+        if uri in self.entities_by_uri:
+            logging.error(f'Сущность {uri} уже есть в реестре')
+        self.entities_by_uri[uri] = entity
+        self.entities_by_name[entity.name] = entity
+        self._changed()
+
+    def remove(self, entity) -> bool:
+        """
+        Удаляет сущность из реестра
+        :param entity:
+        :return: была ли сущность в реестре
+        """
+        current = self.entities_by_uri.pop(entity.get_uri(), None)
+        if current is None:
+            return False
+        if self.entities_by_name.get(current.name) is current:
+            del self.entities_by_name[current.name]
+        self._changed()
+        return True
+
+    def replace(self, entity) -> bool:
+        """
+        Заменяет хранимую сущность с тем же идентификатором на переданную
+        :param entity:
+        :return: была ли сущность в реестре
+        """
+        uri = entity.get_uri()
+        current = self.entities_by_uri.get(uri)
+        if current is None:
+            return False
+        if current is not entity:
+            self.entities_by_uri[uri] = entity
+            if self.entities_by_name.get(current.name) is current:
+                del self.entities_by_name[current.name]
+            self.entities_by_name[entity.name] = entity
+            self._changed()
+        return True
+
+    def deleting_changed(self, entity):
+        """
+        Учитывает изменение пометки удаления сущности
+        :param entity:
+        :return:
+        """
+        if entity in self:
+            self._changed()
+
+    def get_by_uri(self, uri: str):
+        return self.entities_by_uri.get(uri)
+
+    def get_by_name(self, name: str):
+        return self.entities_by_name.get(name)
+
+    def get_live(self) -> typing.List:
+        """
+        Возвращает сущности, которые не находятся в процессе удаления, в порядке добавления
+        :return:
+        """
+        if self._live_entities is None:
+            self._live_entities = [entity for entity in self.entities_by_uri.values() if not entity.is_deleting]
+        return self._live_entities
@@ -0,0 +1,145 @@
+"""Содержит потоковый расчет показателей симуляции и их временной ряд"""
+import typing
+from array import array
+
+import numpy as np
+
+
+class KpiTimeSeries:
+    """
+    Временной ряд показателей в колоночном виде: каждая колонка - массив array('d'),
+    строка добавляется без создания словарей, а колонки копируются в массивы NumPy одним блоком памяти.
+    """
+    COLUMNS = ('time', 'orders', 'planned_orders', 'backlog', 'on_time_rate', 'utilization',
+               'open_negotiations', 'messages')
+
+    def __init__(self):
+        self.columns: typing.Dict[str, array] = {name: array('d') for name in self.COLUMNS}
+        # Колонки в порядке COLUMNS - для добавления строки без поиска по имени
+        self._column_list = [self.columns[name] for name in self.COLUMNS]
+
+    def __len__(self):
+        return len(self._column_list[0])
+
+    def append(self, row: typing.Sequence[float]):
+        """
+        Добавляет строку значений в порядке COLUMNS
+        :param row:
+        :return:
+        """
+        for column, value in zip(self._column_list, row):
+            column.append(value)
+
+    def to_arrays(self) -> typing.Dict[str, np.ndarray]:
+        """
+        Возвращает копии колонок массивами NumPy (их можно передать в pandas.DataFrame).
+        Представление без копии запретило бы буферу расти, пока оно существует.
+        :return:
+        """
+        return {name: np.array(column, dtype=np.float64) for name, column in self.columns.items()}
+
+    def clear(self):
+        for column in self._column_list:
+            del column[:]
+
+
+class KpiTracker:
+    """
+    Потоковый расчет показателей по событиям сцены: появлению и удалению сущностей
+    и фиксации их изменений агентами. Для каждой сущности хранится ее последний учтенный вклад,
+    поэтому событие обрабатывается за O(1), а снимок показателей не просматривает расписания.
+    Показатели считаются по плану: заказ запланирован, когда у него есть курьер, и выполняется
+    в срок, если плановое время доставки не позже требуемого. Загруженность - доля запланированного
+    времени работы курьеров от горизонта симуляции, как в MetricsCalculator.
+    """
+    def __init__(self):
+        self.couriers_count = 0
+        self.working_time = 0.0
+        # Идентификатор курьера -> учтенное время работы по его расписанию
+        self._working_times: typing.Dict[str, float] = {}
+        self.orders_count = 0
+        self.planned_count = 0
+        self.on_time_count = 0
+        # Идентификатор заказа -> учтенное состояние (запланирован, в срок)
+        self._order_states: typing.Dict[str, typing.Tuple[bool, bool]] = {}
+        self.series = KpiTimeSeries()
+
+    def entity_added(self, entity):
+        entity_type = entity.get_type()
+        uri = entity.get_uri()
+        if entity_type == 'COURIER':
+            if uri not in self._working_times:
+                self.couriers_count += 1
+                self._working_times[uri] = 0.0
+            self._update_courier(uri, entity)
+        elif entity_type == 'ORDER':
+            if uri not in self._order_states:
+                self.orders_count += 1
+                self._order_states[uri] = (False, False)
+            self._update_order(uri, entity)
+
+    def entity_committed(self, entity):
+        """
+        Учитывает изменения сущности, зафиксированные агентом
+        :param entity:
+        :return:
+        """
+        uri = entity.get_uri()
+        if uri in self._working_times:
+            self._update_courier(uri, entity)
+        elif uri in self._order_states:
+            self._update_order(uri, entity)
+
+    def entity_removed(self, entity):
+        uri = entity.get_uri()
+        working_time = self._working_times.pop(uri, None)
+        if working_time is not None:
+            self.couriers_count -= 1
+            self.working_time -= working_time
+            return
+        state = self._order_states.pop(uri, None)
+        if state is not None:
+            self.orders_count -= 1
+            self.planned_count -= state[0]
+            self.on_time_count -= state[1]
+
+    def _update_courier(self, uri: str, courier):
+        working_time = courier.schedule.working_time
+        self.working_time += working_time - self._working_times[uri]
+        self._working_times[uri] = working_time
+
+    def _update_order(self, uri: str, order):
+        delivery_data = order.delivery_data
+        is_planned = delivery_data.get('courier') is not None
+        is_on_time = is_planned and delivery_data.get('time_to') is not None \
+            and delivery_data['time_to'] <= order.time_to
+        was_planned, was_on_time = self._order_states[uri]
+        self.planned_count += is_planned - was_planned
+        self.on_time_count += is_on_time - was_on_time
+        self._order_states[uri] = (is_planned, is_on_time)
+
+    def get_on_time_rate(self) -> float:
+        """Доля запланированных заказов, которые будут доставлены в срок, %"""
+        return self.on_time_count / self.planned_count * 100 if self.planned_count else 100.0
+
+    def get_utilization(self, horizon: float) -> float:
+        """
+        Средняя загруженность курьеров запланированной работой на горизонте horizon, %
+        :param horizon:
+        :return:
+        """
+        if not self.couriers_count or not horizon:
+            return 0.0
+        return self.working_time / (self.couriers_count * horizon) * 100
+
+    def sample(self, time: float, horizon: float, open_negotiations: int, messages: int):
+        """
+        Добавляет во временной ряд снимок текущих показателей
+        :param time: время симуляции
+        :param horizon: горизонт симуляции для расчета загруженности
+        :param open_negotiations: число заказов, у которых идут переговоры
+        :param messages: число отправленных сообщений с начала симуляции
+        :return:
+        """
+        self.series.append((time, self.orders_count, self.planned_count, self.orders_count - self.planned_count,
+                            self.get_on_time_rate(), self.get_utilization(horizon), open_negotiations, messages))
@@ -0,0 +1,155 @@
+"""Содержит статистику обработки сообщений агентами"""
+import math
+import typing
+
+
+class Histogram:
+    """
+    Гистограмма длительностей с логарифмическими корзинами: граница корзины i - MIN_VALUE * 2**i секунд.
+    Хранит только счетчики корзин, поэтому объединение гистограмм и передача между процессами дешевы,
+    а перцентили оцениваются с точностью до корзины (сверху).
+    """
+    MIN_VALUE = 1e-6
+    BUCKETS_COUNT = 40
+
+    def __init__(self):
+        self.buckets = [0] * self.BUCKETS_COUNT
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value: float):
+        """
+        Учитывает длительность value в секундах
+        :param value:
+        :return:
+        """
+        if value <= self.MIN_VALUE:
+            index = 0
+        else:
+            # Показатель степени двойки из frexp - номер корзины без вычисления логарифма
+            index = min(math.frexp(value / self.MIN_VALUE)[1], self.BUCKETS_COUNT - 1)
+        self.buckets[index] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other: 'Histogram'):
+        for index, count in enumerate(other.buckets):
+            self.buckets[index] += count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def get_mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def get_quantile(self, quantile: float) -> float:
+        """
+        Возвращает оценку перцентиля сверху - границу корзины, в которую он попадает
+        :param quantile: доля от 0 до 1
+        :return:
+        """
+        if not self.count:
+            return 0.0
+        rank = quantile * self.count
+        accumulated = 0
+        for index, count in enumerate(self.buckets):
+            accumulated += count
+            if count and accumulated >= rank:
+                return min(self.MIN_VALUE * 2 ** index, self.max)
+        return self.max
+
+    def to_dict(self) -> dict:
+        return {
+            'count': self.count,
+            'mean': self.get_mean(),
+            'p50': self.get_quantile(0.5),
+            'p95': self.get_quantile(0.95),
+            'max': self.max,
+        }
+
+
+class MessageTypeStats:
+    """Статистика сообщений одного типа: время обработчика и задержка от отправки до начала обработки"""
+    __slots__ = ('handler_time', 'latency')
+
+    def __init__(self):
+        self.handler_time = Histogram()
+        self.latency = Histogram()
+
+    @property
+    def count(self) -> int:
+        return self.handler_time.count
+
+    def merge(self, other: 'MessageTypeStats'):
+        self.handler_time.merge(other.handler_time)
+        self.latency.merge(other.latency)
+
+    def to_dict(self) -> dict:
+        return {'count': self.count, 'handler_time': self.handler_time.to_dict(), 'latency': self.latency.to_dict()}
+
+
+class MessageStats:
+    """
+    Статистика сообщений по классам агентов и типам сообщений и пиковое число недоставленных сообщений
+    во всех почтовых ящиках. Агенты передают замеры вместе с отметкой об обработке сообщения,
+    поэтому в многопроцессной системе статистика не требует отдельных обращений к серверу состояния.
+    """
+    def __init__(self):
+        # (класс агента, тип сообщения) -> статистика
+        self.by_agent_type: typing.Dict[typing.Tuple[str, typing.Any], MessageTypeStats] = {}
+        self.peak_backlog = 0
+
+    def record(self, agent_class: str, message_type, handler_time: float, latency: typing.Optional[float]):
+        """
+        Учитывает обработку одного сообщения
+        :param agent_class: имя класса агента-получателя
+        :param message_type: MessageType сообщения
+        :param handler_time: время работы обработчика, с
+        :param latency: время от отправки до начала обработки, с (None - время отправки неизвестно)
+        :return:
+        """
+        key = (agent_class, message_type)
+        stats = self.by_agent_type.get(key)
+        if stats is None:
+            stats = self.by_agent_type[key] = MessageTypeStats()
+        stats.handler_time.add(handler_time)
+        if latency is not None:
+            stats.latency.add(max(latency, 0.0))
+
+    def record_samples(self, samples: typing.Iterable[tuple]):
+        """
+        Учитывает замеры (класс агента, тип сообщения, время обработчика, задержка)
+        :param samples:
+        :return:
+        """
+        for sample in samples:
+            self.record(*sample)
+
+    def observe_backlog(self, backlog: int):
+        if backlog > self.peak_backlog:
+            self.peak_backlog = backlog
+
+    def get_by_type(self) -> typing.Dict[typing.Any, MessageTypeStats]:
+        """
+        Возвращает статистику по типам сообщений, сведенную по всем классам агентов
+        :return:
+        """
+        by_type = {}
+        for (_, message_type), stats in self.by_agent_type.items():
+            if message_type not in by_type:
+                by_type[message_type] = MessageTypeStats()
+            by_type[message_type].merge(stats)
+        return by_type
+
+    def to_dict(self) -> dict:
+        by_agent = {}
+        for (agent_class, message_type), stats in self.by_agent_type.items():
+            by_agent.setdefault(agent_class, {})[message_type.name] = stats.to_dict()
+        return {
+            'by_type': {message_type.name: stats.to_dict() for message_type, stats in self.get_by_type().items()},
+            'by_agent': by_agent,
+            'peak_backlog': self.peak_backlog,
+        }
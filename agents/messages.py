@@ -1,22 +1,131 @@
 from enum import Enum
-from dataclasses import dataclass
-from typing import Any
+from typing import Any, Optional, Tuple
 
 
 class MessageType(Enum):
     INIT_MESSAGE = 'Инициализация'
+    # Тело - идентификатор сущности заказа
     PRICE_REQUEST = 'Запрос цены'
+    # Тело - список Variant
     PRICE_RESPONSE = 'Ответ цены'
+    # Тело - Variant
     PLANNING_REQUEST = 'Запрос на размещение'
+    # Тело - PlanningResult
     PLANNING_RESPONSE = 'Ответ на размещение'
+    # Тело сообщений об изменениях курьера - идентификатор сущности курьера
     REMOVE_ORDER = 'Удаление заказа из расписания'
     NEW_COURIER = 'Появление нового курьера'
     DELETED_COURIER = 'Удаление курьера'
     TICK_MESSAGE = 'Тик'
+    # Конверт: несколько сообщений одного отправителя одному получателю, тело - список Message
 
 
-@dataclass
-class Message:
+class SlotsRecord:
+    """
+    Компактная запись сообщения: поля хранятся в __slots__, а при сериализации
+    передаются только их значения - без имен полей и словаря атрибутов.
+    Сущности указываются целочисленными идентификаторами из адресной книги.
+    """
+    __slots__ = ()
+
+    def _get_values(self) -> tuple:
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __reduce__(self):
+        return self.__class__, self._get_values()
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return self._get_values() == other._get_values()
+
+    __hash__ = None
+
+    def __repr__(self):
+        fields = ', '.join(f'{name}={getattr(self, name)!r}' for name in self.__slots__)
+        return f'{self.__class__.__name__}({fields})'
+
+
+class Message(SlotsRecord):
     """Класс для хранения сообщений"""
-    msg_type: MessageType
-    msg_body: Any
+    __slots__ = ('msg_type', 'msg_body', 'sent_at')
+
+    def __init__(self, msg_type: MessageType, msg_body: Any, sent_at: Optional[float] = None):
+        """
+        :param msg_type:
+        :param msg_body:
+        :param sent_at: момент отправки по time.monotonic() - по нему получатель считает задержку доставки
+        """
+        self.msg_type = msg_type
+        self.msg_body = msg_body
+        self.sent_at = sent_at
+
+
+class ShiftItem(SlotsRecord):
+    """Сдвиг заказа в цепочке каскадного сдвига"""
+    __slots__ = ('order_id', 'new_start', 'new_end')
+
+    def __init__(self, order_id: int, new_start: float, new_end: float):
+        self.order_id = order_id
+        self.new_start = new_start
+        self.new_end = new_end
+
+
+class Variant(SlotsRecord):
+    """
+    Вариант размещения заказа у курьера.
+    Оценки эффективности заполняет агент заказа при выборе варианта.
+    """
+    __slots__ = ('courier_id', 'order_id', 'time_from', 'time_to', 'price', 'variant_name',
+                 'displaced_order_id', 'shift_chain',
+                 'start_efficiency', 'finish_efficiency', 'price_efficiency', 'total_efficiency')
+
+    def __init__(self, courier_id: int, order_id: int, time_from: float, time_to: float, price: float,
+                 variant_name: str, displaced_order_id: Optional[int] = None,
+                 shift_chain: Tuple[ShiftItem, ...] = (),
+                 start_efficiency: float = None, finish_efficiency: float = None,
+                 price_efficiency: float = None, total_efficiency: float = None):
+        """
+        :param courier_id:
+        :param order_id:
+        :param time_from:
+        :param time_to:
+        :param price:
+        :param variant_name: вид варианта: 'jit', 'asap', 'conflict' (с вытеснением) или 'reschedule' (со сдвигом)
+        :param displaced_order_id: вытесняемый заказ варианта 'conflict'
+        :param shift_chain: сдвигаемые заказы варианта 'reschedule'
+        """
+        self.courier_id = courier_id
+        self.order_id = order_id
+        self.time_from = time_from
+        self.time_to = time_to
+        self.price = price
+        self.variant_name = variant_name
+        self.displaced_order_id = displaced_order_id
+        self.shift_chain = shift_chain
+        self.start_efficiency = start_efficiency
+        self.finish_efficiency = finish_efficiency
+        self.price_efficiency = price_efficiency
+        self.total_efficiency = total_efficiency
+
+    def get_delivery_data(self) -> dict:
+        """
+        Данные о доставке для сущности заказа
+        :return:
+        """
+        return {
+            'courier': self.courier_id,
+            'price': self.price,
+            'time_from': self.time_from,
+            'time_to': self.time_to,
+            'variant_name': self.variant_name,
+        }
+
+
+class PlanningResult(SlotsRecord):
+    """Результат размещения варианта в расписании курьера"""
+    __slots__ = ('variant', 'success')
+
+    def __init__(self, variant: Variant, success: bool):
+        self.variant = variant
+        self.success = success
@@ -1,10 +1,8 @@
 """ Реализация класса агента заказа"""
-import logging
-import typing
 
 from .agent_base import AgentBase
-from .messages import MessageType, Message
-from entities.courier_entity import CourierEntity
+from .messages import MessageType, Message, PlanningResult
+from .tracing import tracer, TraceEvent
 from entities.order_entity import OrderEntity
 
 
@@ -30,6 +28,13 @@ class OrderAgent(AgentBase):
 
         self.unchecked_couriers = []
         self.possible_variants = []
+        # Курьеры, опрошенные в текущих переговорах, и сколько ближайших курьеров опрашивать
+        self.requested_couriers = []
+        self.candidates_count = None
+        # Сколько ближайших курьеров опрашивать в начале переговоров, задается сценарием
+        self.price_request_candidates = None
+        # Идентификатор курьера -> адрес его агента, по адресам ответивших на запрос цены
+        self.courier_addresses = {}
 
     def handle_remove_message(self, message, sender):
         """
@@ -39,7 +44,7 @@ class OrderAgent(AgentBase):
         :return:
         """
         courier = message.msg_body
-        logging.info(f'{self} - удален из расписания курьера {courier}')
+        tracer.trace(TraceEvent.ORDER_REMOVED_FROM_SCHEDULE, self.name, courier)
         # Считаем, что всем параметры старые их необходимо пересчитать.
         self.entity.delivery_data = {
             'courier': None,
@@ -47,6 +52,7 @@ class OrderAgent(AgentBase):
             'time_from': None,
             'time_to': None,
         }
+        self.commit_entity()
         self.possible_variants.clear()
         self.__send_params_request()
 
@@ -58,7 +64,8 @@ class OrderAgent(AgentBase):
         :return:
         """
         courier = message.msg_body
-        logging.info(f'{self} - узнал об удалении {courier}')
+        tracer.trace(TraceEvent.COURIER_DELETED, self.name, courier)
+        self.courier_addresses.pop(courier, None)
 
         if self.entity.delivery_data.get('courier') != courier:
             # Заказ не был запланирован на этом курьере, ему не надо ничего делать
@@ -73,9 +80,13 @@ class OrderAgent(AgentBase):
         :param sender:
         :return:
         """
-        if self.scene.time - self.last_send_request_time > self.entity.waite_response_timeout and self.unchecked_couriers:
+        if self.get_time() - self.last_send_request_time > self.entity.waite_response_timeout and self.unchecked_couriers:
             self.unchecked_couriers = []
-            self.__run_planning()
+            if not self.possible_variants and self.__can_widen_request():
+                # Ответивших с вариантами нет - опрашиваем следующих курьеров, как при пустых ответах
+                self.__send_params_request(widen=True)
+            else:
+                self.__run_planning()
 
         elif not self.unchecked_couriers and self.entity.delivery_data['courier'] is None and self.possible_variants:
             self.__run_planning()
@@ -95,9 +106,9 @@ class OrderAgent(AgentBase):
         :return:
         """
         courier = message.msg_body
-        logging.info(f'{self} - узнал о новом курьере {courier}')
+        tracer.trace(TraceEvent.COURIER_ADDED, self.name, courier)
         # Если заказ уже запланирован, то ничего делать не надо.
-        if not self.entity.delivery_data.get('courier'):
+        if self.entity.delivery_data.get('courier') is None:
             # Считаем, что всем параметры старые их необходимо пересчитать.
             self.possible_variants.clear()
             self.__send_params_request()
@@ -109,18 +120,20 @@ class OrderAgent(AgentBase):
         :param sender:
         :return:
         """
-        result = message.msg_body
-        logging.info(f'{self} - получил {message}, результат - {result}')
+        result: PlanningResult = message.msg_body
+        tracer.trace(TraceEvent.PLANNING_RESPONSE_RECEIVED, self.name, result.variant.courier_id, result.success)
 
-        if result.get('success'):
-            self.entity.delivery_data = result
-            logging.info(f'{self} доволен, ничего делать не надо')
+        if result.success:
+            self.entity.delivery_data = result.variant.get_delivery_data()
+            self.commit_entity()
+            self.state.close_negotiation(self.entity.get_uri())
+            tracer.trace(TraceEvent.ORDER_PLANNED, self.name)
             return
         # Ищем другой вариант для размещения
         # Возможно, правильнее было бы снова инициализировать варианты путем переговоров
         # Но мы попробуем другие варианты, которые у нас уже есть
         sorted_vars = sorted(self.possible_variants,
-                             key=lambda x: x.get('price'))
+                             key=lambda x: x.price)
         # Прошлый лучший вариант, который мы проверяли
         checked_variant = sorted_vars[0]
         self.possible_variants.remove(checked_variant)
@@ -131,6 +144,7 @@ class OrderAgent(AgentBase):
 
     def handle_init_message(self, message, sender):
         super().handle_init_message(message, sender)
+        self.price_request_candidates = self.state.get_price_request_candidates()
         # Ищем в системе ресурсы и отправляем им запросы
         if self.entity.is_urgent:
             self.finish_weight = 0.7
@@ -138,20 +152,41 @@ class OrderAgent(AgentBase):
             self.price_weight = 0.1
         self.__send_params_request()
 
-    def __send_params_request(self):
-        all_couriers: typing.List[CourierEntity] = self.scene.get_entities_by_type('COURIER')
-        self.last_send_request_time = self.scene.time
-        logging.info(f'{self} - список ресурсов: {all_couriers}')
-        for courier in all_couriers:
-            # if self.entity.order_type not in courier.types:
-            #     logging.info(f'{self} - типы грузов {courier} - {courier.types} '
-            #                  f'не включают {self.entity.order_type}')
-            #     continue
-            courier_address = self.dispatcher.reference_book.get_address(courier)
-            # logging.info(f'{self} - адрес {courier}: {courier_address}')
-            request_message = Message(MessageType.PRICE_REQUEST, self.entity)
+    def __send_params_request(self, widen: bool = False):
+        """
+        Запрашивает варианты у ближайших курьеров
+        :param widen: расширить круг опрашиваемых курьеров в текущих переговорах
+        :return:
+        """
+        if widen:
+            self.candidates_count *= 2
+        else:
+            self.candidates_count = self.price_request_candidates
+            self.requested_couriers = []
+        courier_addresses = self.state.get_nearest_courier_addresses(self.entity.point_from, self.candidates_count)
+        self.last_send_request_time = self.get_time()
+        tracer.trace(TraceEvent.PRICE_REQUESTS_SENT, self.name, len(courier_addresses))
+        for courier_address in courier_addresses:
+            if courier_address in self.requested_couriers:
+                continue
+            request_message = Message(MessageType.PRICE_REQUEST, self.entity_id)
             self.send(courier_address, request_message)
             self.unchecked_couriers.append(courier_address)
+            self.requested_couriers.append(courier_address)
+        if widen and not self.unchecked_couriers:
+            # Новых курьеров не нашлось, переговоры завершены
+            self.state.close_negotiation(self.entity.get_uri())
+        elif self.unchecked_couriers:
+            # Переговоры открыты до получения ответов или истечения времени ожидания
+            self.state.open_negotiation(self.entity.get_uri())
+            self.add_wakeup(self.last_send_request_time + self.entity.waite_response_timeout)
+
+    def __can_widen_request(self) -> bool:
+        """
+        Опрошены не все курьеры: ближайших оказалось столько, сколько запрашивали
+        :return:
+        """
+        return self.candidates_count is not None and len(self.requested_couriers) >= self.candidates_count
 
     def handle_price_response(self, message, sender):
         "Получение ответа на запрос цены"
@@ -159,8 +194,18 @@ class OrderAgent(AgentBase):
         courier_variants = message.msg_body
 
         self.possible_variants.extend(courier_variants)
+        for variant in courier_variants:
+            self.courier_addresses[variant.courier_id] = sender
         self.unchecked_couriers.remove(sender)
-        
+        if not self.unchecked_couriers:
+            if self.possible_variants:
+                # Все ответы получены - планирование на ближайшем тике
+                self.add_immediate_wakeup()
+            elif self.__can_widen_request():
+                # Ближайшие курьеры не могут выполнить заказ - опрашиваем следующих
+                self.__send_params_request(widen=True)
+            else:
+                self.state.close_negotiation(self.entity.get_uri())
 
     def __evaluate_variants(self):
         """
@@ -169,51 +214,59 @@ class OrderAgent(AgentBase):
         """
         if not self.possible_variants:
             return
-        all_start_times = [var.get('time_from') for var in self.possible_variants]
+        all_start_times = [var.time_from for var in self.possible_variants]
         min_start_time = min(all_start_times)
         max_start_time = max(all_start_times)
-        all_delta_finish_times = [var.get('time_to')-self.entity.time_to for var in self.possible_variants]
+        all_delta_finish_times = [var.time_to-self.entity.time_to for var in self.possible_variants]
 
         min_finish_time = min(all_delta_finish_times)
         max_finish_time = max(all_delta_finish_times)
-        all_prices = [var.get('price') for var in self.possible_variants]
+        all_prices = [var.price for var in self.possible_variants]
         min_price = min(all_prices)
         max_price = max(all_prices)
-        logging.info(f'{self} минимальный старт: {min_start_time}, минимальное завершение - {min_finish_time}, '
-                     f'минимальная цена - {min_price}')
+        tracer.trace(TraceEvent.VARIANTS_EVALUATED, self.name, min_start_time, min_finish_time, min_price)
         for variant in self.possible_variants:
-            start_efficiency = self.get_decreasing_kpi_value(variant.get('time_from'), min_start_time, max_start_time)
-            finish_efficiency = self.get_increasing_kpi_value(variant.get('time_to')-self.entity.time_to, min_finish_time, max_finish_time)
-            price_efficiency = self.get_decreasing_kpi_value(variant.get('price'), min_price, max_price)
-            variant['start_efficiency'] = start_efficiency  # [0; 1]
-            variant['finish_efficiency'] = finish_efficiency  # [0; 1]
-            variant['price_efficiency'] = price_efficiency  # [0; 1]
+            start_efficiency = self.get_decreasing_kpi_value(variant.time_from, min_start_time, max_start_time)
+            finish_efficiency = self.get_increasing_kpi_value(variant.time_to-self.entity.time_to, min_finish_time, max_finish_time)
+            price_efficiency = self.get_decreasing_kpi_value(variant.price, min_price, max_price)
+            variant.start_efficiency = start_efficiency  # [0; 1]
+            variant.finish_efficiency = finish_efficiency  # [0; 1]
+            variant.price_efficiency = price_efficiency  # [0; 1]
 
             # Итоговая оценка варианта должна учитывать все критерии
             # (в какой-то пропорции)
             
-            variant['total_efficiency'] = self.finish_weight * finish_efficiency + self.start_weight * start_efficiency +\
+            variant.total_efficiency = self.finish_weight * finish_efficiency + self.start_weight * start_efficiency +\
                                           self.price_weight * price_efficiency
 
     def __run_planning(self):
         """Планирование заказа"""
         if not self.possible_variants:
-            logging.info(f'{self} - нет возможных вариантов для планирования')
+            tracer.trace(TraceEvent.NO_VARIANTS, self.name)
+            self.state.close_negotiation(self.entity.get_uri())
             return
         # Оцениваем варианты
         self.__evaluate_variants()
         # Сортируем варианты от лучшего к худшему.
-        sorted_vars = sorted(self.possible_variants, key=lambda x: x.get('total_efficiency'), reverse=True)
-        logging.info(f'{self} - {sorted_vars=}')
+        sorted_vars = sorted(self.possible_variants, key=lambda x: x.total_efficiency, reverse=True)
+        if tracer.is_enabled(TraceEvent.VARIANTS_SORTED):
+            tracer.trace(TraceEvent.VARIANTS_SORTED, self.name,
+                         tuple((var.courier_id, var.variant_name, var.total_efficiency) for var in sorted_vars))
         # Наилучший
         best_variant = sorted_vars[0]
         # Адрес лучшего варианта
-        best_variant_address = self.dispatcher.reference_book.get_address(best_variant.get('courier'))
+        best_variant_address = self.courier_addresses.get(best_variant.courier_id)
+        if best_variant_address is None:
+            best_variant_address = self.state.get_address_by_id(best_variant.courier_id)
 
-        logging.info(f'{self} - лучшим вариантом признан {best_variant}, '
-                     f'адрес - {best_variant_address}')
+        tracer.trace(TraceEvent.BEST_VARIANT_CHOSEN, self.name, best_variant.courier_id, best_variant.variant_name,
+                     best_variant.price, best_variant.total_efficiency)
         request_message = Message(MessageType.PLANNING_REQUEST, best_variant)
         self.send(best_variant_address, request_message)
 
+    def handle_delete_message(self):
+        super().handle_delete_message()
+        self.state.close_negotiation(self.entity.get_uri())
+
     def handle_deleted(self, msg, sender):
-        logging.info(f'{self} получил сообщение об удалении. ЧТО ДЕЛАТЬ???')
+        tracer.trace(TraceEvent.AGENT_DELETED, self.name)
@@ -1,22 +1,83 @@
 """Содержит адресную книгу агентов"""
 import logging
+import typing
+
+
+def get_address_key(agent_address) -> str:
+    """
+    Ключ адреса агента для обратного индекса: адреса thespian не хешируются
+    :param agent_address:
+    :return:
+    """
+    return str(agent_address)
 
 
 class ReferenceBook:
-    """Адресная книга агентов с привязкой к сущностям"""
+    """
+    Адресная книга агентов с привязкой к сущностям.
+    Каждой зарегистрированной сущности выдается плотный целочисленный идентификатор -
+    номер ячейки в массивах сущностей и адресов, он же порядковый номер регистрации.
+    Идентификаторы не переиспользуются: они передаются в сообщениях и не должны указывать
+    на другую сущность после удаления прежней. Обход живых агентов идет в порядке регистрации
+    и стоит пропорционально их числу.
+    """
     def __init__(self):
-        self.agents_entities = {}
+        # Идентификатор -> сущность и адрес ее агента (None - свободная ячейка)
+        self.entities: typing.List = []
+        self.addresses: typing.List = []
+        # Сущность -> идентификатор
+        self.ids_by_entity: typing.Dict[typing.Any, int] = {}
+        # Ключ адреса -> идентификатор
+        self.ids_by_address: typing.Dict[str, int] = {}
+        # Идентификаторы живых агентов в порядке регистрации
+        self.live_ids: typing.Dict[int, None] = {}
+
+    def __len__(self):
+        return len(self.live_ids)
 
-    def add_agent(self, entity, agent_address):
+    def __contains__(self, entity):
+        return entity in self.ids_by_entity
+
+    def add_agent(self, entity, agent_address) -> int:
         """
         Сохраняет адрес агента с привязкой с сущности
         :param entity:
         :param agent_address:
-        :return:
+        :return: идентификатор сущности
         """
-        if entity in self.agents_entities:
+        if entity in self.ids_by_entity:
             logging.error(f'Агент {entity} уже есть в адресной книге')
-        self.agents_entities[entity] = agent_address
+            self.remove_agent(entity)
+        agent_id = len(self.entities)
+        self.entities.append(entity)
+        self.addresses.append(agent_address)
+        self.ids_by_entity[entity] = agent_id
+        self.ids_by_address[get_address_key(agent_address)] = agent_id
+        self.live_ids[agent_id] = None
+        return agent_id
+
+    def remove_agent(self, entity) -> bool:
+        """
+        Удаляет агента сущности из адресной книги
+        :param entity:
+        :return: был ли агент в адресной книге
+        """
+        agent_id = self.ids_by_entity.pop(entity, None)
+        if agent_id is None:
+            return False
+        self.ids_by_address.pop(get_address_key(self.addresses[agent_id]), None)
+        del self.live_ids[agent_id]
+        self.entities[agent_id] = None
+        self.addresses[agent_id] = None
+        return True
+
+    def get_id(self, entity) -> typing.Optional[int]:
+        """
+        Возвращает идентификатор сущности или None
+        :param entity:
+        :return:
+        """
+        return self.ids_by_entity.get(entity)
 
     def get_address(self, entity):
         """
@@ -24,14 +85,62 @@ class ReferenceBook:
         :param entity:
         :return:
         """
-        if entity not in self.agents_entities:
+        agent_id = self.ids_by_entity.get(entity)
+        if agent_id is None:
             logging.error(f'Агент {entity} отсутствует в адресной книге')
             return None
-        return self.agents_entities[entity]
+        return self.addresses[agent_id]
+
+    def get_address_by_id(self, agent_id: int):
+        """
+        Возвращает адрес агента по идентификатору сущности или None
+        :param agent_id:
+        :return:
+        """
+        if agent_id not in self.live_ids:
+            return None
+        return self.addresses[agent_id]
+
+    def get_entity_by_id(self, agent_id: int):
+        """
+        Возвращает сущность по ее идентификатору или None
+        :param agent_id:
+        :return:
+        """
+        if agent_id not in self.live_ids:
+            return None
+        return self.entities[agent_id]
+
+    def get_entity_by_address(self, agent_address):
+        """
+        Возвращает сущность агента с указанным адресом или None
+        :param agent_address:
+        :return:
+        """
+        agent_id = self.ids_by_address.get(get_address_key(agent_address))
+        if agent_id is None:
+            return None
+        return self.entities[agent_id]
+
+    def get_ids(self) -> typing.List[int]:
+        return list(self.live_ids)
+
+    def items(self) -> typing.Iterator[typing.Tuple[typing.Any, typing.Any]]:
+        """
+        Возвращает пары (сущность, адрес) живых агентов в порядке регистрации
+        :return:
+        """
+        entities = self.entities
+        addresses = self.addresses
+        return ((entities[agent_id], addresses[agent_id]) for agent_id in self.live_ids)
 
     def clear(self):
         """
         Очищает адресную книгу
         :return:
         """
-        self.agents_entities.clear()
+        self.entities.clear()
+        self.addresses.clear()
+        self.ids_by_entity.clear()
+        self.ids_by_address.clear()
+        self.live_ids.clear()
@@ -0,0 +1,192 @@
+"""Содержит среды исполнения агентов"""
+import typing
+from abc import ABC, abstractmethod
+from collections import deque
+
+from thespian.actors import ActorSystem, ActorAddress, ActorExitRequest
+
+
+class AgentRuntime(ABC):
+    """
+    Интерфейс среды исполнения агентов: создание агентов и доставка им сообщений
+    """
+    # tell() возвращается только после обработки всех порожденных сообщений
+    is_synchronous = False
+    # Агенты работают в том же процессе, что и сцена, и могут получать ее объекты напрямую
+    shares_memory = True
+
+    @abstractmethod
+    def create_agent(self, agent_class):
+        """
+        Создает агента и возвращает его адрес
+        :param agent_class:
+        :return:
+        """
+
+    @abstractmethod
+    def tell(self, agent_address, message):
+        """
+        Отправляет сообщение агенту извне системы
+        :param agent_address:
+        :param message:
+        :return:
+        """
+
+    @abstractmethod
+    def listen(self, timeout: float):
+        """
+        Дает системе обработать накопившиеся сообщения
+        :param timeout:
+        :return:
+        """
+
+    @abstractmethod
+    def shutdown(self):
+        """
+        Останавливает систему
+        :return:
+        """
+
+
+# Системы акторов thespian, в которых агенты запускаются в отдельных процессах
+MULTIPROCESS_SYSTEM_BASES = ('multiprocQueueBase', 'multiprocTCPBase', 'multiprocUDPBase')
+
+
+class ThespianRuntime(AgentRuntime):
+    """
+    Среда исполнения на основе ActorSystem из thespian
+    """
+    def __init__(self, system_base: str = None):
+        """
+        :param system_base: имя системы акторов thespian, по умолчанию simpleSystemBase
+        """
+        is_multiprocess = system_base in MULTIPROCESS_SYSTEM_BASES
+        # Многопроцессные системы не принимают logDefs=False и настраивают журналирование сами
+        self.actor_system = ActorSystem(system_base, logDefs=None if is_multiprocess else False)
+        # В simpleSystemBase tell() возвращается только после обработки всех порожденных сообщений
+        self.is_synchronous = not is_multiprocess
+        self.shares_memory = not is_multiprocess
+
+    def create_agent(self, agent_class):
+        return self.actor_system.createActor(agent_class)
+
+    def tell(self, agent_address, message):
+        self.actor_system.tell(agent_address, message)
+
+    def listen(self, timeout: float):
+        self.actor_system.listen(timeout)
+
+    def shutdown(self):
+        self.actor_system.shutdown()
+
+
+class LocalAddress(ActorAddress):
+    """Адрес агента в LocalRuntime - номер агента в списке среды"""
+
+    def __init__(self, agent_id: int):
+        super().__init__(agent_id)
+        self.agent_id = agent_id
+
+    def __eq__(self, other):
+        return isinstance(other, LocalAddress) and self.agent_id == other.agent_id
+
+    def __hash__(self):
+        return hash(self.agent_id)
+
+    def __str__(self):
+        return 'LocalAddr-' + str(self.agent_id)
+
+    __repr__ = __str__
+
+
+class _LocalActorRef:
+    """
+    Замена внутренней ссылки thespian на агента: Actor.send и Actor.myAddress
+    работают через нее без изменений в коде агентов
+    """
+    __slots__ = ('runtime', 'address')
+
+    def __init__(self, runtime, address: LocalAddress):
+        self.runtime = runtime
+        self.address = address
+
+    def actor_send(self, target_address, message):
+        self.runtime.enqueue(target_address, message, self.address)
+
+
+class LocalRuntime(AgentRuntime):
+    """
+    Легковесная среда исполнения в текущем процессе.
+    Сообщения складываются в очередь и по одному передаются напрямую в receiveMessage агента,
+    порядок доставки - порядок отправки.
+    """
+    is_synchronous = True
+
+    def __init__(self):
+        self.agents: typing.List[typing.Any] = []
+        self.queue = deque()
+        self.is_running = False
+
+    def create_agent(self, agent_class):
+        address = LocalAddress(len(self.agents))
+        agent = agent_class()
+        agent._myRef = _LocalActorRef(self, address)
+        self.agents.append(agent)
+        return address
+
+    def enqueue(self, agent_address, message, sender=None):
+        self.queue.append((agent_address, message, sender))
+
+    def tell(self, agent_address, message):
+        self.enqueue(agent_address, message)
+        self.run()
+
+    def run(self):
+        """
+        Доставляет сообщения, пока очередь не опустеет.
+        Сообщения, отправленные агентами во время обработки, доставляются в этом же цикле.
+        :return:
+        """
+        if self.is_running:
+            return
+        self.is_running = True
+        try:
+            queue = self.queue
+            agents = self.agents
+            while queue:
+                agent_address, message, sender = queue.popleft()
+                agent = agents[agent_address.agent_id]
+                if agent is None:
+                    # Агент остановлен, сообщение теряется
+                    continue
+                agent.receiveMessage(message, sender)
+                if isinstance(message, ActorExitRequest):
+                    agents[agent_address.agent_id] = None
+        finally:
+            self.is_running = False
+
+    def listen(self, timeout: float):
+        self.run()
+
+    def shutdown(self):
+        self.queue.clear()
+        self.agents.clear()
+
+
+RUNTIMES = {
+    'thespian': ThespianRuntime,
+    'local': LocalRuntime,
+}
+
+
+def create_runtime(name: str = 'thespian', **options) -> AgentRuntime:
+    """
+    Создает среду исполнения по имени
+    :param name: 'thespian' или 'local'
+    :param options: параметры среды, например system_base для 'thespian'
+    :return:
+    """
+    runtime_class = RUNTIMES.get(name)
+    if runtime_class is None:
+        raise ValueError(f'Неизвестная среда исполнения агентов: {name}')
+    return runtime_class(**options)
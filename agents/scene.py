@@ -1,25 +1,201 @@
 from collections import defaultdict
 import typing
 
+from agents.entity_registry import EntityRegistry
+from agents.kpi_tracker import KpiTracker
+from agents.message_stats import MessageStats
+from agents.spatial_index import GridSpatialIndex
+from agents.timer_wheel import TimerWheel
+
 
 class Scene:
     """
     Класс сцены
     """
-    def __init__(self):
-        self.entities = defaultdict(list)
+    def __init__(self, tick_size: float = 1.0):
+        """
+        :param tick_size: шаг симуляции - длина ячейки колеса таймеров
+        """
+        # Тип сущности -> реестр сущностей этого типа
+        self.entities: typing.Dict[str, EntityRegistry] = defaultdict(EntityRegistry)
+        # Идентификатор сущности -> ее тип
+        self._entity_types = {}
         self._time = 0.0
         self.count_messages = 0
+        # Отправленные, но еще не обработанные сообщения
+        self.messages_in_flight = 0
+        # Счетчик обработанных сообщений, по нему видно, что система еще работает
+        self.messages_received = 0
+        # Замеры обработки сообщений по классам агентов и типам сообщений
+        self.message_stats = MessageStats()
+        # Показатели, которые считаются по ходу симуляции
+        self.kpi = KpiTracker()
+        # Таймеры, по которым агенты просят их разбудить
+        self.timers = TimerWheel(slot_size=tick_size)
+        # Идентификаторы заказов, у которых идут переговоры с курьерами
+        self.open_negotiations = set()
+        # Индекс курьеров по последней точке их расписания - оттуда они начнут следующий заказ
+        self.couriers_index = GridSpatialIndex()
+        # Сколько ближайших курьеров заказ опрашивает сначала (None - всех)
+        self.price_request_candidates = None
+
+    def add_entity(self, entity):
+        """
+        Добавляет сущность на сцену
+        :param entity:
+        :return:
+        """
+        entity_type = entity.get_type()
+        self.entities[entity_type].add(entity)
+        self._entity_types[entity.get_uri()] = entity_type
+        self.kpi.entity_added(entity)
+
+    def remove_entity(self, entity) -> bool:
+        """
+        Удаляет сущность со сцены
+        :param entity:
+        :return: была ли сущность на сцене
+        """
+        entity_type = self._entity_types.pop(entity.get_uri(), None)
+        if entity_type is None:
+            return False
+        self.kpi.entity_removed(entity)
+        return self.entities[entity_type].remove(entity)
+
+    def entity_deleting_changed(self, entity):
+        """
+        Вызывается сущностью при изменении пометки удаления
+        :param entity:
+        :return:
+        """
+        entity_type = self._entity_types.get(entity.get_uri())
+        if entity_type is not None:
+            self.entities[entity_type].deleting_changed(entity)
 
     def get_entities_by_type(self, entity_type) -> typing.List:
         """
-        Возвращает сущности заданного типа, которые не находятся в процессе удаления
+        Возвращает сущности заданного типа, которые не находятся в процессе удаления.
+        Список общий для всех вызовов до следующего изменения реестра - его нельзя изменять.
+        :param entity_type:
+        :return:
+        """
+        registry = self.entities.get(entity_type)
+        if registry is None:
+            return []
+        return registry.get_live()
+
+    def get_entities_version(self, entity_type) -> int:
+        """
+        Возвращает версию реестра сущностей заданного типа - она меняется при каждом изменении его состава
         :param entity_type:
         :return:
         """
-        all_entities = self.entities.get(entity_type, [])
-        not_deleting_entities = [entity for entity in all_entities if not entity.is_deleting]
-        return not_deleting_entities
+        registry = self.entities.get(entity_type)
+        return 0 if registry is None else registry.version
+
+    def get_entity(self, uri: str):
+        """
+        Возвращает сущность по идентификатору или None
+        :param uri:
+        :return:
+        """
+        entity_type = self._entity_types.get(uri)
+        if entity_type is None:
+            return None
+        return self.entities[entity_type].get_by_uri(uri)
+
+    def get_entity_by_name(self, entity_type: str, name: str):
+        """
+        Возвращает сущность заданного типа по имени или None
+        :param entity_type:
+        :param name:
+        :return:
+        """
+        registry = self.entities.get(entity_type)
+        if registry is None:
+            return None
+        return registry.get_by_name(name)
+
+    def replace_entity(self, entity):
+        """
+        Заменяет хранимую сущность с тем же идентификатором на переданную
+        :param entity:
+        :return:
+        """
+        if self.entities[entity.get_type()].replace(entity):
+            self.kpi.entity_committed(entity)
+
+    def update_entity_position(self, entity):
+        """
+        Обновляет положение сущности в пространственном индексе: курьер индексируется
+        по текущему положению и по последней точке своего расписания.
+        Текущее положение обновляется при фиксации изменений курьера
+        :param entity:
+        :return:
+        """
+        if entity.get_type() == 'COURIER':
+            self.couriers_index.update(entity.get_uri(), entity.get_current_point(self.time),
+                                       entity.get_last_point())
+
+    def remove_entity_position(self, entity):
+        if entity.get_type() == 'COURIER':
+            self.couriers_index.remove(entity.get_uri())
+
+    def add_wakeup(self, time: float, uri: str):
+        """
+        Регистрирует пробуждение: агенту сущности uri нужен тик строго после момента time
+        :param time:
+        :param uri:
+        :return:
+        """
+        self.timers.add(time, uri)
+
+    def add_immediate_wakeup(self, uri: str):
+        """
+        Регистрирует пробуждение как можно раньше: на текущем тике, если агенты
+        сущностей uri еще не получили его, иначе на следующем
+        :param uri:
+        :return:
+        """
+        self.timers.add_immediate(uri)
+
+    def pop_immediate_wakeups(self) -> typing.Set[str]:
+        return self.timers.pop_immediate()
+
+    def has_immediate_wakeups(self) -> bool:
+        return bool(self.timers.immediate)
+
+    def get_next_wakeup(self) -> typing.Optional[float]:
+        """
+        Возвращает ближайший момент пробуждения или None
+        :return:
+        """
+        return self.timers.get_next_time()
+
+    def pop_wakeups(self, time: float) -> typing.Set[str]:
+        """
+        Удаляет пробуждения, которые будут обслужены тиком в момент time
+        :param time:
+        :return: идентификаторы сущностей, агентов которых нужно разбудить
+        """
+        return self.timers.pop_due(time)
+
+    def message_sent(self, count: int = 1):
+        self.messages_in_flight += count
+        self.message_stats.observe_backlog(self.messages_in_flight)
+
+    def message_received(self):
+        self.messages_in_flight -= 1
+        self.messages_received += 1
+
+    def open_negotiation(self, uri: str):
+        self.open_negotiations.add(uri)
+
+    def close_negotiation(self, uri: str):
+        self.open_negotiations.discard(uri)
+
+    def has_open_negotiations(self) -> bool:
+        return bool(self.open_negotiations)
     
     @property
     def time(self) -> float:
@@ -0,0 +1,181 @@
+"""Содержит пространственный индекс сущностей на равномерной сетке"""
+import math
+import typing
+from collections import defaultdict
+
+from point import Point
+
+
+class GridSpatialIndex:
+    """
+    Пространственный индекс: точки сущностей раскладываются по квадратным ячейкам сетки.
+    У сущности может быть несколько точек, расстоянием до нее считается расстояние до ближайшей из них.
+    Поиск ближайших просматривает ячейки кольцами вокруг ячейки запроса и останавливается,
+    как только непросмотренные ячейки заведомо дальше найденных точек. Границы занятых ячеек
+    поддерживаются при изменениях, поэтому запрос не перебирает все занятые ячейки.
+    """
+    def __init__(self, cell_size: float = 10.0):
+        """
+        :param cell_size: размер стороны ячейки сетки
+        """
+        self.cell_size = cell_size
+        # Ячейка -> идентификаторы сущностей в ней
+        self.cells: typing.Dict[typing.Tuple[int, int], typing.Set[str]] = defaultdict(set)
+        # Идентификатор сущности -> (точки, их ячейки без повторов)
+        self.positions: typing.Dict[str, typing.Tuple[typing.Tuple[Point, ...],
+                                                      typing.Tuple[typing.Tuple[int, int], ...]]] = {}
+        # Число занятых ячеек в каждом столбце и в каждой строке сетки и границы занятых ячеек
+        self._column_counts: typing.Dict[int, int] = defaultdict(int)
+        self._row_counts: typing.Dict[int, int] = defaultdict(int)
+        self._min_x = self._max_x = self._min_y = self._max_y = 0
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __contains__(self, uri: str):
+        return uri in self.positions
+
+    def _get_cell(self, point: Point) -> typing.Tuple[int, int]:
+        return math.floor(point.x / self.cell_size), math.floor(point.y / self.cell_size)
+
+    def update(self, uri: str, *points: Point):
+        """
+        Добавляет сущность в индекс или переносит ее в новые точки
+        :param uri:
+        :param points: точки сущности, хотя бы одна
+        :return:
+        """
+        cells = tuple(dict.fromkeys(self._get_cell(point) for point in points))
+        previous = self.positions.get(uri)
+        if previous is not None:
+            for cell in previous[1]:
+                if cell not in cells:
+                    self._discard_from_cell(uri, cell)
+        self.positions[uri] = (points, cells)
+        for cell in cells:
+            self._add_to_cell(uri, cell)
+
+    def remove(self, uri: str):
+        """
+        Удаляет сущность из индекса
+        :param uri:
+        :return:
+        """
+        previous = self.positions.pop(uri, None)
+        if previous is not None:
+            for cell in previous[1]:
+                self._discard_from_cell(uri, cell)
+
+    def _add_to_cell(self, uri: str, cell: typing.Tuple[int, int]):
+        cell_uris = self.cells.get(cell)
+        if cell_uris is None:
+            cell_uris = self.cells[cell] = set()
+            cell_x, cell_y = cell
+            if not self._column_counts and not self._row_counts:
+                self._min_x = self._max_x = cell_x
+                self._min_y = self._max_y = cell_y
+            else:
+                self._min_x, self._max_x = min(self._min_x, cell_x), max(self._max_x, cell_x)
+                self._min_y, self._max_y = min(self._min_y, cell_y), max(self._max_y, cell_y)
+            self._column_counts[cell_x] += 1
+            self._row_counts[cell_y] += 1
+        cell_uris.add(uri)
+
+    def _discard_from_cell(self, uri: str, cell: typing.Tuple[int, int]):
+        cell_uris = self.cells.get(cell)
+        if cell_uris is None:
+            return
+        cell_uris.discard(uri)
+        if not cell_uris:
+            del self.cells[cell]
+            cell_x, cell_y = cell
+            # Граница пересчитывается по числу столбцов или строк сетки, только если опустел крайний
+            if _decrement(self._column_counts, cell_x) and self._column_counts \
+                    and cell_x in (self._min_x, self._max_x):
+                self._min_x, self._max_x = min(self._column_counts), max(self._column_counts)
+            if _decrement(self._row_counts, cell_y) and self._row_counts \
+                    and cell_y in (self._min_y, self._max_y):
+                self._min_y, self._max_y = min(self._row_counts), max(self._row_counts)
+
+    def get_nearest(self, point: Point, count: int, max_distance: float = math.inf) -> typing.List[str]:
+        """
+        Возвращает идентификаторы не более count ближайших к точке сущностей
+        в радиусе max_distance, от ближайшей к дальней
+        :param point:
+        :param count:
+        :param max_distance:
+        :return:
+        """
+        if count <= 0 or not self.positions:
+            return []
+        center_x, center_y = self._get_cell(point)
+        # Кольцо, за которым ячеек с сущностями гарантированно нет
+        max_ring = max(center_x - self._min_x, self._max_x - center_x,
+                       center_y - self._min_y, self._max_y - center_y, 0)
+
+        # Идентификатор -> расстояние до ближайшей точки сущности
+        distances = {}
+        found = []
+        ring = 0
+        while ring <= max_ring:
+            for cell in self._get_ring_cells(center_x, center_y, ring):
+                for uri in self.cells.get(cell, ()):
+                    if uri in distances:
+                        continue
+                    distance = min(point.get_distance_to_other(entity_point)
+                                   for entity_point in self.positions[uri][0])
+                    distances[uri] = distance
+                    if distance <= max_distance:
+                        found.append((distance, uri))
+            # Все сущности за текущим кольцом дальше, чем ring * cell_size
+            ring_distance = ring * self.cell_size
+            if ring_distance > max_distance:
+                break
+            if len(found) >= count:
+                found.sort()
+                if found[count - 1][0] <= ring_distance:
+                    break
+            ring += 1
+        found.sort()
+        return [uri for _, uri in found[:count]]
+
+    def get_in_radius(self, point: Point, radius: float) -> typing.List[str]:
+        """
+        Возвращает идентификаторы сущностей в радиусе от точки, от ближайшей к дальней
+        :param point:
+        :param radius:
+        :return:
+        """
+        return self.get_nearest(point, len(self.positions), max_distance=radius)
+
+    def _get_ring_cells(self, center_x: int, center_y: int, ring: int):
+        """
+        Ячейки на расстоянии ring (по Чебышёву) от центральной
+        :param center_x:
+        :param center_y:
+        :param ring:
+        :return:
+        """
+        if ring == 0:
+            yield center_x, center_y
+            return
+        for cell_x in range(center_x - ring, center_x + ring + 1):
+            yield cell_x, center_y - ring
+            yield cell_x, center_y + ring
+        for cell_y in range(center_y - ring + 1, center_y + ring):
+            yield center_x - ring, cell_y
+            yield center_x + ring, cell_y
+
+
+def _decrement(counts: typing.Dict[int, int], key: int) -> bool:
+    """
+    Уменьшает счетчик и удаляет его при обнулении
+    :param counts:
+    :param key:
+    :return: обнулился ли счетчик
+    """
+    counts[key] -= 1
+    if counts[key]:
+        return False
+    del counts[key]
+    return True
@@ -0,0 +1,208 @@
+"""Содержит сервис состояния сцены, через который агенты читают и изменяют сущности"""
+import logging
+import os
+import threading
+import typing
+from multiprocessing.managers import BaseManager
+
+
+class StateService:
+    """
+    Единая точка доступа агентов к сцене и адресной книге.
+    Сущности запрашиваются по идентификатору (uri), изменения собственной сущности
+    агент фиксирует через commit_entity. В одном процессе агенты работают с теми же
+    объектами, что и сцена, в разных - с копиями, которые передаются через сервер состояния.
+    """
+    def __init__(self, scene, reference_book):
+        self.scene = scene
+        self.reference_book = reference_book
+        self._lock = threading.Lock()
+        # Система агентов останавливается, новые сообщения между агентами не нужны
+        self.is_stopping = False
+        # Тип сущности -> (версия реестра, адреса агентов не удаляемых сущностей)
+        self._addresses_by_type = {}
+
+    def connect(self):
+        """
+        Возвращает объект для работы с сервисом внутри агента
+        :return:
+        """
+        return self
+
+    def get_time(self) -> float:
+        return self.scene.time
+
+    def get_entity(self, uri: str):
+        """
+        Возвращает сущность по идентификатору
+        :param uri:
+        :return:
+        """
+        return self.scene.get_entity(uri)
+
+    def get_entity_by_id(self, entity_id: int):
+        """
+        Возвращает сущность по целочисленному идентификатору из адресной книги
+        :param entity_id:
+        :return:
+        """
+        return self.reference_book.get_entity_by_id(entity_id)
+
+    def get_entities_by_type(self, entity_type: str) -> typing.List:
+        if self.is_stopping:
+            return []
+        return self.scene.get_entities_by_type(entity_type)
+
+    def get_address(self, uri: str):
+        """
+        Возвращает адрес агента сущности с указанным идентификатором
+        :param uri:
+        :return:
+        """
+        entity = self.scene.get_entity(uri)
+        if entity is None:
+            logging.error(f'Сущность {uri} отсутствует на сцене')
+            return None
+        return self.reference_book.get_address(entity)
+
+    def get_address_by_id(self, entity_id: int):
+        """
+        Возвращает адрес агента сущности с указанным целочисленным идентификатором
+        :param entity_id:
+        :return:
+        """
+        agent_address = self.reference_book.get_address_by_id(entity_id)
+        if agent_address is None:
+            logging.error(f'Агент сущности {entity_id} отсутствует в адресной книге')
+        return agent_address
+
+    def get_addresses_by_type(self, entity_type: str) -> typing.List:
+        """
+        Возвращает адреса агентов всех не удаляемых сущностей заданного типа.
+        Адреса пересчитываются только после изменения реестра сущностей этого типа.
+        :param entity_type:
+        :return:
+        """
+        if self.is_stopping:
+            return []
+        version = self.scene.get_entities_version(entity_type)
+        cached = self._addresses_by_type.get(entity_type)
+        if cached is None or cached[0] != version:
+            addresses = [self.reference_book.get_address(entity)
+                         for entity in self.scene.get_entities_by_type(entity_type)]
+            cached = (version, addresses)
+            self._addresses_by_type[entity_type] = cached
+        return cached[1]
+
+    def get_nearest_courier_addresses(self, point, count: typing.Optional[int]) -> typing.List:
+        """
+        Возвращает адреса агентов count ближайших к точке курьеров, от ближайшего к дальнему
+        :param point:
+        :param count: число курьеров, None - все курьеры
+        :return:
+        """
+        if count is None:
+            return self.get_addresses_by_type('COURIER')
+        if self.is_stopping:
+            return []
+        return [self.get_address(uri) for uri in self.scene.couriers_index.get_nearest(point, count)]
+
+    def get_price_request_candidates(self) -> typing.Optional[int]:
+        return self.scene.price_request_candidates
+
+    def stop(self):
+        """
+        Отмечает остановку системы: при завершении агенты не будут оповещать друг друга
+        :return:
+        """
+        self.is_stopping = True
+
+    def commit_entity(self, entity):
+        """
+        Фиксирует состояние сущности, измененной агентом
+        :param entity:
+        :return:
+        """
+        self.scene.replace_entity(entity)
+        self.scene.update_entity_position(entity)
+
+    def message_handled(self, sent_count: int, samples: typing.Sequence[tuple] = ()):
+        """
+        Учитывает обработку агентом одного сообщения: отправленные им при обработке сообщения
+        и замеры обработчиков передаются одним обращением. Отправленные сообщения учитываются
+        вместе с обработанным, поэтому барьер не увидит ноль, пока они не доставлены
+        :param sent_count: сколько сообщений агент отправит после отметки
+        :param samples: замеры (класс агента, тип сообщения, время обработчика, задержка доставки)
+        :return:
+        """
+        with self._lock:
+            if sent_count:
+                self.scene.count_messages += sent_count
+                self.scene.message_sent(sent_count)
+            self.scene.message_received()
+            if samples:
+                self.scene.message_stats.record_samples(samples)
+
+    def add_wakeup(self, time: float, uri: str):
+        with self._lock:
+            self.scene.add_wakeup(time, uri)
+
+    def add_immediate_wakeup(self, uri: str):
+        with self._lock:
+            self.scene.add_immediate_wakeup(uri)
+
+    def open_negotiation(self, uri: str):
+        with self._lock:
+            self.scene.open_negotiation(uri)
+
+    def close_negotiation(self, uri: str):
+        with self._lock:
+            self.scene.close_negotiation(uri)
+
+
+class StateServiceManager(BaseManager):
+    """Менеджер, раздающий прокси сервиса состояния агентам в других процессах"""
+
+
+StateServiceManager.register('get_state_service')
+
+
+class StateServiceConnection:
+    """
+    Параметры подключения к серверу состояния. Передается агентам в сообщении инициализации.
+    """
+    def __init__(self, address, authkey: bytes):
+        self.address = address
+        self.authkey = authkey
+
+    def connect(self):
+        """
+        Подключается к серверу и возвращает прокси сервиса состояния
+        :return:
+        """
+        manager = StateServiceManager(address=self.address, authkey=self.authkey)
+        manager.connect()
+        return manager.get_state_service()
+
+
+class StateServer:
+    """
+    Сервер состояния: обслуживает обращения агентов из других процессов к сервису состояния
+    в отдельном потоке основного процесса
+    """
+    def __init__(self, state_service: StateService):
+        self.state_service = state_service
+        authkey = os.urandom(16)
+        manager_class = type('StateServerManager', (BaseManager,), {})
+        manager_class.register('get_state_service', callable=lambda: state_service)
+        # Адрес по умолчанию - сокет unix (канал в Windows): рукопожатие менеджера по TCP на localhost
+        # упирается в задержку подтверждений и стоит агенту около 250 мс при подключении
+        self.server = manager_class(authkey=authkey).get_server()
+        self.connection = StateServiceConnection(self.server.address, authkey)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def shutdown(self):
+        stop_event = getattr(self.server, 'stop_event', None)
+        if stop_event is not None:
+            stop_event.set()
@@ -0,0 +1,99 @@
+"""Содержит колесо таймеров, по которым агенты просят их разбудить"""
+import heapq
+import math
+import typing
+
+
+class TimerWheel:
+    """
+    Колесо таймеров: таймеры раскладываются по ячейкам длиной в шаг симуляции,
+    номер ячейки - номер шага, в который попадает время таймера.
+    Номера непустых ячеек хранятся в куче, поэтому выборка сработавших таймеров
+    и поиск ближайшего стоят пропорционально числу таймеров, а не числу шагов или агентов.
+    Таймер на момент time срабатывает на первом тике строго после time.
+    Кроме таймеров, агент может попросить тик как можно раньше - в текущем обходе агентов,
+    если обход до него еще не дошел, иначе на следующем тике.
+    """
+    def __init__(self, slot_size: float = 1.0):
+        """
+        :param slot_size: длина ячейки колеса, обычно равна шагу симуляции
+        """
+        self.slot_size = slot_size
+        # Номер ячейки -> таймеры (время, идентификатор сущности агента)
+        self.slots: typing.Dict[int, typing.List[typing.Tuple[float, str]]] = {}
+        # Номера непустых ячеек (куча)
+        self._slot_numbers: typing.List[int] = []
+        self._count = 0
+        # Идентификаторы сущностей агентов, которые просят тик как можно раньше
+        self.immediate: typing.Set[str] = set()
+
+    def __len__(self):
+        return self._count
+
+    def _get_slot_number(self, time: float) -> int:
+        return math.floor(time / self.slot_size)
+
+    def add(self, time: float, uri: str):
+        """
+        Ставит таймер агента сущности uri на момент time
+        :param time:
+        :param uri:
+        :return:
+        """
+        slot_number = self._get_slot_number(time)
+        slot = self.slots.get(slot_number)
+        if slot is None:
+            slot = self.slots[slot_number] = []
+            heapq.heappush(self._slot_numbers, slot_number)
+        slot.append((time, uri))
+        self._count += 1
+
+    def add_immediate(self, uri: str):
+        """
+        Просит тик для агента сущности uri как можно раньше
+        :param uri:
+        :return:
+        """
+        self.immediate.add(uri)
+
+    def pop_immediate(self) -> typing.Set[str]:
+        immediate = self.immediate
+        self.immediate = set()
+        return immediate
+
+    def get_next_time(self) -> typing.Optional[float]:
+        """
+        Возвращает время ближайшего таймера или None
+        :return:
+        """
+        if not self._slot_numbers:
+            return None
+        return min(time for time, _ in self.slots[self._slot_numbers[0]])
+
+    def pop_due(self, time: float) -> typing.Set[str]:
+        """
+        Снимает таймеры, которые обслуживает тик в момент time (их время строго меньше time)
+        :param time:
+        :return: идентификаторы сущностей, агентов которых нужно разбудить
+        """
+        due = set()
+        last_slot_number = self._get_slot_number(time)
+        while self._slot_numbers and self._slot_numbers[0] <= last_slot_number:
+            slot_number = self._slot_numbers[0]
+            slot = self.slots[slot_number]
+            # В ячейке тика могут быть таймеры на момент самого тика и позже
+            remaining = [timer for timer in slot if timer[0] >= time]
+            due.update(uri for timer_time, uri in slot if timer_time < time)
+            self._count -= len(slot) - len(remaining)
+            if remaining:
+                self.slots[slot_number] = remaining
+                break
+            heapq.heappop(self._slot_numbers)
+            del self.slots[slot_number]
+        return due
+
+    def clear(self):
+        self.slots.clear()
+        self._slot_numbers.clear()
+        self._count = 0
+        self.immediate.clear()
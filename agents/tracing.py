@@ -0,0 +1,170 @@
+"""
+Содержит трассировку работы агентов: типизированные события пишутся в кольцевой буфер,
+а строки сообщений собираются только при выгрузке буфера
+"""
+import logging
+import time
+import typing
+from enum import Enum, IntEnum
+
+
+class TraceLevel(IntEnum):
+    """Уровни событий трассировки, совпадают с уровнями logging"""
+    DEBUG = logging.DEBUG
+    INFO = logging.INFO
+    WARNING = logging.WARNING
+
+
+class TraceEvent(Enum):
+    """
+    События трассировки: уровень и шаблон сообщения.
+    В шаблон подставляются источник события (source) и аргументы события по порядку.
+    """
+    AGENT_INITIALIZED = (TraceLevel.INFO, '{source} проинициализирован')
+    AGENT_EXIT_REQUESTED = (TraceLevel.INFO, '{source} получил сообщение - ActorExitRequest')
+    AGENT_DELETED = (TraceLevel.INFO, '{source} получил сообщение об удалении')
+    # Агент курьера
+    PRICE_CALCULATED = (TraceLevel.INFO, '{source} - заказ {0} надо пронести {1}, к нему идти {2}, '
+                                         'это займет {3} и будет стоить {4}')
+    JIT_CONFLICT = (TraceLevel.INFO, '{source}: обнаружен конфликт для JIT-варианта заказа {0}, запускаю анализ')
+    JIT_START_IN_PAST = (TraceLevel.INFO, '{source}: идеальный JIT-старт ({1:.2f}) для заказа {0} '
+                                          'находится в прошлом (тек. время {2:.2f})')
+    DISPLACEMENT_FOUND = (TraceLevel.INFO, '{source} нашел вариант вытеснить заказ {0} для {1}')
+    SHIFT_CHAIN_ORDER_STARTED = (TraceLevel.INFO, '{source}: цепочка сдвига прервана, заказ {0} уже выполняется')
+    SHIFT_CHAIN_DEADLINE_MISSED = (TraceLevel.INFO, '{source}: цепочка сдвига прервана, '
+                                                    'заказ {0} не уложится в дедлайн')
+    SHIFT_CHAIN_BUILT = (TraceLevel.INFO, '{source} построил цепочку сдвига из {0} заказов для {1}')
+    DISPLACEMENT_STARTED = (TraceLevel.INFO, '{source} пытается вытеснить {0} для нового заказа')
+    SHIFT_STARTED = (TraceLevel.INFO, '{source} пытается выполнить сдвиг {0} заказов')
+    PLANNING_REQUEST_HANDLED = (TraceLevel.INFO, '{source} получил запрос на размещение заказа {0} ({1}), '
+                                                 'результат - {2}')
+    # Агент заказа
+    ORDER_REMOVED_FROM_SCHEDULE = (TraceLevel.INFO, '{source} - удален из расписания курьера {0}')
+    COURIER_DELETED = (TraceLevel.INFO, '{source} - узнал об удалении курьера {0}')
+    COURIER_ADDED = (TraceLevel.INFO, '{source} - узнал о новом курьере {0}')
+    PLANNING_RESPONSE_RECEIVED = (TraceLevel.INFO, '{source} - получил результат размещения у курьера {0}: {1}')
+    ORDER_PLANNED = (TraceLevel.INFO, '{source} доволен, ничего делать не надо')
+    PRICE_REQUESTS_SENT = (TraceLevel.INFO, '{source} - запросил цены у курьеров: {0}')
+    VARIANTS_EVALUATED = (TraceLevel.INFO, '{source} минимальный старт: {0}, минимальное завершение - {1}, '
+                                           'минимальная цена - {2}')
+    NO_VARIANTS = (TraceLevel.INFO, '{source} - нет возможных вариантов для планирования')
+    VARIANTS_SORTED = (TraceLevel.DEBUG, '{source} - варианты от лучшего к худшему (курьер, вариант, оценка): {0}')
+    BEST_VARIANT_CHOSEN = (TraceLevel.INFO, '{source} - лучшим вариантом признан {1} у курьера {0}, '
+                                            'цена - {2}, оценка - {3}')
+    # Сущность курьера
+    SCHEDULE_CONFLICT = (TraceLevel.INFO, '{source} - не могу добавить записи на интервал - {0} - {1}, '
+                                          'число конфликтов - {2}')
+    # Симулятор
+    SCRIPT_EVENT = (TraceLevel.DEBUG, 'Событие {0.value}: {1}')
+
+    def __init__(self, level: TraceLevel, template: str):
+        self.level = level
+        self.template = template
+
+
+class Tracer:
+    """
+    Трассировщик с кольцевым буфером: массивы буфера выделяются заранее, запись события -
+    проверка уровня и несколько присваиваний, а шаблон события подставляется только при выгрузке.
+    Источник и аргументы событий - неизменяемые значения: имена, идентификаторы, числа, перечисления
+    и кортежи из них. Живые агенты и сущности в буфер не передаются: буфер не дал бы их освободить,
+    а при выгрузке показал бы их состояние на момент выгрузки, а не события.
+    По умолчанию уровень берется из настройки корневого журнала, поэтому события, которые журнал
+    отбросил бы, не записываются. Когда буфер заполнен, новые события вытесняют самые старые.
+    """
+    DEFAULT_CAPACITY = 1 << 16
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY, level: typing.Optional[int] = None):
+        """
+        :param capacity: число хранимых событий
+        :param level: минимальный уровень записываемых событий, None - уровень корневого журнала
+        """
+        self.capacity = capacity
+        self.level = level
+        self._timestamps = [0.0] * capacity
+        self._events: typing.List[typing.Optional[TraceEvent]] = [None] * capacity
+        self._sources: typing.List[typing.Any] = [None] * capacity
+        self._args: typing.List[tuple] = [()] * capacity
+        # Число записанных событий за все время, позиция записи - остаток от деления на емкость
+        self._position = 0
+
+    def __len__(self):
+        return min(self._position, self.capacity)
+
+    def is_enabled(self, event: TraceEvent) -> bool:
+        """
+        Будет ли записано событие - для событий, аргументы которых дорого вычислять
+        :param event:
+        :return:
+        """
+        if self.level is None:
+            return logging.getLogger().isEnabledFor(event.level)
+        return event.level >= self.level
+
+    def trace(self, event: TraceEvent, source, *args):
+        """
+        Записывает событие в буфер
+        :param event:
+        :param source: источник события - имя агента или сущности
+        :param args: аргументы шаблона события - неизменяемые значения
+        :return:
+        """
+        if not self.is_enabled(event):
+            return
+        index = self._position % self.capacity
+        self._timestamps[index] = time.perf_counter()
+        self._events[index] = event
+        self._sources[index] = source
+        self._args[index] = args
+        self._position += 1
+
+    def records(self) -> typing.Iterator[typing.Tuple[float, TraceEvent, typing.Any, tuple]]:
+        """
+        Возвращает события буфера (время, событие, источник, аргументы) от старых к новым
+        :return:
+        """
+        start = max(0, self._position - self.capacity)
+        for position in range(start, self._position):
+            index = position % self.capacity
+            yield self._timestamps[index], self._events[index], self._sources[index], self._args[index]
+
+    def dump(self) -> typing.List[typing.Tuple[TraceLevel, str]]:
+        """
+        Форматирует события буфера от старых к новым
+        :return: пары (уровень, строка)
+        """
+        lines = []
+        for timestamp, event, source, args in self.records():
+            try:
+                text = event.template.format(*args, source=source)
+            except Exception as ex:
+                text = f'{event.name} {source} {args!r} (ошибка форматирования: {ex})'
+            lines.append((event.level, f'{timestamp:.6f} {text}'))
+        return lines
+
+    def dump_to_log(self, logger: logging.Logger = None, clear: bool = True):
+        """
+        Выгружает события буфера в журнал
+        :param logger: журнал, по умолчанию корневой
+        :param clear: очистить буфер после выгрузки
+        :return:
+        """
+        logger = logger or logging.getLogger()
+        for level, line in self.dump():
+            logger.log(level, line)
+        if clear:
+            self.clear()
+
+    def clear(self):
+        # Очищаются только занятые ячейки: буфер очищается при завершении каждого агента
+        used_count = len(self)
+        self._events[:used_count] = [None] * used_count
+        self._sources[:used_count] = [None] * used_count
+        self._args[:used_count] = [()] * used_count
+        self._position = 0
+
+
+# Трассировщик процесса. В многопроцессной системе у каждого процесса агентов свой буфер,
+# агенты выгружают его в журнал при завершении (AgentBase.receiveMessage).
+# При общей памяти буфер выгружает запускающий код после остановки системы
+tracer = Tracer()
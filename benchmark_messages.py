@@ -0,0 +1,138 @@
+"""
+Замер размера и времени сериализации сообщений агентов.
+Сообщения перехватываются в ходе симуляции и в момент отправки сериализуются pickle дважды:
+в текущем компактном виде (идентификаторы сущностей и числа) и в прежнем виде -
+с сущностями заказов и курьеров внутри сообщений, как они передавались бы между процессами.
+"""
+import argparse
+import logging
+import pickle
+import random
+import time
+from collections import defaultdict
+
+from agents.messages import MessageType, Message, Variant, PlanningResult
+from agents.runtime import LocalRuntime
+from utils.generators import generate_orders, generate_couriers
+from utils.script import Script
+from utils.simulator import Simulator
+
+
+class RecordingRuntime(LocalRuntime):
+    """Локальная среда исполнения, которая замеряет сериализацию каждого сообщения агентов"""
+    def __init__(self):
+        super().__init__()
+        self.simulator = None
+        # Тип сообщения -> [число, байт, секунд] в компактном и прежнем виде
+        self.compact_stats = defaultdict(lambda: [0, 0, 0.0])
+        self.legacy_stats = defaultdict(lambda: [0, 0, 0.0])
+
+    def enqueue(self, agent_address, message, sender=None):
+        if sender is not None and isinstance(message, Message):
+            self._measure(message)
+        super().enqueue(agent_address, message, sender)
+
+    def _measure(self, message: Message):
+        legacy_message = to_legacy_message(message, self.simulator.dispatcher.reference_book)
+        for stats, measured in ((self.compact_stats, message), (self.legacy_stats, legacy_message)):
+            start_time = time.perf_counter()
+            size = len(pickle.dumps(measured, protocol=pickle.HIGHEST_PROTOCOL))
+            record = stats[message.msg_type]
+            record[0] += 1
+            record[1] += size
+            record[2] += time.perf_counter() - start_time
+
+
+def to_legacy_variant(variant: Variant, reference_book) -> dict:
+    """
+    Вариант в прежнем виде: словарь с сущностями курьера и заказов
+    :param variant:
+    :param reference_book:
+    :return:
+    """
+    entities = reference_book.entities
+    order = entities[variant.order_id]
+    legacy_variant = {
+        'courier': entities[variant.courier_id], 'time_from': variant.time_from, 'time_to': variant.time_to,
+        'price': variant.price, 'order': order, 'variant_name': variant.variant_name,
+    }
+    if variant.variant_name == 'asap':
+        legacy_variant['changes'] = {
+            'add_to_shedule': {'order': order, 'start_time': variant.time_from,
+                               'end_time': variant.time_to, 'price': variant.price}
+        }
+    if variant.displaced_order_id is not None:
+        legacy_variant['order_to_displace'] = entities[variant.displaced_order_id]
+    if variant.shift_chain:
+        legacy_variant['shift_chain'] = [{'order': entities[item.order_id], 'new_start': item.new_start,
+                                          'new_end': item.new_end} for item in variant.shift_chain]
+    if variant.total_efficiency is not None:
+        legacy_variant.update(start_efficiency=variant.start_efficiency, finish_efficiency=variant.finish_efficiency,
+                              price_efficiency=variant.price_efficiency, total_efficiency=variant.total_efficiency)
+    return legacy_variant
+
+
+def to_legacy_message(message: Message, reference_book) -> Message:
+    """
+    Сообщение в прежнем виде
+    :param message:
+    :param reference_book:
+    :return:
+    """
+    body = message.msg_body
+    if message.msg_type == MessageType.PRICE_RESPONSE:
+        body = [to_legacy_variant(variant, reference_book) for variant in body]
+    elif message.msg_type == MessageType.PLANNING_REQUEST:
+        body = to_legacy_variant(body, reference_book)
+    elif message.msg_type == MessageType.PLANNING_RESPONSE:
+        result: PlanningResult = body
+        body = to_legacy_variant(result.variant, reference_book)
+        body['success'] = result.success
+    elif isinstance(body, int):
+        # Запрос цены и сообщения об изменениях курьера передавали сущность целиком
+        body = reference_book.entities[body]
+    return Message(message.msg_type, body)
+
+
+def print_stats(title: str, stats: dict):
+    print(title)
+    print(f'{"Тип сообщения":<32}{"Число":>8}{"Байт всего":>14}{"Байт в среднем":>16}{"мкс в среднем":>16}')
+    total_count = total_size = 0
+    total_time = 0.0
+    for message_type, (count, size, seconds) in sorted(stats.items(), key=lambda item: item[0].value):
+        print(f'{message_type.value:<32}{count:>8}{size:>14}{size / count:>16.1f}{seconds / count * 1e6:>16.2f}')
+        total_count += count
+        total_size += size
+        total_time += seconds
+    if total_count:
+        print(f'{"Всего":<32}{total_count:>8}{total_size:>14}{total_size / total_count:>16.1f}'
+              f'{total_time / total_count * 1e6:>16.2f}')
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Размер и время сериализации сообщений агентов')
+    parser.add_argument('--orders', type=int, default=200)
+    parser.add_argument('--couriers', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.CRITICAL)
+
+    random.seed(args.seed)
+    script = Script()
+    script.load_orders_from_dicts(generate_orders(num_orders=args.orders, max_appearance_time=200,
+                                                  avg_courier_speed=4))
+    script.load_couriers_from_dicts(generate_couriers(num_couriers=args.couriers, velocity_range=(2.0, 4.0)))
+
+    runtime = RecordingRuntime()
+    simulator = Simulator(script, tick_size=1, time_stop=240, event_driven=True, runtime=runtime)
+    runtime.simulator = simulator
+    simulator.run()
+    simulator.dispatcher.shutdown()
+
+    print_stats('Компактные сообщения (идентификаторы сущностей)', runtime.compact_stats)
+    print_stats('Прежние сообщения (сущности внутри сообщений)', runtime.legacy_stats)
+
+
+if __name__ == '__main__':
+    main()
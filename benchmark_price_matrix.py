@@ -0,0 +1,124 @@
+"""
+Замер и сверка векторного расчета ASAP-вариантов (utils.price_matrix) с расчетом агента курьера.
+Симуляция останавливается в момент --time, после чего для всех пар курьер × заказ
+ASAP-варианты считаются CourierAgent._get_asap_variant и calculate_asap_matrix.
+Расхождение выполнимости или значений больше допуска завершает скрипт ошибкой.
+"""
+import argparse
+import logging
+import random
+import time
+
+import numpy as np
+
+from agents.courier_agent import CourierAgent
+from utils.generators import generate_orders, generate_couriers
+from utils.price_matrix import get_couriers_state, get_orders_state, calculate_asap_matrix
+from utils.script import Script
+from utils.simulator import Simulator
+
+# Допуск сверки: np.hypot и math.dist могут расходиться в последнем бите
+TOLERANCE = 1e-9
+
+
+def get_agent_matrices(couriers, orders, state) -> dict:
+    """
+    Считает ASAP-варианты всех пар курьер × заказ расчетом агента курьера
+    :param couriers:
+    :param orders:
+    :param state: сервис состояния сцены
+    :return: матрицы time_from, time_to, price и is_feasible
+    """
+    shape = (len(couriers), len(orders))
+    matrices = {name: np.full(shape, np.nan) for name in ('time_from', 'time_to', 'price')}
+    matrices['is_feasible'] = np.zeros(shape, dtype=bool)
+    order_ids = {order: order_id for order_id, order in enumerate(orders)}
+    for courier_id, courier in enumerate(couriers):
+        agent = CourierAgent()
+        agent.entity = courier
+        agent.entity_id = courier_id
+        agent.state = state
+        agent.order_ids = order_ids
+        for order_id, order in enumerate(orders):
+            # Проверка грузоподъемности выполняется агентом до расчета вариантов
+            if order.weight > courier.max_mass:
+                continue
+            variants = agent._get_asap_variant(order)
+            if not variants:
+                continue
+            variant = variants[0]
+            matrices['is_feasible'][courier_id, order_id] = True
+            matrices['time_from'][courier_id, order_id] = variant.time_from
+            matrices['time_to'][courier_id, order_id] = variant.time_to
+            matrices['price'][courier_id, order_id] = variant.price
+    return matrices
+
+
+def check_parity(agent_matrices: dict, kernel_matrix) -> float:
+    """
+    Сверяет матрицы агента и векторного расчета
+    :param agent_matrices:
+    :param kernel_matrix:
+    :return: наибольшее относительное расхождение значений
+    """
+    is_feasible = agent_matrices['is_feasible']
+    mismatched = np.argwhere(is_feasible != kernel_matrix.is_feasible)
+    if len(mismatched):
+        raise AssertionError(f'Выполнимость расходится для {len(mismatched)} пар, первые: {mismatched[:5].tolist()}')
+    max_error = 0.0
+    for name in ('time_from', 'time_to', 'price'):
+        expected = agent_matrices[name][is_feasible]
+        actual = getattr(kernel_matrix, name)[is_feasible]
+        error = np.abs(actual - expected) / np.maximum(np.abs(expected), 1.0)
+        if len(error):
+            max_error = max(max_error, float(error.max()))
+        if not np.allclose(actual, expected, rtol=TOLERANCE, atol=TOLERANCE):
+            raise AssertionError(f'Значения {name} расходятся: наибольшее относительное расхождение {error.max():.3e}')
+    return max_error
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Замер и сверка векторного расчета ASAP-вариантов')
+    parser.add_argument('--orders', type=int, default=400)
+    parser.add_argument('--couriers', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--time', type=float, default=120, help='момент остановки симуляции')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.CRITICAL)
+
+    random.seed(args.seed)
+    script = Script()
+    script.load_orders_from_dicts(generate_orders(num_orders=args.orders, max_appearance_time=200,
+                                                  avg_courier_speed=4))
+    script.load_couriers_from_dicts(generate_couriers(num_couriers=args.couriers, velocity_range=(2.0, 4.0)))
+    simulator = Simulator(script, tick_size=1, time_stop=args.time, event_driven=True, runtime='local')
+    simulator.run()
+
+    state = simulator.dispatcher.state_service
+    couriers = list(simulator.scene.get_entities_by_type('COURIER'))
+    orders = list(simulator.scene.get_entities_by_type('ORDER'))
+    current_time = state.get_time()
+
+    agent_seconds = kernel_seconds = float('inf')
+    for _ in range(args.repeat):
+        start_time = time.perf_counter()
+        agent_matrices = get_agent_matrices(couriers, orders, state)
+        agent_seconds = min(agent_seconds, time.perf_counter() - start_time)
+
+        start_time = time.perf_counter()
+        kernel_matrix = calculate_asap_matrix(get_couriers_state(couriers, current_time), get_orders_state(orders))
+        kernel_seconds = min(kernel_seconds, time.perf_counter() - start_time)
+    simulator.dispatcher.shutdown()
+
+    max_error = check_parity(agent_matrices, kernel_matrix)
+    pairs_count = len(couriers) * len(orders)
+    print(f'Пар курьер × заказ: {pairs_count}, выполнимых: {int(agent_matrices["is_feasible"].sum())}, '
+          f'время симуляции: {current_time}')
+    print(f'Расчет агента: {agent_seconds * 1e3:.2f} мс, векторный расчет: {kernel_seconds * 1e3:.2f} мс, '
+          f'ускорение: {agent_seconds / kernel_seconds:.1f}x')
+    print(f'Наибольшее относительное расхождение: {max_error:.3e} (допуск {TOLERANCE})')
+
+
+if __name__ == '__main__':
+    main()
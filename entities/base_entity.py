@@ -12,11 +12,37 @@ class BaseEntity:
         self.uri = 'UNKNOWN_URI'
         self.scene = scene
         # Флаг, показывающий, что сущность вместе со своим агентов находятся в процессе удаления
-        self.is_deleting = False
+        self._is_deleting = False
+
+    @property
+    def is_deleting(self) -> bool:
+        return self._is_deleting
+
+    @is_deleting.setter
+    def is_deleting(self, value: bool):
+        self._is_deleting = value
+        # Реестр сцены должен знать, что сущность больше не считается живой
+        if self.scene is not None:
+            self.scene.entity_deleting_changed(self)
 
     def __repr__(self):
         return 'Entity ' + str(self.name)
 
+    def __eq__(self, other):
+        # Агенты в разных процессах работают с копиями сущностей, поэтому сравниваем по идентификатору
+        if not isinstance(other, BaseEntity):
+            return NotImplemented
+        return self.get_uri() == other.get_uri()
+
+    def __hash__(self):
+        return hash(self.get_uri())
+
+    def __getstate__(self):
+        # Сцена не передается вместе с сущностью в другие процессы
+        state = self.__dict__.copy()
+        state['scene'] = None
+        return state
+
     def get_relations(self):
         """
         Возвращает связи сущности в виде словаря.
@@ -1,16 +1,25 @@
 """
 Описание курьера.
 """
+import bisect
 import logging
 import typing
 from dataclasses import dataclass
 
+from agents.tracing import tracer, TraceEvent
 from entities.base_entity import BaseEntity
 from entities.order_entity import OrderEntity
+from entities.schedule import Schedule
 from point import Point
 import copy
 
 EPSILON = 0.0000001
+# Колонки выгрузки расписания курьеров
+SCHEDULE_COLUMNS = ('resource_id', 'resource_name', 'task_id', 'task_name', 'type', 'from', 'to',
+                    'start_time', 'end_time', 'ideal_end_time', 'cost', 'is_move_to_charge', 'charge_on_end',
+                    'creator')
+# Проверять инкрементальную расстановку зарядок полным проходом auto_add_charge
+CHARGE_DIFFERENTIAL_CHECK = False
 
 
 @dataclass
@@ -76,7 +85,18 @@ class CourierEntity(BaseEntity):
 
         self.uri = 'Courier' + str(self.number)
 
-        self.schedule: typing.List[ScheduleItem] = []
+        self.schedule: Schedule = Schedule()
+
+    @property
+    def schedule(self) -> Schedule:
+        return self._schedule
+
+    @schedule.setter
+    def schedule(self, records: typing.List[ScheduleItem]):
+        # Расписание всегда хранится в индексируемом контейнере
+        if not isinstance(records, Schedule):
+            records = Schedule(records)
+        self._schedule = records
 
     def __repr__(self):
         return 'Курьер ' + str(self.name)
@@ -108,7 +128,7 @@ class CourierEntity(BaseEntity):
         :return:
         """
         result = []
-        for item in self.schedule:
+        for item in self.schedule.get_overlapping(start_time, end_time):
             if start_time <= item.start_time < end_time or \
                     (start_time < item.end_time <= end_time and item.start_time != item.end_time) or \
                     item.start_time <= start_time < item.end_time or item.start_time < end_time <= item.end_time:
@@ -132,7 +152,7 @@ class CourierEntity(BaseEntity):
         :param order:
         :return:
         """
-        result: typing.List[ScheduleItem] = [rec for rec in self.schedule if rec.order == order]
+        result: typing.List[ScheduleItem] = self.schedule.get_order_records(order)
         return result
     
     def get_consumption_by_distance(self, distance: float, order: OrderEntity = None) -> float:
@@ -222,32 +242,34 @@ class CourierEntity(BaseEntity):
             if conflict.is_move_to_charge:
                 self.schedule.remove(conflict)
         if conflicts:
-            logging.info(f'{self} - не могу добавить записи на интервал - {start_time} - {end_time},'
-                         f' конфликты - {conflicts}')
+            tracer.trace(TraceEvent.SCHEDULE_CONFLICT, self.name, start_time, end_time, len(conflicts))
             return False
         
+        # Пробное добавление: если заряда не хватит, изменения откатываются
+        self.schedule.begin()
         try:
-            test_shedule = copy.deepcopy(self.schedule)
+            new_items = [schedule_item]
             if abs(schedule_item_to_order.start_time - schedule_item_to_order.end_time) > EPSILON:
-                test_shedule.append(schedule_item_to_order)
-            test_shedule.append(schedule_item)
-            test_shedule.sort(key=lambda rec: rec.start_time)
-            test_shedule, _ = auto_add_charge(test_shedule, self)
-            charge = get_charge_at_time(test_shedule, get_last_time(test_shedule), courier=self, raise_error=True)
+                self.schedule.append(schedule_item_to_order)
+                new_items.append(schedule_item_to_order)
+            self.schedule.append(schedule_item)
+            # if abs(waiting_item_with_order.start_time - waiting_item_with_order.end_time) > EPSILON:
+            #     self.schedule.append(waiting_item_with_order)
+            self.schedule.sort(key=lambda rec: rec.start_time)
+            new_positions = get_record_positions(self.schedule, new_items)
+            self.schedule, _ = auto_add_charge(self.schedule, self, min(new_positions), max(new_positions))
+            charge = get_charge_at_time(self.schedule, get_last_time(self.schedule), courier=self, raise_error=True)
 
         except ValueError as e:
+            self.schedule.rollback()
             logging.warning(f'{self} - не могу добавить записи на интервал - {start_time} - {end_time},'
                          f' Заряд слишком низкий')
             return False
+        except Exception:
+            self.schedule.rollback()
+            raise
 
-
-        if abs(schedule_item_to_order.start_time - schedule_item_to_order.end_time) > EPSILON:
-            self.schedule.append(schedule_item_to_order)
-        self.schedule.append(schedule_item)
-        # if abs(waiting_item_with_order.start_time - waiting_item_with_order.end_time) > EPSILON:
-        #     self.schedule.append(waiting_item_with_order)
-        self.schedule.sort(key=lambda rec: rec.start_time)
-        self.schedule, _ = auto_add_charge(self.schedule, self)
+        self.schedule.commit()
         return True
 
     def get_last_point(self) -> Point:
@@ -266,6 +288,20 @@ class CourierEntity(BaseEntity):
     def get_point_at_time(self, time: float) -> Point:
         return get_point_at_time(self, self.schedule, time)
 
+    def get_current_point(self, time: float) -> Point:
+        """
+        Возвращает положение курьера в момент time: во время записи расписания - точку на отрезке
+        между началом и концом записи, между записями - конец предыдущей записи
+        :param time:
+        :return:
+        """
+        for record in self.schedule.get_overlapping(time, time):
+            if record.start_time <= time < record.end_time:
+                fraction = (time - record.start_time) / (record.end_time - record.start_time)
+                return Point(record.point_from.x + (record.point_to.x - record.point_from.x) * fraction,
+                             record.point_from.y + (record.point_to.y - record.point_from.y) * fraction)
+        return get_point_at_time(self, self.schedule, time)
+
     def get_last_time(self, consider_charge: bool = True) -> int:
         """
         Возвращает время, когда курьер может приступить к выполнению заказа
@@ -283,59 +319,54 @@ class CourierEntity(BaseEntity):
         Сериализация расписания курьера
         :return:
         """
+        columns = {name: [] for name in SCHEDULE_COLUMNS}
+        self.append_schedule_columns(columns)
         result = []
-        # if self.schedule and self.schedule[0].start_time != 0:
-        #     # Формируем в расписании ожидание в начальной точке
-        #     next_record = self.schedule[0]
-        #     downtime_record = ScheduleItem(next_record.order, 'Ожидание', 0, next_record.start_time,
-        #                                    self.init_point, self.init_point, 0, {})
-        #     self.schedule.insert(0, downtime_record)
-        # for number, record in enumerate(self.schedule):
-        #     if number == len(self.schedule) - 1:
-        #         break
-        #     next_record = self.schedule[number + 1]
-        #     if record.end_time != next_record.start_time:
-        #         # Формируем в расписании ожидание в точке, где отдали заказ.
-        #         downtime_record = ScheduleItem(record.order, 'Ожидание', record.end_time, next_record.start_time,
-        #                                        record.point_to, record.point_to, 0, record.all_params)
-        #         self.schedule.append(downtime_record)
-        self.schedule.sort(key=lambda rec: (rec.start_time, rec.end_time))
-        for rec in self.schedule:
-            if rec.is_move_to_charge:
-                json_record = {
-                    'resource_id': self.number,
-                    'resource_name': self.name,
-                    'task_id': None,
-                    'task_name': None,
-                    'type': rec.rec_type,
-                    'from': str(rec.point_from),
-                    'to': str(rec.point_to),
-                    'start_time': rec.start_time,
-                    'end_time': rec.end_time,
-                    'cost': rec.cost,
-                    "is_move_to_charge": rec.is_move_to_charge,
-                    "creator": rec.creator
-                }
-            else:
-                json_record = {
-                    'resource_id': self.number,
-                    'resource_name': self.name,
-                    'task_id': rec.order.number,
-                    'task_name': rec.order.name,
-                    'type': rec.rec_type,
-                    'from': str(rec.point_from),
-                    'to': str(rec.point_to),
-                    'start_time': rec.start_time,
-                    'end_time': rec.end_time,
-                    'ideal_end_time': rec.order.time_to,
-                    'cost': rec.cost,
-                    "is_move_to_charge": rec.is_move_to_charge,
-                    "charge_on_end": self.get_charge_at_time(rec.end_time),
-                    "creator": rec.creator
-                }
+        for values in zip(*columns.values()):
+            json_record = dict(zip(SCHEDULE_COLUMNS, values))
+            if json_record['is_move_to_charge']:
+                # Для движения на зарядку заказ и заряд не выгружаются
+                del json_record['ideal_end_time']
+                del json_record['charge_on_end']
             result.append(json_record)
         return result
 
+    def append_schedule_columns(self, columns: typing.Dict[str, list]):
+        """
+        Дописывает расписание курьера в колонки выгрузки (SCHEDULE_COLUMNS) за один проход:
+        заряд на конец записей переносится от записи к записи, словари записей не создаются
+        :param columns: имя колонки -> список значений
+        :return:
+        """
+        self.schedule.sort(key=lambda rec: (rec.start_time, rec.end_time))
+        charges = get_charge_timeline(self.schedule, self).get_charges_at_ends()
+        count = len(self.schedule)
+        columns['resource_id'].extend([self.number] * count)
+        columns['resource_name'].extend([self.name] * count)
+        task_id, task_name, ideal_end_time = columns['task_id'], columns['task_name'], columns['ideal_end_time']
+        is_move_to_charge, charge_on_end = columns['is_move_to_charge'], columns['charge_on_end']
+        for rec, charge in zip(self.schedule, charges):
+            order = rec.order
+            if order is None:
+                task_id.append(None)
+                task_name.append(None)
+                ideal_end_time.append(None)
+                is_move_to_charge.append(True)
+                charge_on_end.append(None)
+            else:
+                task_id.append(order.number)
+                task_name.append(order.name)
+                ideal_end_time.append(order.time_to)
+                is_move_to_charge.append(False)
+                charge_on_end.append(charge)
+        columns['type'].extend([rec.rec_type for rec in self.schedule])
+        columns['from'].extend([str(rec.point_from) for rec in self.schedule])
+        columns['to'].extend([str(rec.point_to) for rec in self.schedule])
+        columns['start_time'].extend([rec.start_time for rec in self.schedule])
+        columns['end_time'].extend([rec.end_time for rec in self.schedule])
+        columns['cost'].extend([rec.cost for rec in self.schedule])
+        columns['creator'].extend([rec.creator for rec in self.schedule])
+
 def get_consumption_by_distance(courier: CourierEntity, distance: float, order: OrderEntity = None) -> float:
         """Рассчитывает расход энергии на полет заданной дистанции."""
         flight_time = distance / courier.velocity
@@ -351,6 +382,9 @@ def get_consumption_by_time(courier: CourierEntity, flight_time: float, order: O
         return base_consumption
 
 def get_charge_at_time(schedule: typing.List[ScheduleItem], time: float, courier: CourierEntity, raise_error: bool = False) -> float:
+    if isinstance(schedule, Schedule):
+        return get_charge_timeline(schedule, courier).get_charge_at_time(time, raise_error=raise_error)
+
     charge = courier.capacity
     last_time = 0
     last_point = courier.init_point
@@ -362,39 +396,11 @@ def get_charge_at_time(schedule: typing.List[ScheduleItem], time: float, courier
             part_of_recording = (time - rec.start_time) / (rec.end_time - rec.start_time)
 
         elif rec.start_time > time: # случай точки времени до записи
-            if last_point == courier.init_point:
-                charge += courier.charge_velocity*(time - last_time)
-                charge = min(charge, courier.capacity)
-            else:
-                charge -= get_consumption_by_time(courier=courier, flight_time=time - last_time)
-            return charge
+            return get_charge_before_record(courier, charge, last_time, last_point, time)
 
         # учёт времени до записи
-        if last_point == courier.init_point:
-            charge += courier.charge_velocity*(rec.start_time - last_time)
-            charge = min(charge, courier.capacity)
-        else:
-            charge -= get_consumption_by_time(courier=courier, flight_time=rec.start_time - last_time)
-        
-        charge_change_in_rec = 0
-        # учёт самой записи
-        if rec.is_move_to_charge:
-            charge_change_in_rec -= get_consumption_by_distance(courier=courier, 
-                                      distance=rec.point_from.get_distance_to_other(rec.point_to))
-        elif rec.rec_type == "Движение за грузом":
-            charge_change_in_rec -= get_consumption_by_distance(courier=courier, 
-                                      distance=rec.point_from.get_distance_to_other(rec.point_to))
-        elif rec.rec_type == "Ожидание":
-            charge_change_in_rec -= get_consumption_by_distance(courier=courier, 
-                                      distance=rec.point_from.get_distance_to_other(rec.point_to))
-        elif rec.rec_type == "Движение с грузом":
-            charge_change_in_rec -= get_consumption_by_distance(courier=courier, 
-                                      distance=rec.point_from.get_distance_to_other(rec.point_to),
-                                      order=rec.order)
-        else:
-            raise ValueError(f"Тип события {rec.rec_type} не распознан")
-        
-        charge += charge_change_in_rec * part_of_recording
+        charge = get_charge_before_record(courier, charge, last_time, last_point, rec.start_time)
+        charge += get_record_charge_change(courier, rec) * part_of_recording
         
         if charge < 0 and raise_error:
             raise ValueError(f"Заряд курьера закончился в {time} секунде")
@@ -406,7 +412,173 @@ def get_charge_at_time(schedule: typing.List[ScheduleItem], time: float, courier
         last_point = rec.point_to
         last_time = rec.end_time
     return charge
-        
+
+
+def get_charge_before_record(courier: CourierEntity, charge: float, last_time: float, last_point: Point,
+                             time: float) -> float:
+    """
+    Заряд в момент time между записями: на базе курьер заряжается, вне ее - расходует заряд
+    :param courier:
+    :param charge: заряд после предыдущей записи
+    :param last_time: время окончания предыдущей записи
+    :param last_point: точка окончания предыдущей записи
+    :param time:
+    :return:
+    """
+    if last_point == courier.init_point:
+        charge += courier.charge_velocity*(time - last_time)
+        charge = min(charge, courier.capacity)
+    else:
+        charge -= get_consumption_by_time(courier=courier, flight_time=time - last_time)
+    return charge
+
+
+def get_record_charge_change(courier: CourierEntity, rec: ScheduleItem) -> float:
+    """
+    Изменение заряда за всю запись расписания
+    :param courier:
+    :param rec:
+    :return:
+    """
+    charge_change_in_rec = 0
+    if rec.is_move_to_charge:
+        charge_change_in_rec -= get_consumption_by_distance(courier=courier, 
+                                  distance=rec.point_from.get_distance_to_other(rec.point_to))
+    elif rec.rec_type == "Движение за грузом":
+        charge_change_in_rec -= get_consumption_by_distance(courier=courier, 
+                                  distance=rec.point_from.get_distance_to_other(rec.point_to))
+    elif rec.rec_type == "Ожидание":
+        charge_change_in_rec -= get_consumption_by_distance(courier=courier, 
+                                  distance=rec.point_from.get_distance_to_other(rec.point_to))
+    elif rec.rec_type == "Движение с грузом":
+        charge_change_in_rec -= get_consumption_by_distance(courier=courier, 
+                                  distance=rec.point_from.get_distance_to_other(rec.point_to),
+                                  order=rec.order)
+    else:
+        raise ValueError(f"Тип события {rec.rec_type} не распознан")
+    return charge_change_in_rec
+
+
+class ChargeTimeline:
+    """
+    Шкала заряда курьера по границам записей расписания.
+    Для каждой записи хранится состояние перед ней: заряд, время и точка окончания предыдущей записи.
+    Шкала достраивается при запросе, а при изменении расписания обрезается
+    до первой измененной записи.
+    """
+    def __init__(self, schedule: Schedule, courier: CourierEntity):
+        self.schedule = schedule
+        self.courier = courier
+        # Состояния перед записями: (заряд, время, точка), последнее - после всех записей
+        self.states = [(courier.capacity, 0, courier.init_point)]
+        # Максимум времени окончания записей с начала расписания - для поиска по времени
+        self.max_end_times = []
+        # Первая запись, после которой заряд ушел в минус
+        self.first_negative = None
+
+    def truncate(self, position: int):
+        """
+        Удаляет состояния, зависящие от записей начиная с position
+        :param position:
+        :return:
+        """
+        del self.states[position + 1:]
+        del self.max_end_times[position:]
+        if self.first_negative is not None and self.first_negative >= position:
+            self.first_negative = None
+
+    def update(self):
+        """
+        Достраивает шкалу до конца расписания
+        :return:
+        """
+        courier = self.courier
+        for position in range(len(self.max_end_times), len(self.schedule)):
+            rec = self.schedule[position]
+            charge, last_time, last_point = self.states[position]
+            charge = get_charge_before_record(courier, charge, last_time, last_point, rec.start_time)
+            charge += get_record_charge_change(courier, rec)
+            if charge < 0 and self.first_negative is None:
+                self.first_negative = position
+            charge = max(charge, 0)
+            self.states.append((charge, rec.end_time, rec.point_to))
+            max_end_time = max(self.max_end_times[-1], rec.end_time) if self.max_end_times else rec.end_time
+            self.max_end_times.append(max_end_time)
+
+    def get_charge_at_time(self, time: float, raise_error: bool = False) -> float:
+        """
+        Заряд на момент времени: двоичный поиск первой незавершенной к этому моменту записи
+        и расчет от сохраненного состояния перед ней
+        :param time:
+        :param raise_error: выбросить ValueError, если заряд к этому моменту уходил в минус
+        :return:
+        """
+        self.update()
+        # Записи до position завершены к моменту time
+        position = bisect.bisect_right(self.max_end_times, time)
+        if raise_error and self.first_negative is not None and self.first_negative < position:
+            raise ValueError(f"Заряд курьера закончился в {time} секунде")
+        return self._get_charge_at_position(position, time, raise_error)
+
+    def get_charges_at_ends(self) -> typing.List[float]:
+        """
+        Заряд на момент окончания каждой записи за один проход: позиция первой незавершенной записи
+        сдвигается вперед вместе со временем, двоичный поиск нужен, только если время окончания
+        уменьшилось (записи пересекаются)
+        :return:
+        """
+        self.update()
+        max_end_times = self.max_end_times
+        count = len(self.schedule)
+        charges = []
+        position = 0
+        for rec in self.schedule:
+            time = rec.end_time
+            if position and max_end_times[position - 1] > time:
+                position = bisect.bisect_right(max_end_times, time)
+            else:
+                while position < count and max_end_times[position] <= time:
+                    position += 1
+            charges.append(self._get_charge_at_position(position, time))
+        return charges
+
+    def _get_charge_at_position(self, position: int, time: float, raise_error: bool = False) -> float:
+        """
+        Заряд на момент time, если записи до position завершены к этому моменту
+        :param position:
+        :param time:
+        :param raise_error:
+        :return:
+        """
+        charge, last_time, last_point = self.states[position]
+        if position == len(self.schedule):
+            return charge
+
+        rec = self.schedule[position]
+        if rec.start_time > time: # случай точки времени до записи
+            return get_charge_before_record(self.courier, charge, last_time, last_point, time)
+
+        # случай точки времени внутри записи
+        part_of_recording = (time - rec.start_time) / (rec.end_time - rec.start_time)
+        charge = get_charge_before_record(self.courier, charge, last_time, last_point, rec.start_time)
+        charge += get_record_charge_change(self.courier, rec) * part_of_recording
+        if charge < 0 and raise_error:
+            raise ValueError(f"Заряд курьера закончился в {time} секунде")
+        return max(charge, 0)
+
+
+def get_charge_timeline(schedule: Schedule, courier: CourierEntity) -> ChargeTimeline:
+    """
+    Возвращает шкалу заряда расписания, создавая ее при первом обращении
+    :param schedule:
+    :param courier:
+    :return:
+    """
+    timeline = schedule.charge_timeline
+    if timeline is None or timeline.courier is not courier:
+        timeline = ChargeTimeline(schedule, courier)
+        schedule.charge_timeline = timeline
+    return timeline
 
 
 def get_point_at_time(self, schedule: typing.List[ScheduleItem], time: float) -> Point:
@@ -421,79 +593,143 @@ def get_point_at_time(self, schedule: typing.List[ScheduleItem], time: float) ->
             previos_point = record.point_to
         return record.point_to # Последняя точка
 
-def auto_add_charge(schedule: typing.List[ScheduleItem], courier: CourierEntity):
+def auto_add_charge(schedule: typing.List[ScheduleItem], courier: CourierEntity,
+                    first_position: int = None, last_position: int = None):
+    """
+    Расставляет движения на зарядку в паузах расписания и в его конце.
+    Если указаны границы измененного участка, пересматриваются только паузы рядом с ним
+    и конец расписания - остальное расписание уже обработано прошлыми вызовами.
+    :param schedule: список записей расписания
+    :param courier:
+    :param first_position: первая измененная позиция
+    :param last_position: последняя измененная позиция
+    :return: список записей, изменение цены
+    """
+    if first_position is None:
+        return _add_charge_full(schedule, courier)
+
+    expected = None
+    if CHARGE_DIFFERENTIAL_CHECK:
+        expected = _add_charge_full(list(schedule), courier)
+    result = _add_charge_near(schedule, courier, first_position, last_position)
+    if expected is not None and (list(result[0]) != expected[0] or result[1] != expected[1]):
+        logging.error(f'{courier} - инкрементальная расстановка зарядок разошлась с полным проходом '
+                      f'на участке {first_position} - {last_position}')
+        schedule[:] = expected[0]
+        return schedule, expected[1]
+    return result
+
+
+def _add_charge_full(schedule: typing.List[ScheduleItem], courier: CourierEntity):
     cost_change = 0
     for i, rec in enumerate(schedule):
         if rec.is_move_to_charge:
             continue
-        if i + 1 >= len(schedule): # для последнего события если он ещё не движение на зарядку
-            point_from = rec.point_to
-            duration = rec.point_to.get_distance_to_other(courier.init_point)/courier.velocity
-            schedule.insert(i + 1,ScheduleItem(
-                                         order=None,
-                                         rec_type="Следование на зарядку", 
-                                         start_time=rec.end_time, 
-                                         end_time=rec.end_time + duration, 
-                                         point_from=point_from, 
-                                         point_to=courier.init_point, 
-                                         cost=courier.rate*duration,
-                                         all_params={},
-                                         creator="auto_add_charge"
-                                         ))
-            cost_change += courier.rate*duration
+        cost_change, is_last = _add_charge_after(schedule, i, courier, cost_change)
+        if is_last:
             break
-        
-        next_index = i + 1
-        if schedule[i + 1].rec_type == "Движение за грузом":
-            next_index = i + 2
-
-        pause = schedule[next_index].start_time - schedule[i].end_time
-        duration_to_init = schedule[i].point_to.get_distance_to_other(courier.init_point)/courier.velocity
-        duration_to_next = courier.init_point.get_distance_to_other(schedule[next_index].point_to)/courier.velocity
-        lost_charge = courier.get_consumption_by_time(duration_to_init+duration_to_next)
-        get_charge = courier.charge_velocity * (pause - duration_to_init - duration_to_next)
-        if get_charge > lost_charge:
-            if not next_index == i + 1:
-                cost_change -= schedule[i + 1].cost
-                schedule.remove(schedule[i + 1]) # удаляем движение за грузом тк добавим своё
-                next_index -= 1
-            schedule.insert(i + 1,ScheduleItem(order=None, 
-                                         rec_type="Следование на зарядку", 
-                                         start_time=schedule[i].end_time, 
-                                         end_time=schedule[i].end_time + duration_to_init,
-                                         point_from=schedule[i].point_to, 
-                                         point_to=courier.init_point, 
-                                         cost=courier.rate*duration_to_init, 
-                                         creator="auto_add_charge",
-                                         all_params={}))
-            next_index += 1
-            
-            schedule.insert(i + 2,ScheduleItem(order=schedule[next_index].order, 
-                                         rec_type="Движение за грузом", 
-                                         start_time=schedule[next_index].start_time - duration_to_next, 
-                                         end_time=schedule[next_index].start_time,
-                                         point_from=courier.init_point, 
-                                         point_to=schedule[next_index].point_to, 
-                                         cost=courier.rate*duration_to_next, 
-                                         creator="auto_add_charge",
-                                         all_params={}))
-            next_index += 1
-
-            cost_change += courier.rate*duration_to_init + courier.rate*duration_to_next
-
-
-
-            
     return schedule, cost_change
 
+
+def _add_charge_near(schedule: typing.List[ScheduleItem], courier: CourierEntity,
+                     first_position: int, last_position: int):
+    """
+    Проход auto_add_charge только по записям, пауза после которых затрагивает измененный участок,
+    и по последней записи
+    """
+    cost_change = 0
+    # Пауза после записи i зависит от записей i + 1 и i + 2
+    i = max(first_position - 2, 0)
+    while i < len(schedule) and i <= last_position:
+        if not schedule[i].is_move_to_charge:
+            length = len(schedule)
+            cost_change, is_last = _add_charge_after(schedule, i, courier, cost_change)
+            if is_last:
+                return schedule, cost_change
+            if len(schedule) != length:
+                # Вставленные записи сдвигают участок и сами требуют проверки пауз
+                last_position = max(last_position + len(schedule) - length, i + 2)
+        i += 1
+    if schedule and not schedule[-1].is_move_to_charge:
+        cost_change, _ = _add_charge_after(schedule, len(schedule) - 1, courier, cost_change)
+    return schedule, cost_change
+
+
+def _add_charge_after(schedule: typing.List[ScheduleItem], i: int, courier: CourierEntity, cost_change: float):
+    """
+    Добавляет движение на зарядку после записи i, если за паузу до следующего заказа
+    курьер успеет зарядиться больше, чем потратит на дорогу к базе и обратно
+    :param schedule:
+    :param i:
+    :param courier:
+    :param cost_change: накопленное изменение цены
+    :return: изменение цены, была ли запись последней
+    """
+    rec = schedule[i]
+    if i + 1 >= len(schedule): # для последнего события если он ещё не движение на зарядку
+        point_from = rec.point_to
+        duration = rec.point_to.get_distance_to_other(courier.init_point)/courier.velocity
+        schedule.insert(i + 1,ScheduleItem(
+                                     order=None,
+                                     rec_type="Следование на зарядку", 
+                                     start_time=rec.end_time, 
+                                     end_time=rec.end_time + duration, 
+                                     point_from=point_from, 
+                                     point_to=courier.init_point, 
+                                     cost=courier.rate*duration,
+                                     all_params={},
+                                     creator="auto_add_charge"
+                                     ))
+        cost_change += courier.rate*duration
+        return cost_change, True
+    
+    next_index = i + 1
+    if schedule[i + 1].rec_type == "Движение за грузом":
+        next_index = i + 2
+
+    pause = schedule[next_index].start_time - schedule[i].end_time
+    duration_to_init = schedule[i].point_to.get_distance_to_other(courier.init_point)/courier.velocity
+    duration_to_next = courier.init_point.get_distance_to_other(schedule[next_index].point_to)/courier.velocity
+    lost_charge = courier.get_consumption_by_time(duration_to_init+duration_to_next)
+    get_charge = courier.charge_velocity * (pause - duration_to_init - duration_to_next)
+    if get_charge > lost_charge:
+        if not next_index == i + 1:
+            cost_change -= schedule[i + 1].cost
+            schedule.remove(schedule[i + 1]) # удаляем движение за грузом тк добавим своё
+            next_index -= 1
+        schedule.insert(i + 1,ScheduleItem(order=None, 
+                                     rec_type="Следование на зарядку", 
+                                     start_time=schedule[i].end_time, 
+                                     end_time=schedule[i].end_time + duration_to_init,
+                                     point_from=schedule[i].point_to, 
+                                     point_to=courier.init_point, 
+                                     cost=courier.rate*duration_to_init, 
+                                     creator="auto_add_charge",
+                                     all_params={}))
+        next_index += 1
+        
+        schedule.insert(i + 2,ScheduleItem(order=schedule[next_index].order, 
+                                     rec_type="Движение за грузом", 
+                                     start_time=schedule[next_index].start_time - duration_to_next, 
+                                     end_time=schedule[next_index].start_time,
+                                     point_from=courier.init_point, 
+                                     point_to=schedule[next_index].point_to, 
+                                     cost=courier.rate*duration_to_next, 
+                                     creator="auto_add_charge",
+                                     all_params={}))
+        next_index += 1
+
+        cost_change += courier.rate*duration_to_init + courier.rate*duration_to_next
+    return cost_change, False
+
 def delete_order(schedule: typing.List[ScheduleItem], order: OrderEntity, courier: CourierEntity):
     """
-    Удаляет заказ из расписания и возвращает новый список записей.
+    Удаляет заказ из расписания и возвращает список записей.
     Если при этом удаляется движение за грузом, то добавляется альтернативное движение на зарядку.
     :param schedule:  список записей расписания
     :param order:     удаляемый заказ
     :param courier:   курьер, для которого производится удаление
-    :return:          новый список записей, изменение цены
+    :return:          список записей, изменение цены
     """
     cost_change = 0
     indexes_to_remove = []
@@ -514,10 +750,33 @@ def delete_order(schedule: typing.List[ScheduleItem], order: OrderEntity, courie
         cost_change -= schedule[index].cost
         del schedule[index]
 
-    # Добавляем альтернативное движение на зарядку, если оно возможно
-    schedule, cc = auto_add_charge(schedule, courier)
+    # Добавляем альтернативное движение на зарядку, если оно возможно.
+    # Пересматриваются только паузы на месте удаленных записей
+    if indexes_to_remove:
+        first_position = min(indexes_to_remove)
+        last_position = max(first_position, max(indexes_to_remove) - len(indexes_to_remove) + 1)
+        schedule, cc = auto_add_charge(schedule, courier, first_position, last_position)
+    else:
+        schedule, cc = auto_add_charge(schedule, courier)
     cost_change += cc
-    return [rec for rec in schedule if rec.order != order], cost_change
+    return schedule, cost_change
+
+def get_record_positions(schedule: typing.List[ScheduleItem], records: typing.List[ScheduleItem]) -> typing.List[int]:
+    """
+    Возвращает позиции записей в расписании. Поиск идет с конца - новые записи обычно там.
+    :param schedule:
+    :param records:
+    :return:
+    """
+    remaining = {id(rec) for rec in records}
+    positions = []
+    for position in range(len(schedule) - 1, -1, -1):
+        if id(schedule[position]) in remaining:
+            remaining.discard(id(schedule[position]))
+            positions.append(position)
+            if not remaining:
+                break
+    return positions
 
 def get_all_records_by_order(schedule, order: OrderEntity):
     return [rec for rec in schedule if rec.order == order]
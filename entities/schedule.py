@@ -0,0 +1,262 @@
+"""
+Контейнер расписания курьера с индексами для быстрых запросов.
+"""
+import bisect
+import typing
+
+# Запас на погрешность вычисления длительностей записей
+EPSILON = 0.000001
+# Тип записи простоя: она не входит во время работы курьера
+IDLE_RECORD_TYPE = 'Ожидание'
+
+
+def get_working_time(record) -> float:
+    """
+    Время работы по записи расписания: длительность всех записей, кроме простоя
+    :param record:
+    :return:
+    """
+    if record.rec_type == IDLE_RECORD_TYPE:
+        return 0
+    return record.end_time - record.start_time
+
+
+class Schedule(list):
+    """
+    Список записей расписания с индексами по времени и по заказам.
+    Индексы строятся при первом запросе после изменения списка, поэтому серия запросов
+    цены между изменениями расписания не просматривает все записи.
+    Записи после добавления в расписание не изменяются.
+    Кроме индексов, расписание хранит производные данные владельца (шкалу заряда курьера),
+    которые сбрасываются начиная с первой измененной записи, и суммарное время работы,
+    которое поддерживается при каждом изменении.
+
+    Изменения можно выполнять в транзакции (begin/commit/rollback): пока транзакция открыта,
+    каждое изменение записывает в журнал обратную операцию, и откат стоит пропорционально
+    числу измененных записей. Транзакции могут быть вложенными.
+    """
+    def __init__(self, records: typing.Iterable = ()):
+        super().__init__(records)
+        self._index = None
+        # Шкала заряда по границам записей, ее заполняет CourierEntity
+        self.charge_timeline = None
+        # Журнал обратных операций и его длины на момент начала открытых транзакций
+        self._undo_log = []
+        self._savepoints = []
+        # Суммарное время работы по всем записям, кроме простоя
+        self.working_time = sum(get_working_time(record) for record in self)
+
+    def __reduce_ex__(self, protocol):
+        # Индексы и журнал не копируются и не сериализуются
+        return self.__class__, (list(self),)
+
+    def begin(self):
+        """
+        Открывает транзакцию
+        :return:
+        """
+        self._savepoints.append(len(self._undo_log))
+
+    def commit(self):
+        """
+        Фиксирует изменения последней открытой транзакции
+        :return:
+        """
+        self._savepoints.pop()
+        if not self._savepoints:
+            self._undo_log.clear()
+
+    def rollback(self):
+        """
+        Отменяет изменения последней открытой транзакции
+        :return:
+        """
+        savepoint = self._savepoints.pop()
+        first_position = len(self)
+        while len(self._undo_log) > savepoint:
+            operation, position, value = self._undo_log.pop()
+            if operation == 'delete':
+                self.working_time -= get_working_time(self[position])
+                super().__delitem__(position)
+            elif operation == 'insert':
+                self.working_time += get_working_time(value)
+                super().insert(position, value)
+            elif operation == 'set':
+                self.working_time += get_working_time(value) - get_working_time(self[position])
+                super().__setitem__(position, value)
+            else:
+                # Восстановление всего списка после сортировки или изменения срезом
+                super().__setitem__(slice(None), value)
+                self.working_time = sum(get_working_time(record) for record in self)
+            first_position = min(first_position, position)
+        self._invalidate(first_position)
+
+    def _log(self, operation: str, position: int, value=None):
+        if self._savepoints:
+            self._undo_log.append((operation, position, value))
+
+    def _invalidate(self, position: int = 0):
+        """
+        Сбрасывает индексы и производные данные начиная с записи position
+        :param position:
+        :return:
+        """
+        self._index = None
+        if self.charge_timeline is not None:
+            self.charge_timeline.truncate(position)
+
+    def _normalize_position(self, index: int) -> int:
+        if index < 0:
+            index += len(self)
+        return min(max(index, 0), len(self))
+
+    def _get_position(self, index: int) -> int:
+        """
+        Позиция существующей записи по индексу, в том числе отрицательному
+        :param index:
+        :return:
+        """
+        if not -len(self) <= index < len(self):
+            raise IndexError('Индекс вне расписания')
+        return index % len(self)
+
+    def _get_index(self):
+        if self._index is None:
+            self._index = _ScheduleIndex(self)
+        return self._index
+
+    def get_overlapping(self, start_time: float, end_time: float) -> typing.List:
+        """
+        Возвращает записи, которые могут пересекаться с интервалом (включая касание границ),
+        в порядке расписания. Точную проверку пересечения выполняет вызывающий.
+        :param start_time:
+        :param end_time:
+        :return:
+        """
+        return self._get_index().get_overlapping(self, start_time, end_time)
+
+    def get_order_records(self, order) -> typing.List:
+        """
+        Возвращает записи заказа в порядке расписания
+        :param order:
+        :return:
+        """
+        return list(self._get_index().records_by_order.get(order, ()))
+
+    def append(self, record):
+        super().append(record)
+        self.working_time += get_working_time(record)
+        self._log('delete', len(self) - 1)
+        self._invalidate(len(self) - 1)
+
+    def extend(self, records):
+        self[len(self):] = records
+
+    def insert(self, index, record):
+        position = self._normalize_position(index)
+        super().insert(position, record)
+        self.working_time += get_working_time(record)
+        self._log('delete', position)
+        self._invalidate(position)
+
+    def remove(self, record):
+        del self[self.index(record)]
+
+    def pop(self, index=-1):
+        record = self[index]
+        del self[index]
+        return record
+
+    def clear(self):
+        del self[:]
+
+    def sort(self, *args, **kwargs):
+        previous = list(self)
+        super().sort(*args, **kwargs)
+        self._replaced(previous)
+
+    def reverse(self):
+        previous = list(self)
+        super().reverse()
+        self._replaced(previous)
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            previous = list(self)
+            super().__setitem__(index, value)
+            self._replaced(previous)
+            return
+        position = self._get_position(index)
+        self._log('set', position, self[position])
+        self.working_time += get_working_time(value) - get_working_time(self[position])
+        super().__setitem__(position, value)
+        self._invalidate(position)
+
+    def __delitem__(self, index):
+        if isinstance(index, slice):
+            previous = list(self)
+            super().__delitem__(index)
+            self._replaced(previous)
+            return
+        position = self._get_position(index)
+        self._log('insert', position, self[position])
+        self.working_time -= get_working_time(self[position])
+        super().__delitem__(position)
+        self._invalidate(position)
+
+    def __iadd__(self, records):
+        self.extend(records)
+        return self
+
+    def _replaced(self, previous: typing.List):
+        """
+        Учитывает замену всего списка: изменения начинаются с первой несовпадающей записи
+        :param previous: записи до изменения
+        :return:
+        """
+        position = next((position for position, (old, new) in enumerate(zip(previous, self)) if old is not new),
+                        min(len(previous), len(self)))
+        if position == len(previous) == len(self):
+            return
+        self.working_time = sum(get_working_time(record) for record in self)
+        self._log('restore', position, previous)
+        self._invalidate(position)
+
+
+class _ScheduleIndex:
+    """
+    Индексы неизменного состояния расписания:
+    записи, упорядоченные по началу, с максимальной длительностью записи
+    (запись, пересекающая интервал, начинается не раньше его начала минус эта длительность),
+    и записи каждого заказа. Индекс заказов строится при первом обращении к нему.
+    """
+    def __init__(self, schedule: typing.List):
+        self.schedule = schedule
+        self.start_times = [rec.start_time for rec in schedule]
+        self.max_duration = max((rec.end_time - rec.start_time for rec in schedule), default=0)
+        self.positions_by_start = None
+        if any(previous > current for previous, current in zip(self.start_times, self.start_times[1:])):
+            # Обычно расписание уже отсортировано по началу, иначе нужна перестановка
+            self.positions_by_start = sorted(range(len(schedule)), key=self.start_times.__getitem__)
+            self.start_times = [self.start_times[position] for position in self.positions_by_start]
+        self._records_by_order = None
+
+    @property
+    def records_by_order(self) -> typing.Dict:
+        if self._records_by_order is None:
+            self._records_by_order = {}
+            for rec in self.schedule:
+                self._records_by_order.setdefault(rec.order, []).append(rec)
+        return self._records_by_order
+
+    def get_overlapping(self, schedule: typing.List, start_time: float, end_time: float) -> typing.List:
+        low = min(start_time, end_time)
+        high = max(start_time, end_time)
+        first = bisect.bisect_left(self.start_times, low - self.max_duration - EPSILON)
+        last = bisect.bisect_right(self.start_times, high)
+        if self.positions_by_start is None:
+            positions = range(first, last)
+        else:
+            positions = sorted(self.positions_by_start[first:last])
+        return [schedule[position] for position in positions
+                if schedule[position].end_time >= low]
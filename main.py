@@ -1,13 +1,19 @@
+import hashlib
 import logging
-import pandas as pd
 import time
-from tqdm.auto import tqdm
 
+from agents.tracing import tracer
 from utils.excel_utils import get_excel_data, save_schedule_to_excel
 from utils.simulator import Simulator
 from utils.script import Script
-from utils.generators import generate_orders, generate_couriers
+from utils.generators import (generate_orders, generate_couriers, generate_order_columns, generate_courier_columns,
+                              order_columns_to_dicts, courier_columns_to_dicts, get_keyed_generator)
 from utils.metrics_calculator import MetricsCalculator
+from utils.sweep import run_sweep
+from utils.result_store import ResultStore, get_parameters_key
+
+# Выгрузить результаты серии в Excel после ее завершения
+EXPORT_TO_EXCEL = True
 
 
 class My_callback:
@@ -23,19 +29,28 @@ def experiment(parameters: dict) -> dict:
     start_time = time.time()
 
     script = Script()
-    order_dicts = generate_orders(num_orders=parameters['num_orders'], 
-                                  urgent_percentage=parameters['urgent_percentage'],
-                                  map_size=parameters["map_size"],
-                                  max_appearance_time=parameters["max_appearance_time"],
-                                  avg_courier_speed=parameters["avg_courier_speed"])
-    courier_dicts = generate_couriers(num_couriers=parameters['num_couriers'],
-                                      map_size=parameters["map_size"],
-                                      velocity_range=parameters["velocity_range"],
-                                      payload_range=parameters["payload_range"],
-                                      battery_capacity=parameters["battery_capacity"],
-                                      battery_load_velocity_A=parameters["battery_load_velocity_A"],
-                                      battery_load_velocity_B=parameters["battery_load_velocity_B"]
-                                      )
+    order_parameters = dict(num_orders=parameters['num_orders'],
+                            urgent_percentage=parameters['urgent_percentage'],
+                            map_size=parameters["map_size"],
+                            max_appearance_time=parameters["max_appearance_time"],
+                            avg_courier_speed=parameters["avg_courier_speed"])
+    courier_parameters = dict(num_couriers=parameters['num_couriers'],
+                              map_size=parameters["map_size"],
+                              velocity_range=parameters["velocity_range"],
+                              payload_range=parameters["payload_range"],
+                              battery_capacity=parameters["battery_capacity"],
+                              battery_load_velocity_A=parameters["battery_load_velocity_A"],
+                              battery_load_velocity_B=parameters["battery_load_velocity_B"])
+    if parameters.get("seed") is not None:
+        # Заказы и курьеры определяются зерном и своими параметрами генерации: они не зависят от процесса,
+        # в котором выполняется эксперимент, и от прочих параметров (среды исполнения, размера тика и т.д.)
+        orders_rng = get_keyed_generator(parameters["seed"], 'orders:' + get_parameters_key(order_parameters))
+        couriers_rng = get_keyed_generator(parameters["seed"], 'couriers:' + get_parameters_key(courier_parameters))
+        order_dicts = order_columns_to_dicts(generate_order_columns(rng=orders_rng, **order_parameters))
+        courier_dicts = courier_columns_to_dicts(generate_courier_columns(rng=couriers_rng, **courier_parameters))
+    else:
+        order_dicts = generate_orders(**order_parameters)
+        courier_dicts = generate_couriers(**courier_parameters)
 
     # Загрузка данных в сценарий
     script.load_orders_from_dicts(order_dicts)
@@ -45,6 +60,10 @@ def experiment(parameters: dict) -> dict:
     simulator = Simulator(script, 
                           tick_size=parameters["tick_size"], 
                           time_stop=parameters["time_stop"], 
+                          event_driven=parameters.get("event_driven", False),
+                          runtime=parameters.get("runtime", "thespian"),
+                          system_base=parameters.get("system_base"),
+                          price_request_candidates=parameters.get("price_request_candidates"),
                         #   callback=cb.callback_print
                           )
     
@@ -53,7 +72,9 @@ def experiment(parameters: dict) -> dict:
 
     # print("\n" + "="*30)
     # print(">>> Расчет итоговых метрик:")
-    simulator.dispatcher.actor_system.shutdown()
+    simulator.dispatcher.shutdown()
+    # Буфер трассировки процесса не должен переживать эксперимент: процесс пула выполняет несколько экспериментов
+    tracer.dump_to_log()
     # Создаем экземпляр калькулятора, передавая ему финальное состояние сцены
     calculator = MetricsCalculator(simulator.scene, simulator.time_stop)
     metrics = calculator.calculate_all_metrics()
@@ -106,6 +127,8 @@ if __name__ == "__main__":
     parameters_ranges = {
         "tick_size": [1],
         "time_stop": [240],
+        "event_driven": [True],
+        "runtime": ["local"],
         "num_orders": [*range(20, 200, 20)],
         "urgent_percentage": [*range(0, 100, 20)],
         "num_couriers": [*range(20, 50, 10)],
@@ -119,6 +142,7 @@ if __name__ == "__main__":
         "battery_load_velocity_B": [0.01],
         "battery_load_velocity_C": [0.3],
         "battery_capacity": [300, 250, 200, 150, 100],
+        "seed": [1],
     }
 
 
@@ -128,7 +152,15 @@ if __name__ == "__main__":
 
     experiment_series_name = time.strftime("%d-%m-%Y_%H-%M-%S", time.localtime()) + "_" + str(experiment_count)
 
-    print(f"Количество экспериментов: {experiment_count}, время запуска: {experiment_series_name}")
+    # Результаты дописываются в хранилище серии сразу после каждого эксперимента.
+    # Имя хранилища зависит только от сетки параметров, поэтому повторный запуск
+    # той же сетки продолжает прерванную серию
+    series_key = hashlib.md5(get_parameters_key(parameters_ranges).encode()).hexdigest()[:12]
+    result_store = ResultStore(f"./experiments_results/series_{series_key}.sqlite")
+    pending_parameters = result_store.filter_not_done(parameters_generator(parameters_ranges))
+
+    print(f"Количество экспериментов: {experiment_count}, осталось выполнить: {len(pending_parameters)}, "
+          f"время запуска: {experiment_series_name}")
 
 
     logging.basicConfig(level=logging.WARNING, 
@@ -140,19 +172,10 @@ if __name__ == "__main__":
                         )
    
 
-    experiments_results = []
-    for i, parameters in enumerate(tqdm(parameters_generator(parameters_ranges), total=experiment_count)):
-        res = experiment(parameters)
-        experiments_results.append({
-            **res,
-            **parameters
-        })
-        # print(res)
-
-        if i % 10 == 9:
-            df = pd.DataFrame(experiments_results)
-            df.to_excel(f"./experiments_results/{experiment_series_name}.xlsx")
-    df = pd.DataFrame(experiments_results)
-    df.to_excel(f"./experiments_results/{experiment_series_name}.xlsx")
-
-    
\ No newline at end of file
+    # Эксперименты независимы и выполняются параллельно, по процессу на ядро
+    for parameters, res in run_sweep(experiment, pending_parameters, max_tasks_per_child=10):
+        result_store.append(parameters, res)
+
+    if EXPORT_TO_EXCEL:
+        result_store.export_to_excel(f"./experiments_results/{experiment_series_name}.xlsx")
+    result_store.close()
@@ -3,11 +3,13 @@ import pandas as pd
 import time
 from tqdm.auto import tqdm
 
+from agents.tracing import tracer
 from utils.excel_utils import get_excel_data, save_schedule_to_excel
 from utils.simulator import Simulator
 from utils.script import Script
 from utils.generators import generate_orders, generate_couriers
 from utils.metrics_calculator import MetricsCalculator
+from utils.scenario_store import load_scenario_dicts
 
 
 class My_callback:
@@ -23,16 +25,20 @@ def experiment(parameters: dict) -> dict:
     start_time = time.time()
 
     script = Script()
-    order_dicts = generate_orders(num_orders=parameters['num_orders'], 
-                                  urgent_percentage=parameters['urgent_percentage'],
-                                  map_size=parameters["map_size"],
-                                  max_appearance_time=parameters["max_appearance_time"],
-                                  avg_courier_speed=parameters["avg_courier_speed"],
-                                  payload_range=parameters["payload_range"])
-    courier_dicts = generate_couriers(num_couriers=parameters['num_couriers'],
+    if parameters.get("scenario_path"):
+        # Готовый сценарий в колоночном формате (utils.scenario_store.save_scenario)
+        order_dicts, courier_dicts = load_scenario_dicts(parameters["scenario_path"])
+    else:
+        order_dicts = generate_orders(num_orders=parameters['num_orders'], 
+                                      urgent_percentage=parameters['urgent_percentage'],
                                       map_size=parameters["map_size"],
-                                      velocity_range=parameters["velocity_range"],
+                                      max_appearance_time=parameters["max_appearance_time"],
+                                      avg_courier_speed=parameters["avg_courier_speed"],
                                       payload_range=parameters["payload_range"])
+        courier_dicts = generate_couriers(num_couriers=parameters['num_couriers'],
+                                          map_size=parameters["map_size"],
+                                          velocity_range=parameters["velocity_range"],
+                                          payload_range=parameters["payload_range"])
 
     # Загрузка данных в сценарий
     script.load_orders_from_dicts(order_dicts)
@@ -50,14 +56,16 @@ def experiment(parameters: dict) -> dict:
 
     # print("\n" + "="*30)
     # print(">>> Расчет итоговых метрик:")
-    simulator.dispatcher.actor_system.shutdown()
+    simulator.dispatcher.shutdown()
+    # События трассировки агентов форматируются и попадают в журнал только здесь
+    tracer.dump_to_log()
     # Создаем экземпляр калькулятора, передавая ему финальное состояние сцены
     calculator = MetricsCalculator(simulator.scene, simulator.time_stop)
     metrics = calculator.calculate_all_metrics()
     del calculator
     # Сохранение результатов
-    all_schedule_records = simulator.get_all_schedule_records()
-    save_schedule_to_excel(all_schedule_records, "res.xlsx")
+    schedule_columns = simulator.get_schedule_columns()
+    save_schedule_to_excel(schedule_columns, "res.xlsx")
 
     metrics["experiment_time"] = time.time() - start_time
     # print(f"Время выполнения симуляции: {metrics['experiment_time']}")
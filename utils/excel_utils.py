@@ -6,6 +6,9 @@ import os
 
 import pandas as pd
 
+from utils.generators import columns_to_dicts
+from utils.scenario_store import get_excel_columns, SCENARIO_CACHE_DIR
+
 
 @dataclass
 class ScheduleItem:
@@ -22,30 +25,44 @@ class ScheduleItem:
 def save_schedule_to_excel(schedule, filename: str, path_to_dir: str = "results"):
     """
     Сохраняет расписание в файл, добавляя к началу названия файла текущее время
-    :param schedule:
+    :param schedule: колонки расписания (имя колонки -> значения) или список записей
     :param filename:
     :return:
     """
-    filename = datetime.datetime.now().strftime("%Y-%m-%d %H-%M-%S") + "_" + filename
+    save_schedule(schedule, filename, path_to_dir)
 
-    schedule_df = pd.DataFrame(schedule)
-    # schedule_df.to_excel(filename)
 
+def save_schedule(schedule, filename: str, path_to_dir: str = "results"):
+    """
+    Сохраняет расписание в файл формата по расширению имени (.csv, иначе Excel),
+    добавляя к началу названия файла текущее время
+    :param schedule: колонки расписания (имя колонки -> значения) или список записей
+    :param filename:
+    :param path_to_dir:
+    :return:
+    """
+    filename = datetime.datetime.now().strftime("%Y-%m-%d %H-%M-%S") + "_" + filename
     path = os.path.join(path_to_dir, filename)
-    schedule_df.to_excel(path)
+
+    schedule_df = pd.DataFrame(schedule)
+    if os.path.splitext(filename)[1].lower() == '.csv':
+        # CSV пишется намного быстрее Excel для больших расписаний
+        schedule_df.to_csv(path, index=False)
+    else:
+        schedule_df.to_excel(path)
 
 
-def get_excel_data(filename, sheet_name) -> typing.List:
+def get_excel_data(filename, sheet_name, cache_dir: typing.Optional[str] = SCENARIO_CACHE_DIR) -> typing.List:
     """
-    Возвращает данные из Excel-файла
+    Возвращает данные из Excel-файла. Лист читается из колоночного кэша, Excel разбирается
+    только при первом обращении к файлу с таким содержимым.
+    Пустые ячейки возвращаются как None
     :param filename:
     :param sheet_name:
+    :param cache_dir: каталог кэша, None - читать Excel без кэша
     :return:
     """
-    df = pd.read_excel(filename, sheet_name=sheet_name)
-    df_index = df.to_dict('index')
-    resulted_list = list(df_index.values())
-    return resulted_list
+    return columns_to_dicts(get_excel_columns(filename, sheet_name, cache_dir=cache_dir))
 
 
 if __name__ == "__main__":
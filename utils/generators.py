@@ -1,7 +1,10 @@
+import hashlib
 import random
 import math
 from typing import List, Dict, Any, Tuple
 
+import numpy as np
+
 
 def rand_or_const(val):
     """
@@ -133,6 +136,180 @@ def generate_couriers(
         couriers.append(courier_dict)
     return couriers
 
+def get_keyed_generator(seed: int, key: str) -> np.random.Generator:
+    """
+    Создает генератор дочернего потока, определяемого строковым ключом (например, ключом параметров
+    эксперимента). Поток не зависит от порядка и числа запусков, поэтому параллельные процессы
+    получают независимые воспроизводимые потоки без общего состояния.
+
+    Args:
+        seed (int): Общее зерно серии.
+        key (str): Ключ потока.
+
+    Returns:
+        np.random.Generator: Генератор дочернего потока.
+    """
+    key_hash = int.from_bytes(hashlib.md5(key.encode()).digest(), 'little')
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(key_hash,)))
+
+def _rand_or_const_column(rng: np.random.Generator, val, size: int) -> np.ndarray:
+    """
+    Колонка случайных чисел из диапазона (с округлением до сотых) или колонка констант.
+    """
+    if isinstance(val, tuple):
+        return np.round(rng.uniform(val[0], val[1], size), 2)
+    return np.full(size, val)
+
+def generate_order_columns(
+    num_orders: int,
+    rng: np.random.Generator,
+    urgent_percentage: float = 20.0,
+    map_size: Tuple[int, int] = (100, 100),
+    max_appearance_time: int = 50,
+    avg_courier_speed: float = 10.0,
+    payload_range: Tuple[float, float] = (10.0, 20.0),
+    waite_response_timeout: float = 5.0
+) -> Dict[str, np.ndarray]:
+    """
+    Генерирует заказы сразу колонками NumPy с теми же параметрами и распределениями, что generate_orders.
+    Имена колонок совпадают с ключами словарей заказов. Колонки только числовые: наименование
+    строится из номера и срочности при преобразовании в словари (order_columns_to_dicts).
+
+    Args:
+        num_orders (int): Количество заказов для генерации.
+        rng (np.random.Generator): Генератор случайных чисел (например, get_keyed_generator или np.random.default_rng(seed)).
+        urgent_percentage (float): Процент срочных заказов (от 0 до 100).
+        map_size (Tuple[int, int]): Размеры карты (ширина, высота) для генерации координат.
+        max_appearance_time (int): Максимальное время появления заказа в симуляции.
+        avg_courier_speed (float): Средняя скорость курьера для расчета реалистичного окна доставки.
+
+    Returns:
+        Dict[str, np.ndarray]: Колонки заказов в перемешанном порядке.
+    """
+    num_urgent = int(num_orders * (urgent_percentage / 100.0))
+    width, height = map_size[0] + 1, map_size[1] + 1
+
+    # Точка доставки выбирается среди остальных узлов сетки: сдвиг номера узла на 1..N-1
+    # по модулю N дает равномерный выбор без повторных попыток
+    cells_count = width * height
+    cell_from = rng.integers(0, cells_count, num_orders)
+    cell_to = (cell_from + rng.integers(1, cells_count, num_orders)) % cells_count
+    x_from, y_from = cell_from // height, cell_from % height
+    x_to, y_to = cell_to // height, cell_to % height
+    min_delivery_duration = np.hypot(x_to - x_from, y_to - y_from) / avg_courier_speed
+
+    appearance_time = rng.uniform(0, max_appearance_time, num_orders)
+    pickup_time = appearance_time + rng.uniform(1, 10, num_orders)
+
+    # Срочными становятся первые num_urgent номеров. Строки уже перемешаны: номер строки - случайная
+    # перестановка, а остальные колонки независимы и одинаково распределены, их переставлять не нужно
+    numbers = rng.permutation(num_orders) + 1
+    is_urgent = numbers <= num_urgent
+    # Срочный заказ: дедлайн очень близко к минимально возможному времени, обычный - с запасом
+    deadline_factor = np.where(is_urgent, rng.uniform(1.1, 1.5, num_orders), rng.uniform(2.0, 4.0, num_orders))
+    delivery_deadline = pickup_time + min_delivery_duration * deadline_factor
+
+    return {
+        'Номер': numbers,
+        'Масса': _rand_or_const_column(rng, payload_range, num_orders),
+        'Объем': np.round(rng.uniform(0.1, 2.0, num_orders), 2),
+        'Стоимость': np.round(rng.uniform(100, 2000, num_orders), 2),
+        'Координата получения x': x_from,
+        'Координата получения y': y_from,
+        'Координата доставки x': x_to,
+        'Координата доставки y': y_to,
+        'Время получения заказа': np.round(pickup_time, 2),
+        'Время доставки заказа': np.round(delivery_deadline, 2),
+        'Срочный заказ': is_urgent,
+        'Время появления': np.round(appearance_time, 2),
+        'Время исчезновения': np.full(num_orders, np.nan),
+        'Время ожидания ответа': np.full(num_orders, round(waite_response_timeout, 2)),
+    }
+
+def generate_courier_columns(
+    num_couriers: int,
+    rng: np.random.Generator,
+    map_size: Tuple[int, int] = (100, 100),
+    velocity_range: Tuple[float, float] = (8.0, 15.0),
+    payload_range: Tuple[float, float] = (10.0, 20.0),
+    battery_load_velocity_A: float = 0.1,
+    battery_load_velocity_B: float = 0.1,
+    battery_load_velocity_C: float = 0.1,
+    battery_capacity = 300,
+) -> Dict[str, np.ndarray]:
+    """
+    Генерирует курьеров сразу колонками NumPy с теми же параметрами и распределениями, что generate_couriers.
+    Имя курьера строится из табельного номера при преобразовании в словари (courier_columns_to_dicts).
+
+    Args:
+        num_couriers (int): Количество курьеров для генерации.
+        rng (np.random.Generator): Генератор случайных чисел.
+        map_size (Tuple[int, int]): Размеры карты (ширина, высота) для генерации начальных координат.
+        velocity_range (Tuple[float, float]): Диапазон скоростей курьеров (min, max).
+        payload_range (Tuple[float, float]): Диапазон грузоподъемности курьеров (min, max).
+
+    Returns:
+        Dict[str, np.ndarray]: Колонки курьеров.
+    """
+    return {
+        'Табельный номер': np.arange(1, num_couriers + 1),
+        'Координата начального положения x': rng.integers(0, map_size[0] + 1, num_couriers),
+        'Координата начального положения y': rng.integers(0, map_size[1] + 1, num_couriers),
+        'Стоимость выхода на работу': np.round(rng.uniform(100, 500, num_couriers), 2),
+        'Цена работы за единицу времени': np.round(rng.uniform(10, 30, num_couriers), 2),
+        'Скорость зарядки': np.round(rng.uniform(1, 5, num_couriers), 2),
+        'Скорость потребления аккумулятора в полёте': _rand_or_const_column(rng, battery_load_velocity_C, num_couriers),
+        'Коэффициент потребления аккумулятора А': _rand_or_const_column(rng, battery_load_velocity_A, num_couriers),
+        'Коэффициент потребления аккумулятора B': _rand_or_const_column(rng, battery_load_velocity_B, num_couriers),
+        'Ёмкость аккумулятора': _rand_or_const_column(rng, battery_capacity, num_couriers),
+        'Время инициализации': np.full(num_couriers, 0.5),
+        'Скорость': np.round(rng.uniform(velocity_range[0], velocity_range[1], num_couriers), 2),
+        'Грузоподъемность': _rand_or_const_column(rng, payload_range, num_couriers),
+        'Время появления': np.zeros(num_couriers),
+        'Время исчезновения': np.full(num_couriers, np.nan),
+        'Минимальный уровень заряда': np.full(num_couriers, 10),
+    }
+
+def columns_to_dicts(columns: Dict[str, np.ndarray]) -> List[Dict[str, Any]]:
+    """
+    Преобразует колонки в список словарей для загрузки в сценарий (Script.load_orders_from_dicts и др.).
+    Значения становятся числами и строками Python, пропуски (NaN) - None.
+
+    Args:
+        columns (Dict[str, np.ndarray]): Колонки одинаковой длины.
+
+    Returns:
+        List[Dict[str, Any]]: Список словарей, по одному на строку.
+    """
+    names = list(columns)
+    values = []
+    for column in columns.values():
+        column_values = column.tolist()
+        if column.dtype.kind == 'f' and np.isnan(column).any():
+            column_values = [None if value != value else value for value in column_values]
+        values.append(column_values)
+    return [dict(zip(names, row)) for row in zip(*values)]
+
+def order_columns_to_dicts(columns: Dict[str, np.ndarray]) -> List[Dict[str, Any]]:
+    """
+    Преобразует колонки заказов в список словарей, как у generate_orders.
+    Если колонки наименований нет, наименование строится из номера и срочности заказа.
+    """
+    orders = columns_to_dicts(columns)
+    for order in orders:
+        order.setdefault('Наименование', f'Заказ-{order["Номер"]}{" (Срочный)" if order["Срочный заказ"] else ""}')
+    return orders
+
+def courier_columns_to_dicts(columns: Dict[str, np.ndarray]) -> List[Dict[str, Any]]:
+    """
+    Преобразует колонки курьеров в список словарей, как у generate_couriers.
+    Если колонки имен нет, имя строится из табельного номера.
+    """
+    couriers = columns_to_dicts(columns)
+    for courier in couriers:
+        courier.setdefault('name', f'Курьер-{courier["Табельный номер"]}')
+    return couriers
+
 # --- Пример использования ---
 if __name__ == "__main__":
     from pprint import pprint
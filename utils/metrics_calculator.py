@@ -6,6 +6,8 @@ from entities.order_entity import OrderEntity
 class MetricsCalculator:
     """
     Класс для расчета и сбора метрик по результатам симуляции.
+    Расписания курьеров обходятся один раз: при обходе строятся индекс доставок заказов
+    и массивы NumPy по курьерам и заказам, из которых затем считаются все метрики.
     """
     def __init__(self, scene: Scene, simulation_end_time: float):
         self.scene = scene
@@ -14,11 +16,51 @@ class MetricsCalculator:
         
         # Собираем все уникальные выполненные заказы из расписаний курьеров
         self.completed_orders: dict[str, OrderEntity] = {}
-        for courier in self.all_couriers:
+        couriers_count = len(self.all_couriers)
+        # Время работы (все, кроме ожидания), доход и число перевозок каждого курьера
+        self.working_times = np.zeros(couriers_count)
+        self.earnings = np.zeros(couriers_count)
+        self.task_counts = np.zeros(couriers_count, dtype=int)
+        self.total_distance = 0.0
+        # Заказ -> номер первого курьера, в расписании которого он есть
+        delivery_couriers: dict[OrderEntity, int] = {}
+        # (номер курьера, заказ) -> окончание последней записи "Движение с грузом"
+        delivery_times: dict[tuple, float] = {}
+
+        for courier_index, courier in enumerate(self.all_couriers):
+            working_time = 0
+            earnings = 0
+            task_count = 0
             for rec in courier.schedule:
-                if rec.order is None: continue
-                if rec.order.name not in self.completed_orders:
-                    self.completed_orders[rec.order.name] = rec.order
+                rec_type = rec.rec_type
+                if rec_type != 'Ожидание':
+                    working_time += (rec.end_time - rec.start_time)
+                earnings += rec.cost
+                # Учитываем только записи, связанные с фактическим перемещением
+                if "Движение" in rec_type:
+                    self.total_distance += rec.point_from.get_distance_to_other(rec.point_to)
+                if rec_type == 'Движение с грузом':
+                    task_count += 1
+                order = rec.order
+                if order is None: continue
+                if order.name not in self.completed_orders:
+                    self.completed_orders[order.name] = order
+                if order not in delivery_couriers:
+                    delivery_couriers[order] = courier_index
+                if rec_type == 'Движение с грузом':
+                    key = (courier_index, order)
+                    delivery_times[key] = max(delivery_times.get(key, rec.end_time), rec.end_time)
+            self.working_times[courier_index] = working_time
+            self.earnings[courier_index] = earnings
+            self.task_counts[courier_index] = task_count
+
+        # Фактическое время доставки берется у первого курьера с заказом в расписании (0 - не доставлен)
+        orders = list(self.completed_orders.values())
+        self.delivery_times = np.array([delivery_times.get((delivery_couriers[order], order), 0.0)
+                                        for order in orders], dtype=float)
+        self.required_delivery_times = np.array([order.time_to for order in orders], dtype=float)
+        self.appearance_times = np.array([order.appearance_time for order in orders], dtype=float)
+        self.urgent_flags = np.array([bool(order.is_urgent) for order in orders], dtype=bool)
 
     def calculate_all_metrics(self, json=False) -> dict:
         """Рассчитывает все метрики и возвращает их в виде словаря."""
@@ -35,8 +77,7 @@ class MetricsCalculator:
         avg_completion_time_urgent = self._calculate_average_completion_time(order_is_urgent=True)
         avg_completion_time_not_urgent = self._calculate_average_completion_time(order_is_urgent=False)
         
-        
-        return {
+        metrics = {
             "Загруженность ресурсов (%)": utilization,
             "Общий пробег": distance,
             "Соблюдение временных окон (%)": on_time,
@@ -49,6 +90,24 @@ class MetricsCalculator:
             "Среднее время выполнения срочных заказов": avg_completion_time_urgent,
             "Среднее время выполнения несрочных заказов": avg_completion_time_not_urgent
         }
+        metrics.update(self._calculate_message_metrics())
+        return metrics
+
+    def _calculate_message_metrics(self) -> dict:
+        """
+        Метрики обработки сообщений по их типам: число, время обработчика и задержка доставки в миллисекундах,
+        а также пиковое число отправленных, но еще не обработанных сообщений
+        """
+        message_stats = self.scene.message_stats
+        metrics = {"Пиковое число необработанных сообщений": message_stats.peak_backlog}
+        for message_type, stats in message_stats.get_by_type().items():
+            name = message_type.value
+            metrics[f"{name}: количество"] = stats.count
+            metrics[f"{name}: среднее время обработки (мс)"] = stats.handler_time.get_mean() * 1000
+            metrics[f"{name}: 95-й перцентиль времени обработки (мс)"] = stats.handler_time.get_quantile(0.95) * 1000
+            metrics[f"{name}: средняя задержка доставки (мс)"] = stats.latency.get_mean() * 1000
+            metrics[f"{name}: 95-й перцентиль задержки доставки (мс)"] = stats.latency.get_quantile(0.95) * 1000
+        return metrics
 
     def _calculate_courier_utilization(self) -> float:
         """
@@ -56,34 +115,16 @@ class MetricsCalculator:
         Загруженность = (Время работы / Общее доступное время) * 100%
         Время работы - это время, потраченное на любую деятельность, кроме "Ожидания".
         """
-        total_utilization = 0
-        
-        for courier in self.all_couriers:
-            # Считаем, что курьер доступен с 0 до конца симуляции
-            # Для более точного расчета можно было бы использовать время появления/исчезновения из сценария
-            total_available_time = self.simulation_end_time
-            if total_available_time == 0: continue
-
-            working_time = 0
-            for record in courier.schedule:
-                if record.rec_type != 'Ожидание':
-                    working_time += (record.end_time - record.start_time)
-            
-            courier_utilization = (working_time / total_available_time) * 100
-            total_utilization += courier_utilization
-            
-        return total_utilization / len(self.all_couriers) if self.all_couriers else 0
+        # Считаем, что курьер доступен с 0 до конца симуляции
+        # Для более точного расчета можно было бы использовать время появления/исчезновения из сценария
+        total_available_time = self.simulation_end_time
+        if not self.all_couriers or total_available_time == 0:
+            return 0
+        return float(np.mean(self.working_times / total_available_time * 100))
 
     def _calculate_total_distance(self) -> float:
         """Расчет общего расстояния, пройденного всеми курьерами."""
-        total_distance = 0
-        for courier in self.all_couriers:
-            for record in courier.schedule:
-                # Учитываем только записи, связанные с фактическим перемещением
-                if "Движение" in record.rec_type:
-                    distance = record.point_from.get_distance_to_other(record.point_to)
-                    total_distance += distance
-        return total_distance
+        return self.total_distance
 
     def _calculate_on_time_performance(self) -> float:
         """
@@ -94,23 +135,8 @@ class MetricsCalculator:
         if not self.completed_orders:
             return 100.0 # Если не было заказов, то 100% выполнено
 
-        on_time_count = 0
-        for order in self.completed_orders.values():
-            required_delivery_time = order.time_to
-            
-            # Находим фактическое время доставки в расписании курьера
-            actual_delivery_time = 0
-            delivery_courier = next((c for c in self.all_couriers if order in [r.order for r in c.schedule]), None)
-            if delivery_courier:
-                # Время доставки - это 'end_time' записи "Движение с грузом"
-                delivery_records = [r for r in delivery_courier.schedule if r.order == order and r.rec_type == 'Движение с грузом']
-                if delivery_records:
-                    actual_delivery_time = max(r.end_time for r in delivery_records)
-
-            if actual_delivery_time > 0 and actual_delivery_time <= required_delivery_time:
-                on_time_count += 1
-                
-        return (on_time_count / len(self.completed_orders)) * 100 if self.completed_orders else 100.0
+        on_time = (self.delivery_times > 0) & (self.delivery_times <= self.required_delivery_times)
+        return float(np.count_nonzero(on_time) / len(self.completed_orders) * 100)
 
     def _calculate_workload_fairness_by_earnings(self) -> float:
         """
@@ -120,13 +146,7 @@ class MetricsCalculator:
         """
         if len(self.all_couriers) < 2:
             return 0.0 # Метрика не имеет смысла для одного курьера
-
-        earnings = []
-        for courier in self.all_couriers:
-            courier_earnings = sum(record.cost for record in courier.schedule)
-            earnings.append(courier_earnings)
-            
-        return float(np.std(earnings))
+        return float(np.std(self.earnings))
     
     def _calculate_workload_fairness_by_time(self) -> float:
         """
@@ -136,16 +156,7 @@ class MetricsCalculator:
         """
         if len(self.all_couriers) < 2:
             return 0.0 # Метрика не имеет смысла для одного курьера
-
-        working_times = []
-        for courier in self.all_couriers:
-            courier_working_time = 0
-            for record in courier.schedule:
-                if record.rec_type != 'Ожидание':
-                    courier_working_time += (record.end_time - record.start_time)
-            working_times.append(courier_working_time)
-            
-        return float(np.std(working_times))
+        return float(np.std(self.working_times))
     
     def _calculate_workload_fairness_by_count_tasks(self) -> float:
         """
@@ -155,18 +166,8 @@ class MetricsCalculator:
         """
         if len(self.all_couriers) < 2:
             return 0.0 # Метрика не имеет смысла для одного курьера
+        return float(np.std(self.task_counts))
 
-        working_counts = []
-        for courier in self.all_couriers:
-            courier_working_count = 0
-            for record in courier.schedule:
-                if record.rec_type == 'Движение с грузом':
-                    courier_working_count += 1
-            working_counts.append(courier_working_count)
-            
-        return float(np.std(working_counts))
-
-    
     def _calculate_average_completion_time(self, order_is_urgent = None) -> float:
         """
         Расчет среднего времени выполнения заказа от его появления до фактической доставки.
@@ -174,28 +175,10 @@ class MetricsCalculator:
         if not self.completed_orders:
             return 0.0
 
-        total_completion_duration = 0
-        delivered_orders_count = 0
-
-        for order in self.completed_orders.values():
-            appearance_time = order.appearance_time
-
-            if not order_is_urgent is None and order.is_urgent != order_is_urgent:
-                continue
-            
-            # Находим фактическое время доставки (логика аналогична on-time performance)
-            actual_delivery_time = 0
-            delivery_courier = next((c for c in self.all_couriers if order in [r.order for r in c.schedule]), None)
-            
-            if delivery_courier:
-                delivery_records = [r for r in delivery_courier.schedule if r.order == order and r.rec_type == 'Движение с грузом']
-                if delivery_records:
-                    actual_delivery_time = max(r.end_time for r in delivery_records)
-
-            # Если заказ был доставлен, учитываем его в расчете
-            if actual_delivery_time > 0:
-                completion_duration = actual_delivery_time - appearance_time
-                total_completion_duration += completion_duration
-                delivered_orders_count += 1
-                
-        return total_completion_duration / delivered_orders_count if delivered_orders_count > 0 else 0.0
\ No newline at end of file
+        # Учитываются только доставленные заказы
+        selected = self.delivery_times > 0
+        if order_is_urgent is not None:
+            selected &= self.urgent_flags == bool(order_is_urgent)
+        if not selected.any():
+            return 0.0
+        return float(np.mean(self.delivery_times[selected] - self.appearance_times[selected]))
@@ -0,0 +1,151 @@
+"""
+Векторный расчет ASAP-вариантов для всех пар курьер × заказ.
+Повторяет CourierAgent._get_asap_variant, но считает всю матрицу одним вызовом NumPy.
+"""
+import typing
+from dataclasses import dataclass
+
+import numpy as np
+
+from entities.courier_entity import CourierEntity
+from entities.order_entity import OrderEntity
+
+
+@dataclass
+class CouriersState:
+    """
+    Состояние курьеров в виде массивов длины n_couriers
+    """
+    last_x: np.ndarray
+    last_y: np.ndarray
+    init_x: np.ndarray
+    init_y: np.ndarray
+    # Время, с которого курьер может начать новый заказ (не раньше текущего момента)
+    start_time: np.ndarray
+    # Заряд на момент start_time
+    start_charge: np.ndarray
+    velocity: np.ndarray
+    rate: np.ndarray
+    max_mass: np.ndarray
+    flight_discharge: np.ndarray
+    load_discharge_A: np.ndarray
+    load_discharge_B: np.ndarray
+    capacity: np.ndarray
+    min_charge: np.ndarray
+    charge_velocity: np.ndarray
+
+
+@dataclass
+class OrdersState:
+    """
+    Параметры заказов в виде массивов длины n_orders
+    """
+    from_x: np.ndarray
+    from_y: np.ndarray
+    to_x: np.ndarray
+    to_y: np.ndarray
+    weight: np.ndarray
+
+
+@dataclass
+class AsapMatrix:
+    """
+    Результат расчета: матрицы n_couriers × n_orders
+    """
+    time_from: np.ndarray
+    time_to: np.ndarray
+    price: np.ndarray
+    # Курьер может выполнить заказ (грузоподъемность и заряд)
+    is_feasible: np.ndarray
+
+
+def get_couriers_state(couriers: typing.List[CourierEntity], current_time: float) -> CouriersState:
+    """
+    Собирает массивы состояния курьеров на момент current_time
+    :param couriers:
+    :param current_time:
+    :return:
+    """
+    last_points = [courier.get_last_point() for courier in couriers]
+    start_times = [max(courier.get_last_time(consider_charge=False), current_time) for courier in couriers]
+    return CouriersState(
+        last_x=np.array([point.x for point in last_points], dtype=float),
+        last_y=np.array([point.y for point in last_points], dtype=float),
+        init_x=np.array([courier.init_point.x for courier in couriers], dtype=float),
+        init_y=np.array([courier.init_point.y for courier in couriers], dtype=float),
+        start_time=np.array(start_times, dtype=float),
+        start_charge=np.array([courier.get_charge_at_time(start_time)
+                               for courier, start_time in zip(couriers, start_times)], dtype=float),
+        velocity=np.array([courier.velocity for courier in couriers], dtype=float),
+        rate=np.array([courier.rate for courier in couriers], dtype=float),
+        max_mass=np.array([courier.max_mass for courier in couriers], dtype=float),
+        flight_discharge=np.array([courier.flight_discharge for courier in couriers], dtype=float),
+        load_discharge_A=np.array([courier.load_discharge_A for courier in couriers], dtype=float),
+        load_discharge_B=np.array([courier.load_discharge_B for courier in couriers], dtype=float),
+        capacity=np.array([courier.capacity for courier in couriers], dtype=float),
+        min_charge=np.array([courier.min_charge for courier in couriers], dtype=float),
+        charge_velocity=np.array([courier.charge_velocity for courier in couriers], dtype=float),
+    )
+
+
+def get_orders_state(orders: typing.List[OrderEntity]) -> OrdersState:
+    """
+    Собирает массивы параметров заказов
+    :param orders:
+    :return:
+    """
+    return OrdersState(
+        from_x=np.array([order.point_from.x for order in orders], dtype=float),
+        from_y=np.array([order.point_from.y for order in orders], dtype=float),
+        to_x=np.array([order.point_to.x for order in orders], dtype=float),
+        to_y=np.array([order.point_to.y for order in orders], dtype=float),
+        weight=np.array([order.weight for order in orders], dtype=float),
+    )
+
+
+def calculate_asap_matrix(couriers: CouriersState, orders: OrdersState) -> AsapMatrix:
+    """
+    Рассчитывает ASAP-вариант для каждой пары курьер × заказ: добавление заказа в конец расписания
+    с заездом на зарядку, если заряда не хватает
+    :param couriers:
+    :param orders:
+    :return:
+    """
+    # Курьеры - строки, заказы - столбцы
+    courier = {name: value[:, np.newaxis] for name, value in vars(couriers).items()}
+    velocity = courier['velocity']
+
+    distance_to_order = np.hypot(orders.from_x - courier['last_x'], orders.from_y - courier['last_y'])
+    distance_with_order = np.hypot(orders.to_x - orders.from_x, orders.to_y - orders.from_y)
+    distance_to_base = np.hypot(courier['init_x'] - orders.to_x, courier['init_y'] - orders.to_y)
+    distance_to_init = np.hypot(courier['init_x'] - courier['last_x'], courier['init_y'] - courier['last_y'])
+
+    duration = distance_to_order / velocity + distance_with_order / velocity
+    time_from = np.broadcast_to(courier['start_time'], duration.shape).copy()
+    price = duration * courier['rate']
+
+    # Расход заряда: без груза - только полет, с грузом - с учетом массы
+    flight_discharge = courier['flight_discharge']
+    load_discharge = (orders.weight * courier['load_discharge_A']) ** 2 + orders.weight * courier['load_discharge_B'] + flight_discharge
+    consumption_total = (distance_to_order / velocity * flight_discharge
+                         + distance_with_order / velocity * load_discharge
+                         + distance_to_base / velocity * flight_discharge)
+
+    is_feasible = (orders.weight <= courier['max_mass']) & (consumption_total < courier['capacity'] - courier['min_charge'])
+
+    # Заряда не хватает - сначала заезд на базу и зарядка
+    need_charge = courier['start_charge'] - consumption_total - courier['min_charge'] < 0
+    time_to_charge = (consumption_total + courier['min_charge'] - courier['start_charge']) / courier['charge_velocity']
+    duration_to_init = distance_to_init / velocity
+    # От базы курьер летит к точке доставки заказа
+    duration_to_next = distance_to_base / velocity
+    need_window = time_to_charge + duration_to_init + duration_to_next
+    price = np.where(need_charge, price + (duration_to_init + duration_to_next) * courier['rate'], price)
+    time_from = np.where(need_charge, time_from + need_window, time_from)
+
+    return AsapMatrix(
+        time_from=time_from,
+        time_to=time_from + duration,
+        price=price,
+        is_feasible=is_feasible,
+    )
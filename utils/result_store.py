@@ -0,0 +1,97 @@
+"""Хранилище результатов серии экспериментов"""
+import json
+import os
+import sqlite3
+import typing
+
+import pandas as pd
+
+
+def get_parameters_key(parameters: dict) -> str:
+    """
+    Ключ эксперимента - кортеж значений параметров в порядке имен параметров
+    :param parameters:
+    :return:
+    """
+    return json.dumps([[name, parameters[name]] for name in sorted(parameters)], ensure_ascii=False)
+
+
+class ResultStore:
+    """
+    Хранилище результатов экспериментов в SQLite.
+    Каждый завершенный эксперимент дописывается одной строкой и сразу фиксируется на диске,
+    поэтому прерванную серию можно продолжить, пропустив уже выполненные эксперименты.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS results ('
+                                'key TEXT PRIMARY KEY, '
+                                'parameters TEXT NOT NULL, '
+                                'metrics TEXT NOT NULL, '
+                                'is_failed INTEGER NOT NULL)')
+        self.connection.commit()
+
+    def get_done_keys(self) -> typing.Set[str]:
+        """
+        Возвращает ключи успешно завершенных экспериментов.
+        Эксперименты, завершившиеся ошибкой, при продолжении серии запускаются повторно.
+        :return:
+        """
+        rows = self.connection.execute('SELECT key FROM results WHERE is_failed = 0')
+        return {key for key, in rows}
+
+    def filter_not_done(self, parameters_list: typing.Iterable[dict]) -> typing.List[dict]:
+        """
+        Оставляет только эксперименты, результатов которых еще нет в хранилище
+        :param parameters_list:
+        :return:
+        """
+        done_keys = self.get_done_keys()
+        return [parameters for parameters in parameters_list
+                if get_parameters_key(parameters) not in done_keys]
+
+    def append(self, parameters: dict, metrics: dict):
+        """
+        Сохраняет результат эксперимента
+        :param parameters:
+        :param metrics:
+        :return:
+        """
+        self.connection.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)',
+                                (get_parameters_key(parameters),
+                                 json.dumps(parameters, ensure_ascii=False),
+                                 json.dumps(metrics, ensure_ascii=False),
+                                 int('error' in metrics)))
+        self.connection.commit()
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+    def get_records(self) -> typing.List[dict]:
+        """
+        Возвращает все результаты в виде словарей метрик и параметров
+        :return:
+        """
+        rows = self.connection.execute('SELECT parameters, metrics FROM results ORDER BY rowid')
+        return [{**json.loads(metrics), **json.loads(parameters)} for parameters, metrics in rows]
+
+    def to_dataframe(self) -> pd.DataFrame:
+        return pd.DataFrame(self.get_records())
+
+    def export_to_excel(self, filename: str):
+        """
+        Выгружает все результаты в Excel-файл
+        :param filename:
+        :return:
+        """
+        df = self.to_dataframe()
+        # Списки (диапазоны параметров) записываются в ячейку строкой
+        for column in df.columns:
+            if df[column].map(lambda value: isinstance(value, list)).any():
+                df[column] = df[column].map(str)
+        df.to_excel(filename)
+
+    def close(self):
+        self.connection.close()
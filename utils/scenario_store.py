@@ -0,0 +1,236 @@
+"""
+Хранение сценариев в колоночном двоичном виде: колонки заказов и курьеров записываются
+в несжатый .npz и при загрузке отображаются в память без чтения файла целиком.
+Excel-файлы сценариев конвертируются один раз и кэшируются по хэшу содержимого.
+"""
+import hashlib
+import logging
+import numbers
+import os
+import struct
+import typing
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+from utils.generators import order_columns_to_dicts, courier_columns_to_dicts
+
+# Каталог кэша сконвертированных Excel-файлов
+SCENARIO_CACHE_DIR = 'scenario_cache'
+# Версия формата входит в ключ кэша: при изменении конвертации старые файлы не используются
+FORMAT_VERSION = 2
+ORDERS_GROUP = 'orders'
+COURIERS_GROUP = 'couriers'
+# Суффикс члена архива с маской пропусков текстовой колонки
+MISSING_SUFFIX = ':missing'
+# Размер фиксированной части локального заголовка zip и смещения длин имени и доп. поля в нем
+_ZIP_LOCAL_HEADER_SIZE = 30
+_ZIP_NAME_LENGTHS_OFFSET = 26
+
+Columns = typing.Dict[str, np.ndarray]
+
+
+def to_storable_column(values) -> typing.Tuple[np.ndarray, typing.Optional[np.ndarray]]:
+    """
+    Приводит колонку к типу, который можно отобразить в память: числа и логические значения
+    остаются как есть, колонка из одних строк становится массивом строк фиксированной длины,
+    а ее пропуски возвращаются отдельной маской
+    :param values:
+    :return: колонка и маска пропусков (None - пропусков нет)
+    :raises ValueError: в колонке смешаны строки, числа и другие значения - сохранить ее без потери типов нельзя
+    """
+    column = np.asarray(values)
+    if column.dtype.kind != 'O':
+        return column, None
+    missing = pd.isna(column)
+    present = column[~missing]
+    if all(isinstance(value, str) for value in present):
+        text = np.array([value if isinstance(value, str) else '' for value in column], dtype=str)
+        return text, missing if missing.any() else None
+    if not missing.any() and all(isinstance(value, (bool, np.bool_)) for value in present):
+        return column.astype(bool), None
+    if all(isinstance(value, numbers.Number) and not isinstance(value, (bool, np.bool_)) for value in present):
+        return pd.to_numeric(column), None
+    types = sorted({type(value).__name__ for value in present})
+    raise ValueError(f'колонка смешанного типа: {", ".join(types)}')
+
+
+def from_stored_column(column: np.ndarray, missing: typing.Optional[np.ndarray]) -> np.ndarray:
+    """
+    Восстанавливает пропуски текстовой колонки: пропущенные значения становятся None
+    :param column:
+    :param missing: маска пропусков, None - пропусков нет
+    :return:
+    """
+    if missing is None:
+        return column
+    restored = np.array(column, dtype=object)
+    restored[np.asarray(missing)] = None
+    return restored
+
+
+def get_dataframe_columns(df: pd.DataFrame) -> Columns:
+    """
+    Возвращает колонки таблицы в том виде, в каком они загружаются из кэша. Колонки смешанного типа
+    остаются массивами объектов, пропуски в них - None
+    :param df:
+    :return:
+    """
+    columns = {}
+    for name in df.columns:
+        values = df[name].to_numpy()
+        try:
+            column = from_stored_column(*to_storable_column(values))
+        except ValueError:
+            column = np.array([None if pd.isna(value) else value for value in values], dtype=object)
+        columns[str(name)] = column
+    return columns
+
+
+def save_columns(path: str, groups: typing.Dict[str, Columns]):
+    """
+    Сохраняет группы колонок в несжатый .npz, колонка группы хранится под именем "группа/колонка",
+    маска пропусков текстовой колонки - под именем "группа/колонка:missing".
+    Файл сначала пишется во временный и затем подменяется, чтобы параллельные запуски
+    не прочитали его недописанным
+    :param path:
+    :param groups: имя группы (orders, couriers) -> колонки
+    :return:
+    :raises ValueError: колонку нельзя сохранить без потери типов, файл не создается
+    """
+    arrays = {}
+    for group, columns in groups.items():
+        for name, values in columns.items():
+            try:
+                column, missing = to_storable_column(values)
+            except ValueError as error:
+                raise ValueError(f'{group}/{name}: {error}') from error
+            arrays[f'{group}/{name}'] = column
+            if missing is not None:
+                arrays[f'{group}/{name}{MISSING_SUFFIX}'] = missing
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'wb') as file:
+        np.savez(file, **arrays)
+    os.replace(temp_path, path)
+
+
+def _map_member(file, path: str, info: zipfile.ZipInfo) -> np.ndarray:
+    """
+    Отображает в память массив .npy, хранящийся в zip без сжатия
+    :param file: открытый файл архива
+    :param path: путь к архиву
+    :param info: описание члена архива
+    :return:
+    """
+    file.seek(info.header_offset + _ZIP_NAME_LENGTHS_OFFSET)
+    name_length, extra_length = struct.unpack('<HH', file.read(4))
+    data_offset = info.header_offset + _ZIP_LOCAL_HEADER_SIZE + name_length + extra_length
+    file.seek(data_offset)
+    version = np.lib.format.read_magic(file)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(file)
+    else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(file)
+    if not np.prod(shape):
+        return np.empty(shape, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', offset=file.tell(), shape=shape,
+                     order='F' if fortran_order else 'C')
+
+
+def load_columns(path: str, mmap: bool = True) -> typing.Dict[str, Columns]:
+    """
+    Загружает группы колонок из .npz, сохраненного save_columns
+    :param path:
+    :param mmap: отобразить колонки в память, иначе прочитать их целиком
+    :return: имя группы -> колонки
+    """
+    groups = {}
+    missing_masks = {}
+    with zipfile.ZipFile(path) as archive, open(path, 'rb') as file:
+        for info in archive.infolist():
+            group, name = info.filename[:-len('.npy')].split('/', 1)
+            if mmap and info.compress_type == zipfile.ZIP_STORED:
+                column = _map_member(file, path, info)
+            else:
+                with archive.open(info) as member:
+                    column = np.lib.format.read_array(member)
+            if name.endswith(MISSING_SUFFIX):
+                missing_masks[group, name[:-len(MISSING_SUFFIX)]] = column
+            else:
+                groups.setdefault(group, {})[name] = column
+    for (group, name), missing in missing_masks.items():
+        groups[group][name] = from_stored_column(groups[group][name], missing)
+    return groups
+
+
+def save_scenario(path: str, orders: Columns, couriers: Columns):
+    """
+    Сохраняет сценарий - колонки заказов и курьеров
+    :param path:
+    :param orders:
+    :param couriers:
+    :return:
+    """
+    save_columns(path, {ORDERS_GROUP: orders, COURIERS_GROUP: couriers})
+
+
+def load_scenario(path: str, mmap: bool = True) -> typing.Tuple[Columns, Columns]:
+    """
+    Загружает сценарий, сохраненный save_scenario
+    :param path:
+    :param mmap: отобразить колонки в память
+    :return: колонки заказов и колонки курьеров
+    """
+    groups = load_columns(path, mmap=mmap)
+    return groups.get(ORDERS_GROUP, {}), groups.get(COURIERS_GROUP, {})
+
+
+def load_scenario_dicts(path: str) -> typing.Tuple[typing.List[dict], typing.List[dict]]:
+    """
+    Загружает сценарий в виде словарей заказов и курьеров для Script.load_orders_from_dicts
+    и Script.load_couriers_from_dicts
+    :param path:
+    :return:
+    """
+    orders, couriers = load_scenario(path)
+    return order_columns_to_dicts(orders), courier_columns_to_dicts(couriers)
+
+
+def get_file_hash(filename: str) -> str:
+    """
+    Возвращает хэш содержимого файла
+    :param filename:
+    :return:
+    """
+    file_hash = hashlib.sha256()
+    with open(filename, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+def get_excel_columns(filename: str, sheet_name: str, cache_dir: typing.Optional[str] = SCENARIO_CACHE_DIR) -> Columns:
+    """
+    Возвращает колонки листа Excel-файла. Лист конвертируется при первом обращении и сохраняется
+    в кэш под хэшем содержимого файла, поэтому повторные запуски на том же файле не читают Excel
+    :param filename:
+    :param sheet_name:
+    :param cache_dir: каталог кэша, None - без кэша
+    :return: имя колонки -> значения, колонки отображены в память из кэша.
+        Лист с колонками смешанного типа не кэшируется и читается из Excel при каждом обращении
+    """
+    if cache_dir is None:
+        return get_dataframe_columns(pd.read_excel(filename, sheet_name=sheet_name))
+
+    key = hashlib.sha256(f'{get_file_hash(filename)}:{sheet_name}:{FORMAT_VERSION}'.encode()).hexdigest()
+    cache_path = os.path.join(cache_dir, f'{key}.npz')
+    if not os.path.exists(cache_path):
+        df = pd.read_excel(filename, sheet_name=sheet_name)
+        os.makedirs(cache_dir, exist_ok=True)
+        try:
+            save_columns(cache_path, {'sheet': {str(name): df[name].to_numpy() for name in df.columns}})
+        except ValueError as error:
+            logging.warning(f'Лист {sheet_name} файла {filename} не кэшируется: {error}')
+            return get_dataframe_columns(df)
+    return load_columns(cache_path).get('sheet', {})
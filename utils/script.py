@@ -1,3 +1,5 @@
+import bisect
+import typing
 from enum import Enum
 
 class ScriptEventType(Enum):
@@ -20,65 +22,115 @@ class ScriptEvent:
 
 
 class Script:
+    """
+    Сценарий симуляции - упорядоченная по времени лента событий.
+    Времена событий хранятся в отдельном списке для бинарного поиска, а курсор
+    запоминает позицию последнего запроса, поэтому при монотонно растущем
+    времени симуляции поиск событий стоит O(log N + k).
+    """
     def __init__(self):
         self.events = []
-        self.events.sort(key=lambda event: event.time)
+        self._times = []
+        self._is_sorted = True
+        # Все события до позиции курсора происходят раньше self._cursor_time
+        self._cursor = 0
+        self._cursor_time = float('-inf')
 
     def add_event(self, event: ScriptEvent, sort=True):
-        self.events.append(event)
-        if sort:
-            self.events.sort(key=lambda event: event.time)
+        """
+        Добавляет событие в сценарий
+        :param event:
+        :param sort: вставить событие на своё место сразу, иначе упорядочивание
+                     откладывается до первого запроса
+        :return:
+        """
+        if sort and self._is_sorted:
+            index = bisect.bisect_right(self._times, event.time)
+            self.events.insert(index, event)
+            self._times.insert(index, event.time)
+        else:
+            self.events.append(event)
+            self._times.append(event.time)
+            self._is_sorted = False
+        self._reset_cursor()
+
+    def add_events(self, events: typing.Iterable[ScriptEvent]):
+        """
+        Пакетно добавляет события с единственной сортировкой в конце
+        :param events:
+        :return:
+        """
+        for event in events:
+            self.add_event(event, sort=False)
 
     def load_orders_from_dicts(self, orders_dicts: list[dict]):
+        events = []
         for order_dict in orders_dicts:
-            self.add_event(ScriptEvent(order_dict.get('Время появления'), 
-                                       event_type=ScriptEventType.NEW_ORDER, 
-                                       properties=order_dict))
+            events.append(ScriptEvent(order_dict.get('Время появления'), 
+                                      event_type=ScriptEventType.NEW_ORDER, 
+                                      properties=order_dict))
             if order_dict.get('Время исчезновения') is not None:
-                self.add_event(ScriptEvent(order_dict.get('Время исчезновения'), 
-                                           event_type=ScriptEventType.REMOVE_ORDER, 
-                                           properties=order_dict))
-                
+                events.append(ScriptEvent(order_dict.get('Время исчезновения'), 
+                                          event_type=ScriptEventType.REMOVE_ORDER, 
+                                          properties=order_dict))
+        self.add_events(events)
 
     def load_couriers_from_dicts(self, couriers_dicts: list[dict]):
+        events = []
         for courier_dict in couriers_dicts:
-            self.add_event(ScriptEvent(courier_dict.get('Время появления'), 
-                                       event_type=ScriptEventType.NEW_COURIER, 
-                                       properties=courier_dict))
+            events.append(ScriptEvent(courier_dict.get('Время появления'), 
+                                      event_type=ScriptEventType.NEW_COURIER, 
+                                      properties=courier_dict))
             if courier_dict.get('Время исчезновения') is not None:
-                self.add_event(ScriptEvent(courier_dict.get('Время исчезновения'), 
-                                           event_type=ScriptEventType.DELETED_COURIER, 
-                                           properties=courier_dict))
+                events.append(ScriptEvent(courier_dict.get('Время исчезновения'), 
+                                          event_type=ScriptEventType.DELETED_COURIER, 
+                                          properties=courier_dict))
+        self.add_events(events)
+
+    def _sort(self):
+        """Упорядочивает события по времени, сохраняя порядок добавления для одинаковых времен"""
+        if self._is_sorted:
+            return
+        self.events.sort(key=lambda event: event.time)
+        self._times = [event.time for event in self.events]
+        self._is_sorted = True
 
+    def _reset_cursor(self):
+        self._cursor = 0
+        self._cursor_time = float('-inf')
 
+    def _find_index(self, time) -> int:
+        """
+        Возвращает индекс первого события с временем не меньше time и сдвигает курсор
+        :param time:
+        :return:
+        """
+        self._sort()
+        lo = self._cursor if time >= self._cursor_time else 0
+        index = bisect.bisect_left(self._times, time, lo=lo)
+        self._cursor = index
+        self._cursor_time = time
+        return index
 
     def get_upcoming_event_time(self, time):
-        for event in self.events:
-            if event.time >= time:
-                return event
+        index = self._find_index(time)
+        if index < len(self.events):
+            return self.events[index]
         return None
     
     def get_upcoming_events(self, time):
         """ Возвращает список событий, которые произойдут в ближайшее время 
         """
-        result = []
-        for event in self.events:
-            if event.time >= time:
-                if len(result) == 0:
-                    result.append(event)
-                else:
-                    if result[-1].time == event.time:
-                        result.append(event)
-                    else:
-                        break
-        return result
+        index = self._find_index(time)
+        if index >= len(self.events):
+            return []
+        end_index = bisect.bisect_right(self._times, self._times[index], lo=index)
+        return self.events[index:end_index]
     
     def get_event_during_interval(self, start_time, end_time):
-        result = []
-        for event in self.events:
-            if start_time <= event.time < end_time:
-                result.append(event)
-        return result
+        start_index = self._find_index(start_time)
+        end_index = bisect.bisect_left(self._times, end_time, lo=start_index)
+        return self.events[start_index:end_index]
     
     def __str__(self):
         return f"(Script, events_count: {len(self.events)})"
\ No newline at end of file
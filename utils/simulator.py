@@ -1,36 +1,57 @@
 import logging
+import math
 
 from agents.agents_dispatcher import AgentsDispatcher
 from agents.scene import Scene
-from entities.courier_entity import CourierEntity
+from agents.tracing import tracer, TraceEvent
+from entities.courier_entity import CourierEntity, SCHEDULE_COLUMNS
 from entities.order_entity import OrderEntity
 from utils.script import Script, ScriptEvent, ScriptEventType
-import time
 
 class Simulator:
     def __init__(self, 
                  script: Script,
                  tick_size: float = 0.5,
                  time_stop: int = 10**3,
-                 callback = None
+                 callback = None,
+                 event_driven: bool = False,
+                 runtime: str = 'thespian',
+                 system_base: str = None,
+                 price_request_candidates: int = None,
+                 kpi_interval: float = None
                  ):
         """Инициализация симуляции
         :param script: Сценарий симуляции
         :param tick_size: Размер шага симуляции
         :param time_stop: Максимальное время симуляции
         :param callback: 
+        :param event_driven: Пропускать тики, на которые ничего не запланировано,
+                             и завершаться, когда событий и переговоров не осталось
+        :param runtime: Среда исполнения агентов: 'thespian', 'local' (в текущем процессе)
+                        или готовый экземпляр AgentRuntime
+        :param system_base: Система акторов thespian, например 'multiprocQueueBase' или 'multiprocTCPBase'
+                            для распределения агентов по процессам
+        :param price_request_candidates: Сколько ближайших курьеров заказ опрашивает сначала.
+                                         Если ни один не может выполнить заказ, круг удваивается.
+                                         None - опрашиваются все курьеры
+        :param kpi_interval: Интервал времени между снимками показателей во временном ряду,
+                             None - снимок на каждом выполненном тике
         """
 
 
         self.script = script # Сценарий симуляции
-        self.scene = Scene() # Сцена
-        self.dispatcher = AgentsDispatcher(self.scene)
+        self.scene = Scene(tick_size=tick_size) # Сцена
+        self.scene.price_request_candidates = price_request_candidates
+        self.dispatcher = AgentsDispatcher(self.scene, runtime=runtime, system_base=system_base)
 
         self.tick_counter = 0
         self.scene.time = 0.0
         self.previous_tick_time = 0
         self.tick_size = tick_size
         self.time_stop = time_stop
+        self.event_driven = event_driven
+        self.kpi_interval = kpi_interval
+        self.last_kpi_sample_time = None
     
         self.callback = callback
 
@@ -38,6 +59,10 @@ class Simulator:
     def run(self):
         """Запускает симуляцию
         """
+        if self.event_driven:
+            self._run_event_driven()
+            return
+
         while True:
             if self.scene.time > self.time_stop:
                 break
@@ -47,6 +72,48 @@ class Simulator:
             self.scene.time += self.tick_size
             self._tick(events)
 
+    def _run_event_driven(self):
+        """Запускает симуляцию, переходя сразу к ближайшему тику, на котором что-то происходит.
+        Сетка времени совпадает с пошаговым режимом, поэтому результаты одинаковы.
+        """
+        while True:
+            ticks_to_skip = self._get_ticks_to_next_event()
+            if ticks_to_skip is None:
+                logging.info(f'Событий и открытых переговоров не осталось, остановка в {self.scene.time}')
+                break
+
+            interval_start = self.scene.time + (ticks_to_skip - 1) * self.tick_size
+            if interval_start > self.time_stop:
+                break
+
+            events = self.script.get_event_during_interval(interval_start, interval_start + self.tick_size)
+
+            self.scene.time = interval_start + self.tick_size
+            self._tick(events)
+
+    def _get_ticks_to_next_event(self):
+        """Возвращает число шагов до ближайшего тика с событием сценария, пробуждением агента
+        или None, если ждать больше нечего
+        """
+        candidates = []
+        event = self.script.get_upcoming_event_time(self.scene.time)
+        if event is not None:
+            candidates.append(math.floor((event.time - self.scene.time) / self.tick_size) + 1)
+
+        if self.scene.has_immediate_wakeups():
+            candidates.append(1)
+
+        wakeup_time = self.scene.get_next_wakeup()
+        if wakeup_time is not None:
+            # Пробуждение обслуживает первый тик строго после wakeup_time
+            candidates.append(max(math.floor((wakeup_time - self.scene.time) / self.tick_size) + 1, 1))
+
+        if candidates:
+            return min(candidates)
+        if self.scene.has_open_negotiations():
+            return 1
+        return None
+
 
     def _tick(self, events: list[ScriptEvent] = []):
         """Шаг симуляции
@@ -54,33 +121,36 @@ class Simulator:
         """
         events_count = len(events)
         for event in events:
-            logging.debug(f'Событие: {event.properties}')
+            if tracer.is_enabled(TraceEvent.SCRIPT_EVENT):
+                tracer.trace(TraceEvent.SCRIPT_EVENT, None, event.event_type,
+                             event.properties.get('name') or event.properties.get('Наименование'))
             if event.event_type == ScriptEventType.NEW_COURIER:
-                logging.debug(f'Создание курьера: {event.properties}')
                 onto_description = {}
                 entity = CourierEntity(onto_description, event.properties, self.scene)
                 self.dispatcher.add_entity(entity)
 
             elif event.event_type == ScriptEventType.NEW_ORDER:
-                logging.debug(f'Создание заказа: {event.properties}')
                 onto_description = {}
                 entity = OrderEntity(onto_description, event.properties, self.scene)
                 self.dispatcher.add_entity(entity)
 
             elif event.event_type == ScriptEventType.REMOVE_ORDER:
-                logging.debug(f'Удаление заказа: {event.properties}')
                 self.dispatcher.remove_entity('ORDER', event.properties.get('name'))
 
             elif event.event_type == ScriptEventType.DELETED_COURIER:
-                logging.debug(f'Удаление курьера: {event.properties}')
                 self.dispatcher.remove_entity('COURIER', event.properties.get('name'))
 
             else:
                 logging.error(f'Непонятное событие: {event}')
 
+            # Следующее событие должно видеть результаты предыдущего, как в синхронной системе акторов
+            self.dispatcher.wait_quiescence()
+
         self._tick_entities()
         self._tick_agents()
-        time.sleep(self.tick_size/100) # FIXME: Тут по идее должно быть ожидание устаканивания событий
+        # Ждем, пока агенты обработают все сообщения этого тика
+        self.dispatcher.wait_quiescence()
+        self._sample_kpi()
 
         if not self.callback is None:
             statistic = self.get_statistic()
@@ -89,11 +159,22 @@ class Simulator:
 
         self.tick_counter += 1
         
+    def _sample_kpi(self):
+        """Добавляет снимок показателей во временной ряд, если с прошлого снимка прошел интервал
+        """
+        if self.kpi_interval is not None and self.last_kpi_sample_time is not None \
+                and self.scene.time - self.last_kpi_sample_time < self.kpi_interval:
+            return
+        self.last_kpi_sample_time = self.scene.time
+        self.scene.kpi.sample(self.scene.time, self.time_stop, len(self.scene.open_negotiations),
+                              self.scene.count_messages)
+
     def _tick_entities(self):
         pass
 
     def _tick_agents(self):
-        self.dispatcher.tik_agents()
+        # Тик получают только агенты, чьи таймеры сработали
+        self.dispatcher.tik_agents(self.scene.pop_wakeups(self.scene.time))
 
     def get_statistic(self):
         """Возвращает статистику симуляции
@@ -105,8 +186,28 @@ class Simulator:
         return {"time": self.scene.time,
                 "tick_counter": self.tick_counter,
                 "tick_size": self.tick_size,
-                "entities_count": len(self.dispatcher.reference_book.agents_entities)}
+                "entities_count": len(self.dispatcher.reference_book)}
     
+    def get_message_stats(self) -> dict:
+        """Возвращает статистику обработки сообщений: по типам сообщений, по классам агентов
+        и пиковое число недоставленных сообщений
+        """
+        return self.scene.message_stats.to_dict()
+
+    def get_kpi_time_series(self) -> dict:
+        """Возвращает временной ряд показателей: имя колонки -> массив NumPy
+        """
+        return self.scene.kpi.series.to_arrays()
+
+    def get_schedule_columns(self) -> dict:
+        """Возвращает расписания всех курьеров в колоночном виде: имя колонки -> список значений.
+        Колонки передаются в pandas.DataFrame или записываются в CSV и Parquet без построчных словарей
+        """
+        columns = {name: [] for name in SCHEDULE_COLUMNS}
+        for courier in self.scene.get_entities_by_type('COURIER'):
+            courier.append_schedule_columns(columns)
+        return columns
+
     def get_all_schedule_records(self):
         all_schedule_records = []
         for courier in self.scene.get_entities_by_type('COURIER'):
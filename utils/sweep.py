@@ -0,0 +1,57 @@
+"""Параллельный запуск серии экспериментов по сетке параметров"""
+import logging
+import multiprocessing
+import typing
+
+from tqdm.auto import tqdm
+
+
+def estimate_experiment_cost(parameters: dict) -> float:
+    """
+    Оценка трудоемкости эксперимента: число переговоров растет как заказы × курьеры
+    :param parameters:
+    :return:
+    """
+    return parameters.get('num_orders', 1) * parameters.get('num_couriers', 1)
+
+
+def _run_experiment(task: typing.Tuple[typing.Callable[[dict], dict], dict]) -> typing.Tuple[dict, dict]:
+    """
+    Выполняет один эксперимент в рабочем процессе.
+    Ошибка одного эксперимента не должна останавливать всю серию.
+    :param task: функция эксперимента и ее параметры
+    :return: параметры и результат эксперимента
+    """
+    experiment, parameters = task
+    try:
+        return parameters, experiment(parameters)
+    except Exception as ex:
+        logging.exception(f'Ошибка в эксперименте с параметрами {parameters}')
+        return parameters, {'error': repr(ex)}
+
+
+def run_sweep(experiment: typing.Callable[[dict], dict],
+              parameters_list: typing.Iterable[dict],
+              processes: int = None,
+              max_tasks_per_child: int = 10,
+              cost_estimator: typing.Callable[[dict], float] = estimate_experiment_cost
+              ) -> typing.Iterator[typing.Tuple[dict, dict]]:
+    """
+    Запускает эксперименты в пуле процессов - по одному эксперименту на процесс за раз.
+    Самые трудоемкие эксперименты запускаются первыми, чтобы в конце серии
+    не ждать одного длинного эксперимента на одном ядре.
+    :param experiment: функция эксперимента уровня модуля (должна сериализоваться pickle)
+    :param parameters_list: параметры экспериментов
+    :param processes: число рабочих процессов, по умолчанию - число ядер
+    :param max_tasks_per_child: после скольких экспериментов рабочий процесс перезапускается,
+                                чтобы утечки памяти не накапливались
+    :param cost_estimator: оценка трудоемкости эксперимента по его параметрам
+    :return: пары (параметры, результат) в порядке завершения
+    """
+    ordered_parameters = sorted(parameters_list, key=cost_estimator, reverse=True)
+    tasks = [(experiment, parameters) for parameters in ordered_parameters]
+
+    with multiprocessing.Pool(processes=processes, maxtasksperchild=max_tasks_per_child) as pool:
+        results = pool.imap_unordered(_run_experiment, tasks, chunksize=1)
+        for parameters, result in tqdm(results, total=len(tasks), smoothing=0):
+            yield parameters, result